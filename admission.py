@@ -0,0 +1,34 @@
+import threading
+
+from flask import Response, g, request
+
+from metrics import solve_metrics
+
+
+# Requests of Dash callbacks; page loads, assets and /metrics are always served
+CALLBACK_PATH = '/_dash-update-component'
+
+
+def register_admission(server, max_requests):
+    """ Answer 429 Too Many Requests to callbacks beyond max_requests running at once in this process.
+
+    With more server threads than max_requests, slow callbacks can not take all threads, so
+    pages and metrics stay served and clients back off instead of queueing.
+    """
+
+    slots = threading.BoundedSemaphore(max_requests)
+
+    @server.before_request
+    def admit():
+        if request.path != CALLBACK_PATH:
+            return None
+        if not slots.acquire(blocking=False):
+            solve_metrics().observe_rejected('overload')
+            return Response('Too many requests, try again in a moment.', status=429, headers={ 'Retry-After': '1' })
+        g.admitted = True
+        return None
+
+    @server.teardown_request
+    def release(_error):
+        if g.pop('admitted', False):
+            slots.release()
@@ -0,0 +1,59 @@
+import argparse
+import time
+
+import pyomo.environ as pyo
+import pyomo.gdp as gdp
+from dotenv import load_dotenv
+
+import input
+import uc_model
+from benchmarks.synthetic import synthetic_units, synthetic_profiles
+
+
+def model_size(model):
+
+    variables = list(model.component_data_objects(pyo.Var, active=True, descend_into=( pyo.Block, gdp.Disjunct )))
+
+    return {
+        'variables': len(variables),
+        'binaries': sum( 1 for var in variables if var.is_binary() ),
+        'constraints': sum( 1 for _ in model.component_data_objects(pyo.Constraint, active=True) ),
+    }
+
+
+def compare(units, profiles, solve=True):
+    """ Build (and solve) the same fleet once per battery formulation. """
+
+    rows = []
+    for formulation in uc_model.BATTERY_FORMULATIONS:
+        start = time.perf_counter()
+        model = uc_model.build_model(units, profiles, formulation)
+        row = { 'formulation': formulation, 'build_s': round(time.perf_counter() - start, 2), **model_size(model) }
+
+        if solve:
+            start = time.perf_counter()
+            solved = uc_model.solve_model(model)
+            row['solve_s'] = round(time.perf_counter() - start, 2)
+            row['system_costs'] = round(pyo.value(model.system_costs), 2) if solved else None
+
+        rows.append(row)
+
+    return rows
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Compare battery exclusivity formulations of uc_model.')
+    parser.add_argument('--units', type=int, default=120, help='synthetic fleet size')
+    parser.add_argument('--batteries', type=int, default=0, help='batteries added on top of the fleet')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--no-solve', action='store_true', help='only build the models')
+    args = parser.parse_args()
+
+    load_dotenv()
+    units = synthetic_units(args.units)
+    for i in range(args.batteries):
+        units[f'Battery extra #{i}'] = dict(input.units['Battery 1'])
+
+    for row in compare(units, synthetic_profiles(args.hours), solve=not args.no_solve):
+        print(row)
@@ -0,0 +1,38 @@
+import argparse
+import time
+
+import uc_model
+from benchmarks.synthetic import synthetic_units, synthetic_profiles
+
+
+def time_build(n_units, n_hours, seed=0, exclude=()):
+
+    units = synthetic_units(n_units, seed)
+    units = { key: val for key, val in units.items() if val['type'] not in exclude }
+    profiles = synthetic_profiles(n_hours, seed)
+
+    start = time.perf_counter()
+    model = uc_model.build_model(units, profiles)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'units': len(units),
+        'hours': n_hours,
+        'variables': model.nvariables(),
+        'constraints': model.nconstraints(),
+        'build_s': round(elapsed, 2),
+        'phases': { phase: round(seconds, 2) for phase, seconds in model.timings.items() },
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time uc_model construction on a synthetic fleet.')
+    parser.add_argument('--units', type=int, nargs='+', default=[12, 120, 1020])
+    parser.add_argument('--hours', type=int, nargs='+', default=[24, 168])
+    parser.add_argument('--exclude', nargs='*', default=[], help='unit types left out of the fleet')
+    args = parser.parse_args()
+
+    for n_units in args.units:
+        for n_hours in args.hours:
+            print(time_build(n_units, n_hours, exclude=args.exclude))
@@ -0,0 +1,157 @@
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import uc_model
+from benchmarks.synthetic import synthetic_units, synthetic_fleet, synthetic_profiles
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Slower than baseline by more than this factor (and by over 50 ms) counts as a regression
+TOLERANCE = 1.25
+
+
+def peak_memory_mb():
+    """ Peak resident memory of this process and of its solver subprocesses so far. """
+
+    if resource is None:
+        return None, None
+
+    # ru_maxrss is in kB on Linux, in bytes on macOS
+    unit = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+
+    return round(own, 1), round(children, 1)
+
+
+def run_case(units, n_hours, seed=0, solve=True, formulation=None):
+    """ Build, write and (optionally) solve one synthetic case; seconds per phase and peak memory. """
+
+    load_dotenv()
+    profiles = synthetic_profiles(n_hours, seed)
+
+    start = time.perf_counter()
+    model = uc_model.build_model(units, profiles, formulation)
+    build = time.perf_counter() - start
+
+    # The LP file shell solvers write first, timed on its own
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        model.write(os.path.join(directory, 'model.lp'), io_options={ 'symbolic_solver_labels': False })
+        write = time.perf_counter() - start
+
+    if solve and not uc_model.solve_model(model):
+        raise RuntimeError('Benchmark case has no solution.')
+
+    own, children = peak_memory_mb()
+
+    return {
+        'units': len(units),
+        'hours': n_hours,
+        'formulation': model.formulation,
+        'variables': model.nvariables(),
+        'constraints': model.nconstraints(),
+        'phases': {
+            **{ phase: round(seconds, 3) for phase, seconds in model.timings.items() },
+            'build': round(build, 3),
+            'write': round(write, 3),
+        },
+        'peak_mb': own,
+        'solver_peak_mb': children if solve else None,
+    }
+
+
+def measure(units, n_hours, seed=0, solve=True, formulation=None):
+    """ run_case in a fresh process, so peak memory belongs to this case only. """
+
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, ( units, n_hours, seed, solve, formulation ))
+
+
+def median_run(rows):
+    """ One row of repeated runs of a case: the median seconds of each phase, the largest peak memory. """
+
+    row = dict(rows[0])
+    row['phases'] = { phase: round(statistics.median([ run['phases'][phase] for run in rows ]), 3) for phase in row['phases'] }
+    for key in [ 'peak_mb', 'solver_peak_mb' ]:
+        peaks = [ run[key] for run in rows if run[key] is not None ]
+        row[key] = max(peaks) if peaks else None
+
+    return row
+
+
+def case_key(row):
+
+    return f"{row['units']}x{row['hours']}/{row['formulation']}"
+
+
+def regressions(rows, baseline, tolerance=TOLERANCE):
+    """ Phases of rows slower than in the baseline rows of the same case. """
+
+    previous = { case_key(row): row for row in baseline }
+
+    found = []
+    for row in rows:
+        before = previous.get(case_key(row))
+        if before is None:
+            continue
+        for phase, seconds in row['phases'].items():
+            old = before['phases'].get(phase)
+            if old is not None and seconds > old * tolerance and seconds - old > 0.05:
+                found.append({ 'case': case_key(row), 'phase': phase, 'baseline_s': old, 'seconds': seconds })
+
+    return found
+
+
+def parse_fleet(items):
+
+    return { unit_type: int(count) for unit_type, count in ( item.split('=') for item in items ) }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Time uc_model phases and peak memory over fleet sizes and horizons.')
+    parser.add_argument('--units', type=int, nargs='+', default=[12, 120, 1020], help='synthetic fleet sizes')
+    parser.add_argument('--fleet', nargs='+', help='one fleet by type instead, e.g. coal=100 gas=50 battery=10 wind=20 pv=20')
+    parser.add_argument('--hours', type=int, nargs='+', default=[24, 168])
+    parser.add_argument('--formulation', choices=uc_model.BATTERY_FORMULATIONS)
+    parser.add_argument('--no-solve', action='store_true', help='only build and write the models')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON file')
+    parser.add_argument('--repeats', type=int, default=3, help='runs of each case, each phase keeps its median')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args()
+
+    fleets = [ synthetic_fleet(parse_fleet(args.fleet)) ] if args.fleet else [ synthetic_units(n) for n in args.units ]
+
+    rows = []
+    for units in fleets:
+        for n_hours in args.hours:
+            # Single runs of small phases vary by a third on a busy machine, more than TOLERANCE allows
+            rows.append(median_run([ measure(units, n_hours, solve=not args.no_solve, formulation=args.formulation) for _ in range(args.repeats) ]))
+            print(json.dumps(rows[-1]))
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump(rows, file, indent=2)
+
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            found = regressions(rows, json.load(file))
+        for regression in found:
+            print(f"Regression in {regression['case']} {regression['phase']}: {regression['baseline_s']} s -> {regression['seconds']} s")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,62 @@
+import argparse
+import time
+
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+import input
+import uc_model
+from benchmarks.synthetic import synthetic_profiles
+
+
+def available(backend):
+
+    if backend == 'highs':
+        from pyomo.contrib.appsi.solvers import Highs
+        return bool(Highs().available())
+
+    return pyo.SolverFactory(backend).available(exception_flag=False)
+
+
+def repeat_solves(backend, units, profiles, repeat=10, persistent=True):
+    """ Solve one small model repeatedly, changing a variable cost in between as an edit would. """
+
+    model = uc_model.build_model(units, profiles)
+    plant = next(iter(model.plants))
+    vc = pyo.value(model.plant_vc[plant])
+
+    totals = {}
+    for i in range(repeat):
+        model.plant_vc[plant] = vc * ( 1 + 0.01 * ( i % 2 ) )
+        if not persistent:
+            model.solver = None
+        model.timings = {}
+
+        start = time.perf_counter()
+        uc_model.solve_model(model, backend=backend)
+        totals['total'] = totals.get('total', 0) + time.perf_counter() - start
+        for phase, seconds in model.timings.items():
+            totals[phase] = totals.get(phase, 0) + seconds
+
+    return { phase: round(seconds / repeat * 1000, 1) for phase, seconds in totals.items() }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Per solve time (ms) of solver backends on a small model solved many times.')
+    parser.add_argument('--hours', type=int, default=4, help='hours of the input fleet model')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--backends', nargs='+', default=uc_model.SOLVER_BACKENDS)
+    args = parser.parse_args()
+
+    load_dotenv()
+    profiles = synthetic_profiles(args.hours)
+
+    for backend in args.backends:
+        if not available(backend):
+            print(f'{backend}: not available')
+            continue
+
+        print(backend, repeat_solves(backend, input.units, profiles, args.repeat))
+        if backend == 'highs':
+            print('highs, loaded again each solve', repeat_solves(backend, input.units, profiles, args.repeat, persistent=False))
@@ -0,0 +1,83 @@
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_profile(module='index'):
+    """ Seconds to import module in a fresh interpreter, and seconds spent per top-level package.
+
+    Parsed from python -X importtime: per package the self time of all its modules is summed.
+    """
+
+    result = subprocess.run(
+        [ sys.executable, '-X', 'importtime', '-c', f'import {module}' ],
+        cwd=ROOT, capture_output=True, text=True, env={ **os.environ, 'PYTHONPATH': ROOT },
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages, total = {}, 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1e6
+        if name.strip() == module:
+            total = int(cumulative) / 1e6
+
+    return total, dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+
+def readiness(port=8080, timeout=60):
+    """ Seconds from starting index.py until the dashboard page is served. """
+
+    env = { **os.environ, 'PYTHONPATH': ROOT, 'PORT': str(port) }
+    start = time.perf_counter()
+    process = subprocess.Popen([ sys.executable, 'index.py' ], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                socket.create_connection(( '127.0.0.1', port ), timeout=1).close()
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/dashboard', timeout=timeout).read()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError(f'Server not ready within {timeout} s.')
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Import time per package and time to first page of the Dash server.')
+    parser.add_argument('--module', default='index', help='module whose import is profiled')
+    parser.add_argument('--top', type=int, default=10, help='packages listed')
+    parser.add_argument('--ready', action='store_true', help='also start index.py and time the first page')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--budget', type=float, help='exit 1 if importing the module takes longer, in seconds')
+    args = parser.parse_args()
+
+    total, packages = import_profile(args.module)
+    print(f'import {args.module}: {total:.3f} s')
+    for package, seconds in list(packages.items())[:args.top]:
+        print(f'  {package:<30} {seconds:.3f} s')
+    for heavy in [ 'pyomo', 'highspy', 'pandas' ]:
+        if heavy in packages:
+            print(f'  note: {heavy} is imported at startup')
+
+    if args.ready:
+        print(f'first page served after: {readiness(args.port):.3f} s')
+
+    if args.budget is not None and total > args.budget:
+        print(f'Import of {args.module} is over the budget of {args.budget} s')
+        sys.exit(1)
@@ -0,0 +1,76 @@
+import numpy as np
+
+import input
+
+
+def jittered(template, rng):
+    """ Copy of a unit with power, vc and location moved randomly by about 10 %. """
+
+    scale = rng.uniform(0.9, 1.1)
+
+    return {
+        **template,
+        'vc': round(template['vc'] * rng.uniform(0.9, 1.1), 3),
+        'power': round(template['power'] * scale, 1),
+        'ramp': round(template['ramp'] * scale, 1),
+        'lat': round(template['lat'] + rng.uniform(-0.5, 0.5), 2),
+        'lon': round(template['lon'] + rng.uniform(-0.5, 0.5), 2),
+    }
+
+
+def synthetic_units(n, seed=0):
+    """ Fleet of n units cycling through input.units, with jittered power, vc and location. """
+
+    rng = np.random.default_rng(seed)
+    templates = list(input.units.items())
+
+    units = {}
+    for i in range(n):
+        name, template = templates[i % len(templates)]
+        units[f'{name} #{i // len(templates)}'] = jittered(template, rng)
+
+    return units
+
+
+def synthetic_profiles(hours, seed=0):
+    """ Profiles of given length made of noisy copies of the daily input.profiles. """
+
+    rng = np.random.default_rng(seed)
+
+    profiles = {}
+    for key, day in input.profiles.items():
+        days = -(-hours // len(day))
+        values = np.tile(day, days)[:hours] * rng.uniform(0.95, 1.05, size=hours)
+        upper = None if key == 'demand' else 1
+        profiles[key] = np.clip(values, 0, upper).round(3).tolist()
+
+    return profiles
+
+
+def synthetic_fleet(counts, seed=0):
+    """ Fleet with given number of units per type, e.g. { 'coal': 100, 'battery': 10 }.
+
+    Units are jittered copies of input.units of the same type. Unless counted explicitly,
+    demand sources are added so demand keeps the input ratio to firm capacity.
+    """
+
+    rng = np.random.default_rng(seed)
+    templates = {}
+    for name, unit in input.units.items():
+        templates.setdefault(unit['type'], []).append(( name, unit ))
+
+    units = {}
+    for unit_type, count in counts.items():
+        for i in range(count):
+            name, template = templates[unit_type][i % len(templates[unit_type])]
+            units[f'{name} #{i // len(templates[unit_type])}'] = jittered(template, rng)
+
+    if 'demand' not in counts:
+        def firm(fleet):
+            return sum( unit['power'] for unit in fleet.values() if unit['type'] in [ 'coal', 'gas', 'nuclear', 'battery' ] )
+
+        demand = sum( unit['power'] for unit in input.units.values() if unit['type'] == 'demand' ) * firm(units) / firm(input.units)
+        for name, template in templates['demand']:
+            units[name] = { **template, 'power': round(demand / len(templates['demand']), 1) }
+
+    return units
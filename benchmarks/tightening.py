@@ -0,0 +1,56 @@
+import argparse
+import time
+
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+import input
+import uc_model
+from benchmarks.synthetic import synthetic_units, synthetic_profiles
+from decomposition import relaxed
+
+
+def fixed_commitments(model):
+    """ Commitment variables fixed by their inferred bounds. """
+
+    return sum( 1 for var in model.on.values() if var.lb == var.ub )
+
+
+def compare(units, profiles, formulation=None, backend=None, limits=None):
+    """ LP relaxation, MIP and branch and bound nodes of the same fleet without and with tightening. """
+
+    rows = []
+    for tighten in [ False, True ]:
+        model = uc_model.build_model(units, profiles, formulation, tighten=tighten)
+        row = { 'tighten': tighten, **{ key: value for key, value in uc_model.model_stats(model).items() if key in [ 'variables', 'constraints' ] }, 'fixed': fixed_commitments(model) }
+
+        with relaxed(model):
+            lp = uc_model.solve_model(model, backend=backend)
+        row['lp'] = round(pyo.value(model.system_costs), 2) if lp else None
+
+        start = time.perf_counter()
+        solved = uc_model.solve_model(model, backend=backend, limits=limits)
+        row['solve_s'] = round(time.perf_counter() - start, 2)
+        if solved:
+            mip = pyo.value(model.system_costs)
+            row.update(mip=round(mip, 2), gap=model.gap, nodes=model.nodes)
+            # Share of the MIP objective the LP relaxation misses
+            row['relaxation_gap'] = None if lp is False else round(( mip - row['lp'] ) / mip, 5)
+
+        rows.append(row)
+
+    return rows
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Relaxation gap and branch and bound nodes of uc_model without and with tightening.')
+    parser.add_argument('--units', type=int, default=0, help='synthetic fleet size; the input fleet by default')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--time-limit', type=float, help='seconds, for each MIP solve')
+    args = parser.parse_args()
+
+    load_dotenv()
+    units = synthetic_units(args.units) if args.units else input.units
+    for row in compare(units, synthetic_profiles(args.hours), limits={ 'time_limit': args.time_limit }):
+        print(row)
@@ -0,0 +1,63 @@
+import numpy as np
+
+import input
+
+
+# Polylines drawn as the border layer of the map, [ [lon, lat], ... ] each
+BOUNDARIES = { 'texas': input.texas_boundaries }
+
+# Simplification levels in degrees, coarse to full resolution
+BORDER_TOLERANCES = [ 0.1, 0.03, 0.01, 0 ]
+
+
+def simplify(points, tolerance):
+    """ Douglas-Peucker simplification: points of a polyline, without those closer than tolerance to it. """
+
+    points = np.asarray(points, dtype=float)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[ 0, -1 ]] = True
+
+    segments = [ ( 0, len(points) - 1 ) ]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+
+        start, inner = points[first], points[first + 1:last]
+        direction = points[last] - start
+        length = np.hypot(*direction)
+        if length == 0:
+            # Closed ring: distance to its first point
+            distance = np.hypot(*( inner - start ).T)
+        else:
+            distance = np.abs(direction[0] * ( inner[:, 1] - start[1] ) - direction[1] * ( inner[:, 0] - start[0] )) / length
+
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            middle = first + 1 + farthest
+            keep[middle] = True
+            segments += [ ( first, middle ), ( middle, last ) ]
+
+    return points[keep]
+
+
+def border_arrays(boundaries, tolerance):
+    """ All boundaries as one lon and one lat list, separated by None, so they are drawn as a single trace. """
+
+    lon, lat = [], []
+    for points in boundaries.values():
+        simplified = simplify(points, tolerance)
+        lon += [ *simplified[:, 0].tolist(), None ]
+        lat += [ *simplified[:, 1].tolist(), None ]
+
+    return { 'lon': lon[:-1], 'lat': lat[:-1] }
+
+
+# Computed once at startup; figures only pick a level
+BORDER_LEVELS = { tolerance: border_arrays(BOUNDARIES, tolerance) for tolerance in BORDER_TOLERANCES }
+
+
+def border_tolerance(degrees_per_pixel):
+    """ Coarsest level still finer than a pixel of the map at its current zoom. """
+
+    return next( tolerance for tolerance in BORDER_TOLERANCES if tolerance <= degrees_per_pixel )
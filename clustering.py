@@ -0,0 +1,118 @@
+import argparse
+import os
+import time
+
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+from uc_model import PLANT_TYPES, uc_model
+
+
+# Attributes members of a cluster share, up to the tolerance
+CLUSTER_ATTRIBUTES = { **{ plant_type: ['vc', 'power', 'ramp'] for plant_type in PLANT_TYPES }, 'battery': ['vc', 'power'] }
+
+
+def cluster_tolerance(tolerance=None):
+    """ Tolerance given, else CLUSTER_TOLERANCE env var; None means units are not clustered. """
+
+    if tolerance is None and os.environ.get('CLUSTER_TOLERANCE'):
+        tolerance = float(os.environ['CLUSTER_TOLERANCE'])
+
+    return tolerance
+
+
+def similar(unit, other, tolerance):
+
+    return unit['type'] == other['type'] and all( abs(unit[key] - other[key]) <= tolerance * abs(other[key]) for key in CLUSTER_ATTRIBUTES[unit['type']] )
+
+
+def merge(names, units):
+    """ One unit for members of a cluster: a plant of `count` average machines, or a battery of their summed power. """
+
+    members = sorted(names, key=lambda name: units[name]['vc'])
+    power = sum( units[name]['power'] for name in members )
+    first = units[members[0]]
+
+    cluster = {
+        **first,
+        'vc': round(sum( units[name]['vc'] * units[name]['power'] for name in members ) / power, 6),
+        'power': power,
+        # In merit order, so the cheapest members run first when the results are split
+        'members': { name: { key: units[name][key] for key in CLUSTER_ATTRIBUTES[first['type']] } for name in members },
+    }
+    if first['type'] in PLANT_TYPES:
+        cluster.update(power=round(power / len(members), 6), ramp=round(sum( units[name]['ramp'] for name in members ) / len(members), 6), count=len(members))
+
+    return cluster
+
+
+def cluster_units(units, tolerance=0):
+    """ Units with plants and batteries of the same type and vc, power and ramp merged into clusters.
+
+    Attributes are similar within a relative tolerance of the first unit of a cluster; 0 merges
+    identical units only. A plant cluster commits an integer number of its machines instead
+    of a binary for each, so the model has fewer variables and no symmetric solutions to
+    branch on. Single units are kept as they are.
+    """
+
+    groups = []
+    for name in sorted(units, key=lambda name: units[name]['vc']):
+        unit = units[name]
+        if unit['type'] not in CLUSTER_ATTRIBUTES:
+            continue
+        group = next(( group for group in groups if similar(unit, units[group[0]], tolerance) ), None)
+        if group is None:
+            groups.append([ name ])
+        else:
+            group.append(name)
+
+    clustered = { name: unit for name, unit in units.items() if unit['type'] not in CLUSTER_ATTRIBUTES }
+    for group in groups:
+        if len(group) == 1:
+            clustered[group[0]] = units[group[0]]
+        else:
+            clustered[f'{group[0]} +{len(group) - 1}'] = merge(group, units)
+
+    return clustered
+
+
+def expand_clusters(clustered, units, names):
+    """ Clustered units with the clusters of names replaced by their members, as they are in units. """
+
+    expanded = { name: unit for name, unit in clustered.items() if name not in names }
+    for name in names:
+        expanded.update({ member: units[member] for member in clustered[name]['members'] })
+
+    return expanded
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve a synthetic fleet with and without clustering of similar units.')
+    parser.add_argument('--units', type=int, default=60, help='units of the synthetic fleet')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--tolerance', type=float, default=0.1, help='relative difference of vc, power and ramp within a cluster')
+    parser.add_argument('--time-limit', type=float, help='seconds, for both solves')
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import synthetic_units, synthetic_profiles
+
+    load_dotenv()
+    units, profiles = synthetic_units(args.units), synthetic_profiles(args.hours)
+    clustered = cluster_units(units, args.tolerance)
+    firm = sum( 1 for unit in units.values() if unit['type'] in CLUSTER_ATTRIBUTES )
+    print(f'{firm} plants and batteries in {sum( 1 for unit in clustered.values() if unit["type"] in CLUSTER_ATTRIBUTES )} clusters')
+
+    for label, tolerance in [ ( 'Units', None ), ( 'Clusters', args.tolerance ) ]:
+        start = time.perf_counter()
+        model = uc_model(units, profiles=profiles, time_limit=args.time_limit, tolerance=tolerance)
+        elapsed = time.perf_counter() - start
+        if not model:
+            print(f'{label}: no solution after {elapsed:.1f} s')
+            continue
+        stats = model.stats
+        kept = sum( 1 for unit in model.units.values() if unit.get('members') )
+        print(
+            f'{label}: {kept} clusters kept, {stats["variables"]} variables, {stats["binaries"]} binaries, {stats["integers"]} integers, '
+            f'{stats["constraints"]} constraints; {elapsed:.1f} s, cost {round(pyo.value(model.system_costs), 0)}, gap {stats["gap"]:.4%}'
+        )
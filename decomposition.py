@@ -0,0 +1,381 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+import input
+from uc_model import DEFAULT_MIP_GAP, build_model, on_bound, solver_backend, solve_limits, relative_gap, solve_shell, solve_persistent, solve_model, warm_start, extract_results, model_stats
+
+
+# Subgradient step: share of the distance to the best cost, halved after STALL_ITERATIONS without a better bound
+STEP_SCALE = 1
+STALL_ITERATIONS = 3
+
+# Commitment of the subproblems is repaired into a solution every REPAIR_EVERY iterations, and after the last
+REPAIR_EVERY = 5
+
+
+def unit_supply(model, name, hour):
+    """ Power a plant or battery gives to the demand balance in an hour; charging takes from it. """
+
+    if name in model.plants:
+        return model.power[name, hour]
+
+    return -model.b_reload[name, hour] - model.b_load[name, hour]
+
+
+def subproblem(name, unit, profiles, formulation=None):
+    """ Model of a single plant or battery, the demand balance priced in its objective instead.
+
+    Minimizes own cost minus price times supply in each hour; prices are mutable Params.
+    """
+
+    model = build_model({ name: unit }, profiles, formulation)
+    # Commitment bounds were inferred from the demand of this unit alone, not of the fleet
+    model.on_bounds = {}
+    for ( plant, hour ), var in model.on.items():
+        var.bounds = on_bound(model, plant, hour)
+    model.demand.deactivate()
+    model.system_costs.deactivate()
+    model.price = pyo.Param(model.hours, mutable=True, initialize=0)
+    model.lagrangian = pyo.Objective(
+        expr=model.system_costs.expr - pyo.quicksum( model.price[hour] * unit_supply(model, name, hour) for hour in model.hours ),
+        sense=pyo.minimize,
+    )
+
+    return model
+
+
+def solve_subproblem(model, backend):
+
+    model.termination, model.gap = None, None
+    if backend == 'highs':
+        solved, message = solve_persistent(model)
+    else:
+        solved, message = solve_shell(model, backend)
+    if not solved:
+        # Staying off (idle) is always feasible
+        raise RuntimeError(f'Subproblem not solved: {message}')
+
+
+class Subproblems:
+    """ Subproblem models of some units, kept between iterations, so a solve only changes prices. """
+
+    def __init__(self, units, profiles, formulation=None, backend=None):
+        self.backend = solver_backend(backend)
+        self.models = { name: subproblem(name, unit, profiles, formulation) for name, unit in units.items() }
+
+    def solve(self, prices):
+        """ Per unit: lower bound of its priced cost, supply in each hour and commitment (plants). """
+
+        solved = {}
+        for name, model in self.models.items():
+            hours = list(model.hours)
+            for hour, price in zip(hours, prices):
+                model.price[hour] = price
+            solve_subproblem(model, self.backend)
+
+            objective = pyo.value(model.lagrangian)
+            solved[name] = {
+                'bound': objective - ( model.gap or 0 ) * abs(objective),
+                'supply': [ pyo.value(unit_supply(model, name, hour)) for hour in hours ],
+                'on': [ round(model.on[name, hour].value) for hour in hours ] if name in model.plants else None,
+            }
+
+        return solved
+
+
+def subproblem_main(connection):
+    """ Subproblem worker process: builds its subproblems, then solves them for each price vector until None. """
+
+    load_dotenv()
+    subproblems = Subproblems(*connection.recv())
+    connection.send(True)
+
+    while True:
+        prices = connection.recv()
+        if prices is None:
+            return
+        try:
+            connection.send(subproblems.solve(prices))
+        except Exception as error:
+            connection.send(error)
+
+
+class SubproblemPool:
+    """ Subproblems of all plants and batteries, split over worker processes.
+
+    Every workers-th unit goes to the same worker; with one worker they are solved in this process.
+    """
+
+    def __init__(self, units, profiles, formulation=None, backend=None, workers=None):
+        names = list(units)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(names)))
+        chunks = [ { name: units[name] for name in names[i::workers] } for i in range(workers) ]
+
+        self.size = workers
+        self.local, self.workers = None, []
+        if workers == 1:
+            self.local = Subproblems(chunks[0], profiles, formulation, backend)
+            return
+
+        context = multiprocessing.get_context('spawn')
+        for chunk in chunks:
+            connection, child = context.Pipe()
+            process = context.Process(target=subproblem_main, args=(child,), daemon=True)
+            process.start()
+            child.close()
+            connection.send(( chunk, profiles, formulation, backend ))
+            self.workers.append(( process, connection ))
+        for _, connection in self.workers:
+            connection.recv()
+
+    def solve(self, prices):
+
+        prices = [ float(price) for price in prices ]
+        if self.local is not None:
+            return self.local.solve(prices)
+
+        for _, connection in self.workers:
+            connection.send(prices)
+        solved = {}
+        for _, connection in self.workers:
+            outcome = connection.recv()
+            if isinstance(outcome, Exception):
+                raise outcome
+            solved.update(outcome)
+
+        return solved
+
+    def close(self):
+
+        for process, connection in self.workers:
+            connection.send(None)
+            process.join()
+        self.workers = []
+
+
+@contextmanager
+def relaxed(model):
+    """ Integer variables of the model continuous within the block. """
+
+    integers = [ var for var in model.component_data_objects(pyo.Var) if var.is_integer() ]
+    saved = [ ( var.domain, var.lower, var.upper ) for var in integers ]
+    for var in integers:
+        # Bounds of the integer domain (0 and 1 of binaries) become explicit bounds
+        lower, upper = var.bounds
+        var.domain = pyo.Reals
+        var.setlb(lower)
+        var.setub(upper)
+    try:
+        yield
+    finally:
+        for var, ( domain, lower, upper ) in zip(integers, saved):
+            var.domain = domain
+            var.setlb(lower)
+            var.setub(upper)
+
+
+def lp_prices(model, backend):
+    """ Duals of the demand balance in the LP relaxation, and its objective; None if the LP is infeasible. """
+
+    rows = [ model.demand[hour] for hour in model.hours ]
+    with relaxed(model):
+        if backend == 'highs':
+            solved, _ = solve_persistent(model)
+            duals = model.solver.get_duals(cons_to_load=rows) if solved else None
+        else:
+            model.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT)
+            solved, _ = solve_shell(model, backend)
+            duals = { row: model.dual[row] for row in rows } if solved else None
+            model.del_component('dual')
+
+    if not solved:
+        return None, None
+
+    return np.array([ duals[row] for row in rows ]), pyo.value(model.system_costs)
+
+
+def fix_commitment(model, on):
+    """ Fix commitment of the plants to a plants x hours grid; NaN leaves it to the solver, within its bounds.
+
+    Fixed through bounds: persistent HiGHS would take fixed variables out of all their rows.
+    """
+
+    for name, row in zip(model.plants, on.tolist()):
+        for hour, value in zip(model.hours, row):
+            model.on[name, hour].bounds = on_bound(model, name, hour) if math.isnan(value) else ( value, value )
+
+
+def primal_repair(model, solved, backend, limits):
+    """ System costs of a solution built from the subproblems' commitment; None if none is found.
+
+    Their commitment and power, repaired in merit order, are the MIP start of the full model.
+    Plants the subproblems keep on (or off) in every hour, and the repair leaves so, are fixed;
+    only the rest is left to branch and bound.
+    """
+
+    names, hours = list(model.plants), list(model.hours)
+    on = np.array([ solved[name]['on'] for name in names ], dtype=float).reshape(len(names), len(hours))
+    fix_commitment(model, np.full(on.shape, np.nan))
+    warm_start(model, {
+        'units': model.units,
+        'on': { name: solved[name]['on'] for name in names },
+        'power': { name: solved[name]['supply'] for name in names },
+    })
+
+    started = np.array([ [ model.on[name, hour].value for hour in hours ] for name in names ], dtype=float).reshape(on.shape)
+    settled = ( on == on[:, :1] ).all(axis=1) & ( started == on ).all(axis=1)
+    fix_commitment(model, np.where(settled[:, None], on, np.nan))
+
+    if not solve_model(model, warmstart=True, backend=backend, limits=limits):
+        return None
+
+    return pyo.value(model.system_costs)
+
+
+def decompose(units, profiles=None, formulation=None, workers=None, iterations=30, time_limit=None, mip_gap=None, dev=False):
+    """ Solve by Lagrangian relaxation of the demand balance, for fleets too large for one MIP.
+
+    Without the demand balance, every plant and battery is a small problem of its own: its
+    cost minus an hourly price times its supply. Those subproblems are solved in parallel
+    worker processes; prices start at the duals of the LP relaxation and follow subgradient
+    steps towards the hours short of (or over) net demand. Their summed costs plus price
+    times net demand bound the optimum from below.
+
+    Every REPAIR_EVERY iterations, and for the best bound at the end, a solution of the full
+    model is built from the subproblems' commitment (primal_repair); the best one is kept.
+    Stops at mip_gap, after iterations or at time_limit seconds.
+
+    Returns the full model with results, stats and bound, or False without a feasible solution.
+    Its termination is 'optimal', 'time limit', or 'iteration limit' when the iterations ran
+    out before mip_gap was reached.
+    """
+
+    load_dotenv()
+
+    started = time.perf_counter()
+    profiles = input.profiles if profiles is None else profiles
+    limits = solve_limits(time_limit, mip_gap)
+    target = DEFAULT_MIP_GAP if limits['mip_gap'] is None else limits['mip_gap']
+    backend = solver_backend()
+
+    def remaining():
+        if limits['time_limit'] is None:
+            return {}
+        return { 'time_limit': max(1, limits['time_limit'] - ( time.perf_counter() - started )) }
+
+    def timed_out():
+        return limits['time_limit'] is not None and time.perf_counter() - started >= limits['time_limit']
+
+    model = build_model(units, profiles, formulation)
+    names, hours = list(model.plants), list(model.hours)
+    demand = np.array([ pyo.value(model.net_demand[hour]) for hour in hours ])
+
+    prices, lp_bound = lp_prices(model, backend)
+    if prices is None:
+        if dev:
+            print('Model is infeasible')
+        return False
+
+    pool = SubproblemPool({ name: model.units[name] for name in [ *names, *model.batteries ] }, profiles, formulation, backend, workers)
+    bound, best_solved, upper, best_values = -math.inf, None, math.inf, None
+    repaired = None
+    scale, stall, history = STEP_SCALE, 0, []
+
+    try:
+        for iteration in range(iterations):
+            solved = pool.solve(prices)
+            value = sum( unit['bound'] for unit in solved.values() ) + prices @ demand
+            supply = np.sum([ unit['supply'] for unit in solved.values() ], axis=0)
+
+            if value > bound:
+                bound, best_solved, stall = value, solved, 0
+            else:
+                stall += 1
+                if stall >= STALL_ITERATIONS:
+                    scale, stall = scale / 2, 0
+
+            if iteration % REPAIR_EVERY == 0:
+                repaired = solved
+                costs = primal_repair(model, solved, backend, remaining())
+                if costs is not None and costs < upper:
+                    upper, best_values = costs, [ var.value for var in model.component_data_objects(pyo.Var) ]
+
+            history.append({ 'bound': round(value, 2), 'upper': round(upper, 2), 'elapsed': round(time.perf_counter() - started, 3) })
+            if dev:
+                print(f'Iteration {iteration + 1}: bound {value:.1f}, best cost {upper:.1f}')
+
+            subgradient = demand - supply
+            norm = subgradient @ subgradient
+            gap = relative_gap(upper, bound)
+            if ( gap is not None and gap <= target ) or norm < 1e-9 or timed_out():
+                break
+
+            # Polyak step towards the best known cost, or a guess above the bound before there is one
+            goal = upper if math.isfinite(upper) else value + 0.05 * abs(value)
+            prices = prices + scale * ( goal - value ) / norm * subgradient
+    finally:
+        pool.close()
+
+    # The commitment of the best bound, repaired unless it was in the loop; none without iterations
+    if best_solved is not None and best_solved is not repaired and not timed_out():
+        costs = primal_repair(model, best_solved, backend, remaining())
+        if costs is not None and costs < upper:
+            upper, best_values = costs, [ var.value for var in model.component_data_objects(pyo.Var) ]
+
+    fix_commitment(model, np.full(( len(names), len(hours) ), np.nan))
+    if best_values is None:
+        if dev:
+            print('No feasible commitment found')
+        return False
+
+    for var, value in zip(model.component_data_objects(pyo.Var), best_values):
+        var.set_value(value, skip_validation=True)
+
+    model.gap = relative_gap(upper, bound)
+    model.termination = 'optimal' if model.gap <= target else 'time limit' if timed_out() else 'iteration limit'
+    model.results = extract_results(model)
+    model.stats = model_stats(model)
+    model.decomposition = { 'bound': bound, 'lp_bound': lp_bound, 'system_costs': upper, 'workers': pool.size, 'iterations': history }
+
+    if dev:
+        print(f'Cost of the system: {round(upper, 0)}, bound: {round(bound, 0)}, gap: {model.gap:.4%}')
+
+    return model
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve a synthetic fleet by Lagrangian decomposition, optionally against the monolithic MIP.')
+    parser.add_argument('--units', type=int, default=200, help='units of the synthetic fleet')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--workers', type=int, help='subproblem worker processes, CPU count by default')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--time-limit', type=float, help='seconds, for both solves')
+    parser.add_argument('--compare', action='store_true', help='also solve the monolithic MIP')
+    args = parser.parse_args()
+
+    from benchmarks.synthetic import synthetic_units, synthetic_profiles
+    from uc_model import uc_model
+
+    units, profiles = synthetic_units(args.units), synthetic_profiles(args.hours)
+
+    start = time.perf_counter()
+    model = decompose(units, profiles, workers=args.workers, iterations=args.iterations, time_limit=args.time_limit, dev=True)
+    print(f'Decomposition: {time.perf_counter() - start:.1f} s')
+
+    if args.compare:
+        start = time.perf_counter()
+        monolithic = uc_model(units, profiles=profiles, time_limit=args.time_limit)
+        elapsed = time.perf_counter() - start
+        if monolithic:
+            print(f'Monolithic: {elapsed:.1f} s, cost {round(pyo.value(monolithic.system_costs), 0)}, gap {monolithic.gap:.4%}')
+        else:
+            print(f'Monolithic: no solution after {elapsed:.1f} s')
@@ -0,0 +1,200 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import input
+
+
+def scenario_main(connection):
+    """ Scenario worker process: solves (units, profiles, formulation) tasks until it receives None.
+
+    Sends 'ready' once the solver stack is imported, before the first task.
+    """
+
+    # Own process group, so a timed out scenario also stops the GLPK / CBC subprocess
+    if hasattr(os, 'setsid'):
+        os.setsid()
+
+    import pyomo.environ as pyo
+    from uc_model import uc_model
+
+    connection.send('ready')
+
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+
+        units, profiles, formulation = task
+        try:
+            model = uc_model(units, profiles=profiles, formulation=formulation)
+            if not model:
+                connection.send({ 'status': 'infeasible' })
+            else:
+                # 'optimal' within the MIP gap, or 'time limit' for the best schedule found by then
+                connection.send({ 'status': model.termination, 'gap': model.gap, 'system_costs': pyo.value(model.system_costs), 'results': model.results })
+        except Exception as error:
+            connection.send({ 'status': 'failed', 'error': repr(error) })
+
+
+def start_worker(context):
+
+    connection, child = context.Pipe()
+    process = context.Process(target=scenario_main, args=(child,), daemon=True)
+    process.start()
+    child.close()
+
+    # Returns once the worker has imported pyomo, raises EOFError if it stopped before
+    connection.recv()
+
+    return process, connection
+
+
+def stop_worker(process):
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, ProcessLookupError, PermissionError):
+        process.kill()
+    process.join()
+
+
+def solve_scenarios(units, scenarios, workers=None, timeout=None, formulation=None):
+    """ Outcome of each scenario, solved in parallel worker processes.
+
+    A scenario running over timeout seconds has its worker killed and replaced, and a
+    crashed worker is replaced as well, so one scenario never stops the others. Timeouts
+    count from the task being sent to a ready worker, after its imports.
+    """
+
+    workers = min(workers or os.cpu_count() or 1, len(scenarios))
+    context = multiprocessing.get_context('spawn')
+    tasks = deque(scenarios)
+    outcomes = {}
+    lock = threading.Lock()
+
+    def serve():
+
+        process, connection = None, None
+        while True:
+            with lock:
+                if not tasks:
+                    break
+                name = tasks.popleft()
+
+            started = time.perf_counter()
+            try:
+                if process is None:
+                    process, connection = start_worker(context)
+                    # Imports of a fresh worker do not count against the timeout of the scenario
+                    started = time.perf_counter()
+
+                connection.send(( units, scenarios[name], formulation ))
+                if connection.poll(timeout):
+                    outcome = connection.recv()
+                else:
+                    stop_worker(process)
+                    process = None
+                    outcome = { 'status': 'timeout', 'error': f'Not solved within {timeout} s.' }
+            except (EOFError, OSError):
+                process = None
+                outcome = { 'status': 'failed', 'error': 'Scenario worker stopped.' }
+
+            outcome['elapsed'] = time.perf_counter() - started
+            with lock:
+                outcomes[name] = outcome
+
+        if process is not None:
+            connection.send(None)
+            process.join()
+
+    threads = [ threading.Thread(target=serve, daemon=True) for _ in range(workers) ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return outcomes
+
+
+def columnar(scenarios, outcomes):
+    """ Outcomes as columns: one entry per scenario, dispatch as scenarios x units x hours.
+
+    Costs, MIP gaps and dispatch of scenarios without a solution are NaN.
+    """
+
+    names = list(scenarios)
+    solved = [ outcome['results'] for outcome in outcomes.values() if 'results' in outcome ]
+    units = list(dict.fromkeys( unit for results in solved for unit in results['units'] ))
+    hours = max( len(profiles['demand']) for profiles in scenarios.values() )
+
+    dispatch = np.full(( len(names), len(units), hours ), np.nan)
+    for s, name in enumerate(names):
+        results = outcomes[name].get('results')
+        if results is not None:
+            rows = [ units.index(unit) for unit in results['units'] ]
+            dispatch[s, rows, :results['power'].shape[1]] = results['power']
+
+    return {
+        'scenario': np.array(names),
+        'status': np.array([ outcomes[name]['status'] for name in names ]),
+        'system_costs': np.array([ outcomes[name].get('system_costs', np.nan) for name in names ], dtype=float),
+        'gap': np.array([ np.nan if outcomes[name].get('gap') is None else outcomes[name]['gap'] for name in names ], dtype=float),
+        'elapsed': np.array([ outcomes[name]['elapsed'] for name in names ], dtype=float),
+        'error': np.array([ outcomes[name].get('error', '') for name in names ]),
+        'unit': np.array(units),
+        'hour': np.arange(1, hours + 1),
+        'dispatch': dispatch,
+    }
+
+
+def run_ensemble(units, scenarios, workers=None, timeout=None, formulation=None):
+    """ Solve the same fleet against each { name: profiles } scenario; returns columnar results. """
+
+    return columnar(scenarios, solve_scenarios(units, scenarios, workers, timeout, formulation))
+
+
+def profile_variants(profiles, count, spread=0.1, seed=0):
+    """ Scenarios of profiles scaled hour by hour with random factors around 1, clipped to [0, 1]. """
+
+    rng = np.random.default_rng(seed)
+    scenarios = {}
+    for i in range(count):
+        scenarios[f'variant {i}'] = {
+            key: np.clip(np.asarray(values, dtype=float) * rng.normal(1, spread, len(values)), 0, 1).tolist()
+            for key, values in profiles.items()
+        }
+
+    return scenarios
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve the input units against many profile scenarios in parallel.')
+    parser.add_argument('--scenarios', help='JSON file of { name: { demand, wind, pv } } profiles')
+    parser.add_argument('--variants', type=int, default=8, help='random variants of input profiles, if no file is given')
+    parser.add_argument('--spread', type=float, default=0.1, help='relative spread of random variants')
+    parser.add_argument('--workers', type=int, help='worker processes, CPU count by default')
+    parser.add_argument('--timeout', type=float, help='seconds per scenario')
+    parser.add_argument('--out', help='save the columns to this .npz file')
+    args = parser.parse_args()
+
+    if args.scenarios:
+        with open(args.scenarios) as file:
+            scenarios = json.load(file)
+    else:
+        scenarios = profile_variants(input.profiles, args.variants, args.spread)
+
+    results = run_ensemble(input.units, scenarios, args.workers, args.timeout)
+    for name, status, costs, gap, elapsed in zip(results['scenario'], results['status'], results['system_costs'], results['gap'], results['elapsed']):
+        print(f'{name}: {status}, {round(costs, 0)} $, gap {gap:.2%}, {round(elapsed, 1)} s')
+
+    if args.out:
+        np.savez_compressed(args.out, **results)
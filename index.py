@@ -1,7 +1,18 @@
+import multiprocessing
+import os
+import secrets
+import socket
+import threading
+import time
+
 import dash
 import dash_bootstrap_components as dbc
+from dotenv import load_dotenv
 from waitress import serve
 
+from admission import register_admission
+from metrics import register_metrics
+
 
 app = dash.Dash(
     __name__,
@@ -25,8 +36,93 @@ app.layout = dbc.Container([
 ], className='main-container'
 )
 
+# Prometheus scrape endpoint of solve phase timings and model sizes
+register_metrics(app.server)
+
+# 429 to callbacks beyond ADMIT_REQUESTS running at once in a web process
+load_dotenv()
+if os.environ.get('ADMIT_REQUESTS'):
+    register_admission(app.server, int(os.environ['ADMIT_REQUESTS']))
+
+
+def wait_for_port(host, port):
+
+    while True:
+        try:
+            socket.create_connection(( host, port ), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def warm_up(port):
+    """ Once the server accepts connections, import the solver stack and start the solve workers.
+
+    Imports of pyomo and the solvers are deferred at startup, so the port opens sooner; this
+    loads them in the background before the first user needs them.
+    """
+
+    wait_for_port('127.0.0.1', port)
+
+    import uc_model
+    from solve_jobs import solve_pool
+
+    solve_pool().start()
+
+
+def serve_web(port, threads):
+    """ Web process of multi-process serving; all of them accept connections on the same port. """
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(( '0.0.0.0', port ))
+
+    serve(app.server, sockets=[ sock ], threads=threads)
+
+
+def serve_processes(port, processes, threads):
+    """ WEB_PROCESSES request handling processes in front of one solve server process.
+
+    The solve server holds the solve pool (SOLVE_WORKERS processes, one per core by default),
+    the session units and the solve metrics; web processes reach it at SOLVE_SERVER. A
+    SOLVE_SERVER given in the environment is used instead of starting one.
+    """
+
+    from solve_server import serve_solves, server_address
+
+    context = multiprocessing.get_context('spawn')
+    children = []
+    if not os.environ.get('SOLVE_SERVER'):
+        os.environ['SOLVE_SERVER'] = f"127.0.0.1:{os.environ.get('SOLVE_SERVER_PORT', 8090)}"
+        os.environ['SOLVE_SERVER_KEY'] = secrets.token_hex(16)
+        address = server_address(os.environ['SOLVE_SERVER'])
+        children.append(context.Process(target=serve_solves, args=(address, os.environ['SOLVE_SERVER_KEY'].encode())))
+        children[-1].start()
+        wait_for_port(*address)
+
+    for _ in range(processes):
+        children.append(context.Process(target=serve_web, args=(port, threads)))
+        children[-1].start()
+
+    try:
+        for child in children:
+            child.join()
+    finally:
+        for child in children:
+            child.terminate()
+
 
 # if __name__ == '__main__':
 #     app.run(debug=True)
 
-serve(app.server, port=8080)
\ No newline at end of file
+# Solve workers are spawned processes, which import this module again - they must not serve
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 8080))
+    processes = int(os.environ.get('WEB_PROCESSES', 1))
+    if processes > 1:
+        serve_processes(port, processes, int(os.environ.get('WEB_THREADS', 8)))
+    else:
+        if os.environ.get('WARM_UP') == '1':
+            threading.Thread(target=warm_up, args=(port,), daemon=True).start()
+        serve(app.server, port=port)
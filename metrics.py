@@ -0,0 +1,127 @@
+import bisect
+import os
+import threading
+
+from flask import Response
+
+
+# Upper bounds of histogram buckets; +Inf is added on output
+SECONDS_BUCKETS = [ 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300 ]
+SIZE_BUCKETS = [ 1e3, 1e4, 1e5, 1e6, 1e7 ]
+
+
+class Histogram:
+    """ Prometheus-style histogram with one series per label value. """
+
+    def __init__(self, name, documentation, label, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_value, value):
+
+        counts, total = self._series.setdefault(label_value, ( [ 0 ] * ( len(self.buckets) + 1 ), [ 0 ] ))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def render(self):
+
+        lines = [ f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram' ]
+        for label_value, ( counts, total ) in sorted(self._series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip([ *self.buckets, '+Inf' ], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total[0]}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+
+        return lines
+
+
+class Counter:
+    """ Prometheus-style counter with one series per label value. """
+
+    def __init__(self, name, documentation, label):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._series = {}
+
+    def inc(self, label_value):
+
+        self._series[label_value] = self._series.get(label_value, 0) + 1
+
+    def render(self):
+
+        lines = [ f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter' ]
+        for label_value, count in sorted(self._series.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {count}')
+
+        return lines
+
+
+class SolveMetrics:
+    """ Phase timings and model sizes of finished solves, job counts by outcome and rejected work. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = Histogram('uc_phase_seconds', 'Seconds spent in a phase of model build and solve.', 'phase', SECONDS_BUCKETS)
+        self.sizes = Histogram('uc_model_size', 'Variables, binaries and constraints of solved models.', 'kind', SIZE_BUCKETS)
+        self.jobs = Histogram('uc_job_seconds', 'Seconds from submit to finish of solve jobs.', 'status', SECONDS_BUCKETS)
+        self.rejected = Counter('uc_rejected_total', 'Solves and requests turned away by admission control.', 'reason')
+
+    def observe_stats(self, stats):
+
+        with self._lock:
+            for phase, seconds in stats['phases'].items():
+                self.phases.observe(phase, seconds)
+            for kind in [ 'variables', 'binaries', 'integers', 'constraints' ]:
+                self.sizes.observe(kind, stats[kind])
+
+    def observe_job(self, status, seconds):
+
+        with self._lock:
+            self.jobs.observe(status, seconds)
+
+    def observe_rejected(self, reason):
+
+        with self._lock:
+            self.rejected.inc(reason)
+
+    def render(self):
+
+        with self._lock:
+            lines = [ *self.phases.render(), *self.sizes.render(), *self.jobs.render(), *self.rejected.render() ]
+
+        return '\n'.join(lines) + '\n'
+
+
+_metrics = SolveMetrics()
+_remote = None
+
+
+def solve_metrics():
+    """ Metrics of this process; with SOLVE_SERVER set, those of the solve server, where solves run. """
+
+    global _remote
+    if os.environ.get('SOLVE_SERVER'):
+        if _remote is None:
+            from solve_server import solve_server
+            _remote = solve_server().solve_metrics()
+        return _remote
+
+    return _metrics
+
+
+def local_solve_metrics():
+
+    return _metrics
+
+
+def register_metrics(server, path='/metrics'):
+    """ Serve solve metrics in Prometheus text format from the Flask server of the app. """
+
+    server.add_url_rule(path, 'metrics', lambda: Response(solve_metrics().render(), mimetype='text/plain; version=0.0.4'))
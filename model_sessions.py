@@ -0,0 +1,74 @@
+import threading
+from collections import OrderedDict
+
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+from uc_model import build_model, update_model, solve_clustered, solution_values, warm_start
+from clustering import cluster_tolerance, cluster_units
+from result_store import encode_results
+
+
+# Built models are kept per browser session, least recently used are dropped first
+MAX_SESSIONS = 16
+
+_models = OrderedDict()
+_locks = {}
+_lock = threading.Lock()
+
+
+def session_lock(session):
+
+    with _lock:
+        return _locks.setdefault(session, threading.Lock())
+
+
+def session_model(session, units):
+    """ Model of the session brought in line with units; built from scratch on first use.
+
+    A model solved before gets its last solution, mapped onto the edited units, as MIP start.
+    With CLUSTER_TOLERANCE set, similar units are solved as clusters.
+    """
+
+    tolerance = cluster_tolerance()
+    if tolerance is not None:
+        units = cluster_units(units, tolerance)
+
+    with _lock:
+        model = _models.pop(session, None)
+
+    if model is None:
+        model = build_model(units)
+    elif getattr(model, 'results', None) is None:
+        model = update_model(model, units)
+    else:
+        previous = solution_values(model)
+        model = update_model(model, units)
+        warm_start(model, previous)
+
+    with _lock:
+        _models[session] = model
+        while len(_models) > MAX_SESSIONS:
+            dropped, _ = _models.popitem(last=False)
+            _locks.pop(dropped, None)
+
+    return model
+
+
+def solve_session_model(session, units, dev=False, limits=None, on_incumbent=None):
+    """ Solve the model kept for the session; returns (results, system costs, stats) or None.
+
+    Results are the compact payload of result_store, ready for the browser and the cache.
+    limits and on_incumbent are those of uc_model.solve_model; stats tell the gap left.
+    """
+
+    load_dotenv()
+
+    with session_lock(session):
+        model = session_model(session, units)
+        model = solve_clustered(model, units, dev, warmstart=getattr(model, 'results', None) is not None, limits=limits, on_incumbent=on_incumbent)
+        if not model:
+            return None
+
+        return encode_results(model.results), pyo.value(model.system_costs), model.stats
+
@@ -2,18 +2,32 @@ from dash import callback, Output, Input, State, no_update, ctx, ALL
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
-import pandas as pd
 import numpy as np
-from dash import Patch
-import pyomo.environ as pyo
+from dash import Patch, html
 import math
 
 import input
-from uc_model import uc_model
+from borders import BORDER_LEVELS, border_tolerance
+from solve_jobs import solve_pool, QueueFull, SessionBusy
+from unit_store import unit_store, StaleSession
+from result_store import decode_results
 
 
 min_lat, max_lat = (25, 37)
 min_lon, max_lon = (-112.5, -87.5)
+MAP_WIDTH = 800  # px, maxWidth of the map
+
+# Border comes after the traces of unit types
+BORDER_TRACE = len(input.unit_types)
+
+# Commitment chart: up to MAX_UNIT_TRACES units are drawn one by one in 'auto' mode, more
+# by type; horizons over MAX_CHART_HOURS are downsampled
+MAX_UNIT_TRACES = 50
+MAX_CHART_HOURS = 168
+MERIT_BANDS = 5
+# Solves stopped before their MIP gap: by uc_model.solve_model or, out of iterations, decomposition.decompose
+STOPPED_TERMINATIONS = ['time limit', 'iteration limit']
+BAND_COLORS = ['#4d4d4d', '#6f6f6f', '#929292', '#b4b4b4', '#d6d6d6']
 
 
 def make_alerts(alerts, msg, color):
@@ -30,19 +44,134 @@ def make_alerts(alerts, msg, color):
     return alerts
 
 
+def stale_session_alerts(alerts):
+    """ Alert for an edit or run of a dropped or changed session, with a link reloading the page. """
+
+    msg = [
+        'Your units changed in another tab or this page was open too long. ',
+        html.A('Reload the page', href='', className='alert-link'),
+        ' to continue with the current units.',
+    ]
+    alerts = list(alerts or [])
+    alerts.append(dbc.Alert(msg, is_open=True, color='danger'))
+
+    return alerts
+
+
+def session_units(session):
+    """ Units of the session for callbacks only showing them; a dropped session leaves the page as it is. """
+
+    try:
+        return unit_store().units(session)
+    except StaleSession:
+        raise PreventUpdate
+
+
+def format_stats(stats):
+    """ Time per phase and model size of a solve, shown under its costs. """
+
+    if stats is None:
+        return 'Solution served from cache.'
+
+    from uc_model import BUILD_PHASES
+
+    phases = stats['phases']
+    steps = [ ( 'Build', sum( phases.get(phase, 0) for phase in BUILD_PHASES ) ) ]
+    if 'write' in phases:
+        steps += [ ( 'LP write', phases['write'] ), ( 'Solver', phases.get('solver', 0) ), ( 'Read', phases.get('read', 0) ) ]
+    else:
+        steps += [ ( 'Solve', phases.get('solve', 0) ) ]
+    steps += [ ( 'Results', phases.get('results', 0) ) ]
+
+    lines = [
+        html.Div(' · '.join( f'{name} {seconds:.2f} s' for name, seconds in steps )),
+        html.Div(f"{stats['variables']} variables ({stats['binaries']} binary, {stats['integers']} integer), {stats['constraints']} constraints"),
+    ]
+    if stats.get('gap') is not None:
+        stopped = f", {stats['termination']} reached" if stats['termination'] in STOPPED_TERMINATIONS else ''
+        lines.append(html.Div(f"MIP gap {stats['gap']:.2%}{stopped}"))
+
+    return lines
+
+
+def format_incumbent(incumbent):
+    """ Best solution of a running solve, shown in the job status. """
+
+    if incumbent is None:
+        return ''
+
+    gap = '' if incumbent['gap'] is None else f", gap {incumbent['gap']:.2%}"
+
+    return f" · best {round(incumbent['objective'], 0)} ${gap}"
+
+
 @callback(
-    Output('id-store-results', 'data'),
-    Output('id-div-results', 'children'),
+    Output('id-store-job', 'data'),
+    Output('id-interval-job', 'disabled'),
+    Output('id-button-cancel', 'disabled'),
+    Output('id-div-job-status', 'children'),
     Output('id-alert-container', 'children'),
     Input('id-run-model', 'n_clicks'),
+    State('id-store-session', 'data'),
     State('id-store-units', 'data'),
+    State('id-input-time-limit', 'value'),
+    State('id-input-mip-gap', 'value'),
     State('id-alert-container', 'children'),
     prevent_initial_call=True
 )
-def run_model(click, units, alerts):
-    
-    model = uc_model(units, dev=False)
-    if not model:
+def run_model(click, session, version, time_limit, mip_gap, alerts):
+
+    limits = {
+        'time_limit': time_limit or None,
+        'mip_gap': None if mip_gap is None else mip_gap / 100,
+    }
+    try:
+        job_id = solve_pool().submit(session, unit_store().units(session, version), limits)
+    except StaleSession:
+        return no_update, no_update, no_update, no_update, stale_session_alerts(alerts)
+    except QueueFull:
+        msg = f'Too many models are being computed now. Try again in a moment.'
+        color = 'warning'
+        alerts = make_alerts(alerts, msg, color)
+
+        return no_update, no_update, no_update, no_update, alerts
+    except SessionBusy:
+        msg = f'Your previous model is still being computed. Wait for it or cancel it.'
+        color = 'warning'
+        alerts = make_alerts(alerts, msg, color)
+
+        return no_update, no_update, no_update, no_update, alerts
+
+    return job_id, False, False, 'Model was queued', alerts
+
+
+@callback(
+    Output('id-store-results', 'data'),
+    Output('id-div-results', 'children'),
+    Output('id-div-stats', 'children'),
+    Output('id-interval-job', 'disabled', allow_duplicate=True),
+    Output('id-button-cancel', 'disabled', allow_duplicate=True),
+    Output('id-div-job-status', 'children', allow_duplicate=True),
+    Output('id-alert-container', 'children', allow_duplicate=True),
+    Input('id-interval-job', 'n_intervals'),
+    State('id-store-job', 'data'),
+    State('id-alert-container', 'children'),
+    prevent_initial_call=True
+)
+def poll_model(interval, job_id, alerts):
+
+    status = solve_pool().status(job_id)
+    elapsed = round(status['elapsed'], 1)
+
+    if status['status'] == 'queued':
+        return no_update, no_update, no_update, False, False, f'Waiting in queue ({status["position"]}): {elapsed} s', no_update
+    if status['status'] == 'running':
+        return no_update, no_update, no_update, False, False, f'Computing: {elapsed} s{format_incumbent(status["incumbent"])}', no_update
+    if status['status'] == 'cancelled':
+        return no_update, no_update, no_update, True, True, f'Cancelled after {elapsed} s', no_update
+
+    solution = solve_pool().result(job_id)
+    if not solution:
 
         sys_cost = 'No solution for provided input.'
         
@@ -50,46 +179,69 @@ def run_model(click, units, alerts):
         color = 'warning'
         alerts = make_alerts(alerts, msg, color)
 
-        return None, sys_cost, alerts
+        return None, sys_cost, None, True, True, f'Finished in {elapsed} s', alerts
 
-    sys_cost = round(pyo.value(model.system_costs), 0)
+    results, sys_cost, stats = solution
+    sys_cost = round(sys_cost, 0)
     sys_cost = f'{sys_cost} $'
     
-    msg = f'Model was computed successfully'  
-    color = 'success'
+    if stats is not None and stats['termination'] in STOPPED_TERMINATIONS:
+        msg = f"{stats['termination'].capitalize()} reached, showing the best schedule found"
+        color = 'info'
+    else:
+        msg = f'Model was computed successfully'  
+        color = 'success'
     alerts = make_alerts(alerts, msg, color)
 
-    return model.results, sys_cost, alerts
+    return results, sys_cost, format_stats(stats), True, True, f'Finished in {elapsed} s', alerts
+
+
+@callback(
+    Output('id-div-job-status', 'children', allow_duplicate=True),
+    Input('id-button-cancel', 'n_clicks'),
+    State('id-store-job', 'data'),
+    prevent_initial_call=True
+)
+def cancel_model(click, job_id):
+
+    solve_pool().cancel(job_id)
+
+    return 'Cancelling...'
+
+
+def grid_row(units, name):
+
+    return { **units[name], 'name': name }
 
 
 @callback(
     Output('id-table', 'rowData'), 
+    Input('id-store-session', 'data'),
+)
+def create_grid(session):
+
+    units = session_units(session)
+
+    # Built once per page load; edits are sent as row transactions
+    return [ grid_row(units, name) for name in units ]
+
+
+@callback(
     Output('id-table', 'getRowStyle'), 
-    Input('id-store-units', 'data'),
     Input('id-store-colors', 'data'),
 )
-def create_grid(units, colors):
-
-    data = []
-    for key, value in units.items():
-        value['name'] = key
-        data.append(value)
-    df = pd.DataFrame.from_dict(data)
+def style_grid(colors):
 
-    df_colors = pd.DataFrame(list( zip( colors.keys(), colors.values() ) ), columns=['type', 'color']) 
-    df = df.merge(df_colors, on=['type'])
-    data = df.to_dict('records')
-    
     getRowStyle = {
         'styleConditions': [
             {
-                'condition': f"params.data.name == '{unit['name']}'",
-                'style': {'color': unit['color']},
-            } for unit in data
+                'condition': f"params.data.type == '{kind}'",
+                'style': {'color': color},
+            } for kind, color in colors.items()
         ] 
     }
 
-    return data, getRowStyle
+    return getRowStyle
 
 
 @callback(
@@ -141,51 +293,75 @@ def delete_annotations(click):
     return patched_figure 
 
 
+def map_trace(kind, units, color):
+    """ Markers of all units of one type, sized by power. """
+
+    names = [ name for name, unit in units.items() if unit['type'] == kind ]
+
+    return go.Scattergeo(
+        lon = [ units[name]['lon'] for name in names ],
+        lat = [ units[name]['lat'] for name in names ],
+        text = names,
+        mode = 'markers',
+        name = '',
+        customdata=[ units[name]['power'] for name in names ],
+        showlegend=False,
+        hovertemplate='%{text} : %{customdata} MW',
+        marker = dict(
+            size = [ units[name]['power']/10 for name in names ],
+            opacity = 0.6,
+            reversescale = True,
+            autocolorscale = False,
+            symbol = 'circle',
+            color = color,
+            line = dict(
+                width=1,
+                color='black',
+                ),
+            )
+        )
+
+
+def map_tolerance(scale=1):
+    """ Border level for the map at a zoom scale. """
+
+    return border_tolerance(( max_lon - min_lon ) / ( scale * MAP_WIDTH ))
+
+
+def map_point(units, name):
+    """ Trace and point index of a unit on the map: one trace per unit type, points in the order of units. """
+
+    kind = units[name]['type']
+    point = [ key for key, unit in units.items() if unit['type'] == kind ].index(name)
+
+    return input.unit_types.index(kind), point
+
+
 @callback(
     Output('id-graph-map', 'figure'),
-    Input('id-store-units', 'data'),
-    Input('id-store-colors', 'data')
+    Output('id-store-border-level', 'data'),
+    Input('id-store-session', 'data'),
+    State('id-store-colors', 'data')
 )
-def generate_graph_map(units, colors):
+def generate_graph_map(session, colors):
 
+    units = session_units(session)
+
+    # Built once per page load; unit and color changes are sent as Patch of the affected points
     fig = go.Figure()
-    for unit in units.keys():
-        kind = units[unit]['type']
-        fig.add_trace(
-            go.Scattergeo(
-            lon = [units[unit]['lon']],
-            lat = [units[unit]['lat']],
-            text = [unit],
-            mode = 'markers',
-            name = '',
-            customdata=[units[unit]['power']],
-            showlegend=False,
-            hovertemplate='%{text} : %{customdata} MW',
-            marker = dict(
-                size = units[unit]['power']/10,
-                opacity = 0.6,
-                reversescale = True,
-                autocolorscale = False,
-                symbol = 'circle',
-                color = colors[kind],
-                line = dict(
-                    width=1,
-                    color='black',
-                    ),
-                )
-            )
-        )
+    for kind in input.unit_types:
+        fig.add_trace(map_trace(kind, units, colors[kind]))
 
+    tolerance = map_tolerance()
     fig.add_trace(
         go.Scattergeo(
-            lon=[ ele[0] for ele in input.texas_boundaries ],
-            lat=[ ele[1] for ele in input.texas_boundaries ],
+            lon=BORDER_LEVELS[tolerance]['lon'],
+            lat=BORDER_LEVELS[tolerance]['lat'],
             line_color='brown',
             line_width=2,
             mode='lines',
             showlegend=False,
             hoverinfo='none',
-            text=[ 'border' for _ in input.texas_boundaries ],
         ))
 
     fig.update_layout(
@@ -208,38 +384,134 @@ def generate_graph_map(units, colors):
         )
     fig.add_annotation(x=0, y=0, text='', showarrow=False)
     
-    return fig
+    return fig, tolerance
+
+
+@callback(
+    Output('id-graph-map', 'figure', allow_duplicate=True),
+    Output('id-store-border-level', 'data', allow_duplicate=True),
+    Input('id-graph-map', 'relayoutData'),
+    State('id-store-border-level', 'data'),
+    prevent_initial_call=True
+)
+def zoom_border(relayout, level):
+
+    if not relayout or 'geo.projection.scale' not in relayout:
+        raise PreventUpdate
+
+    # Border is only sent again when the zoom calls for another level
+    tolerance = map_tolerance(relayout['geo.projection.scale'])
+    if tolerance == level:
+        raise PreventUpdate
+
+    patched_figure = Patch()
+    patched_figure['data'][BORDER_TRACE]['lon'] = BORDER_LEVELS[tolerance]['lon']
+    patched_figure['data'][BORDER_TRACE]['lat'] = BORDER_LEVELS[tolerance]['lat']
+
+    return patched_figure, tolerance
+
+
+def chart_groups(units, names, mode, focus=None):
+    """ Rows of the results matrix per chart trace: { 'name', 'kind', 'rows' }, bottom of the stack first.
+
+    Modes: 'units' one trace per unit in merit order, 'type' one per unit type, 'merit'
+    plants in MERIT_BANDS bands of variable cost and other units by type. focus is
+    { 'mode', 'name' } of a group, whose units are then shown one by one.
+    """
+
+    from uc_model import PLANT_TYPES
+
+    rows = [ i for i, name in enumerate(names) if name in units ]
+    if focus is not None:
+        group = next(( group for group in chart_groups(units, names, focus['mode']) if group['name'] == focus['name'] ), None)
+        rows = group['rows'] if group else []
+        mode = 'units'
+
+    rows = sorted(rows, key=lambda i: units[names[i]]['vc'])
+
+    if mode == 'units':
+        return [ { 'name': names[i], 'kind': units[names[i]]['type'], 'rows': [ i ] } for i in rows ]
+
+    groups = {}
+    plants = [ i for i in rows if units[names[i]]['type'] in PLANT_TYPES ]
+    for i in rows:
+        kind = units[names[i]]['type']
+        if mode == 'merit' and kind in PLANT_TYPES:
+            band = plants.index(i) * MERIT_BANDS // len(plants)
+            groups.setdefault(( f'Merit band {band + 1}', None ), []).append(i)
+        else:
+            groups.setdefault(( kind.title(), kind ), []).append(i)
+
+    return [ { 'name': name, 'kind': kind, 'rows': group } for ( name, kind ), group in groups.items() ]
+
+
+def chart_mode(mode, n_units):
+
+    if mode == 'auto':
+        return 'units' if n_units <= MAX_UNIT_TRACES else 'type'
+
+    return mode
+
+
+def downsample_hours(power, max_hours=MAX_CHART_HOURS):
+    """ Hours kept of a long horizon: in each bucket the hours of lowest and highest total output.
+
+    Returns the kept columns, their x position and width (two half buckets per bucket)
+    and the hour numbers; horizons up to max_hours are kept whole.
+    """
+
+    n_hours = power.shape[1]
+    if n_hours <= max_hours:
+        return np.arange(n_hours), np.arange(1, n_hours + 1), 1
+
+    size = math.ceil(2 * n_hours / max_hours)
+    total = np.clip(power, 0, None).sum(axis=0)
+    columns = []
+    for start in range(0, n_hours, size):
+        bucket = total[start:start + size]
+        columns += [ start + int(np.argmin(bucket)), start + int(np.argmax(bucket)) ]
+
+    starts = np.repeat(np.arange(0, n_hours, size), 2)
+    x = starts + 0.5 + np.tile([ 0.25, 0.75 ], len(starts) // 2) * size
+
+    return np.array(columns), x, size / 2
 
 
 @callback(
     Output('id-graph-commitment', 'figure'),
+    Output('id-store-chart-groups', 'data'),
     Input('id-store-results', 'data'),
-    Input('id-store-colors', 'data'),
-    State('id-store-units', 'data'),
+    Input('id-select-chart-mode', 'value'),
+    Input('id-store-chart-focus', 'data'),
+    State('id-store-colors', 'data'),
+    State('id-store-session', 'data'),
 )
-def generate_graph_results(results, colors, units):
+def generate_graph_results(results, mode, focus, colors, session):
 
-    sorted_units = sorted( units.items(), key=lambda x: x[1]['vc'])
-    sorted_units = dict(sorted_units).keys()
+    units = session_units(session)
 
     fig = go.Figure()
-    for unit in sorted_units:
-        if results is None:
-            break
-        if unit not in results.keys():
-            continue
-
-        x = results[unit].keys()  # each hour
-        y = results[unit].values()  # each hour
-        kind = units[unit]['type']
+    groups = []
+    if results is not None:
+        results = decode_results(results)
+        mode = chart_mode(mode, len(results['units']))
+        groups = chart_groups(units, results['units'], mode, focus)
+        columns, x, width = downsample_hours(results['power'])
+        hours = np.asarray(results['hours'])[columns]
+
+    for i, group in enumerate(groups):
+        y = results['power'][group['rows']][:, columns].sum(axis=0).round(2)
+        color = colors[group['kind']] if group['kind'] else BAND_COLORS[i % len(BAND_COLORS)]
 
         fig.add_trace(
             go.Bar(
-                x=list(x),
-                y=list(y),
-                name=unit,
-                marker=dict(color=colors[kind], opacity=0.6, line=dict(width=0.5, color='black')),
-                hovertemplate='Power: %{y} MW',
+                x=x,
+                y=y,
+                width=width,
+                name=group['name'],
+                customdata=hours,
+                marker=dict(color=color, opacity=0.6, line=dict(width=0.5, color='black')),
+                hovertemplate='%{fullData.name}, hour %{customdata}: %{y} MW<extra></extra>',
                 showlegend=False
             )
         )
@@ -274,45 +546,120 @@ def generate_graph_results(results, colors, units):
             y=0.5, 
             showarrow=False
             )
+    elif focus is not None:
+        fig.add_annotation(
+            text=f"{focus['name']}: double click to go back",
+            xref='paper', 
+            yref='paper',
+            x=0.01, 
+            y=0.99, 
+            showarrow=False
+            )
     
-    return fig
+    # Traces of the figure, for drill down and color changes
+    chart = {
+        'mode': mode,
+        'groups': [ { 'name': group['name'], 'kind': group['kind'], 'size': len(group['rows']) } for group in groups ],
+    }
+
+    return fig, chart
+
+
+@callback(
+    Output('id-store-chart-focus', 'data'),
+    Input('id-graph-commitment', 'clickData'),
+    Input('id-graph-commitment', 'relayoutData'),
+    Input('id-select-chart-mode', 'value'),
+    State('id-store-chart-groups', 'data'),
+    State('id-store-chart-focus', 'data'),
+    prevent_initial_call=True
+)
+def drill_chart(click, relayout, mode, chart, focus):
+
+    # Double click resets the axes, which comes as autorange in relayoutData
+    trigger = ctx.triggered[0]['prop_id']
+    if trigger == 'id-select-chart-mode.value' or ( trigger == 'id-graph-commitment.relayoutData' and 'xaxis.autorange' in ( relayout or {} ) ):
+        return None if focus is not None else no_update
+
+    if trigger != 'id-graph-commitment.clickData' or click is None or focus is not None:
+        raise PreventUpdate
+
+    group = chart['groups'][click['points'][0]['curveNumber']]
+    if group['size'] < 2:
+        raise PreventUpdate
+
+    return { 'mode': chart['mode'], 'name': group['name'] }
+
+
+@callback(
+    Output('id-graph-commitment', 'figure', allow_duplicate=True),
+    Input('id-store-colors', 'data'),
+    State('id-store-chart-groups', 'data'),
+    prevent_initial_call=True
+)
+def recolor_graph_results(colors, chart):
+
+    patched_figure = Patch()
+    for i, group in enumerate(chart['groups'] if chart else []):
+        if group['kind'] is not None:
+            patched_figure['data'][i]['marker']['color'] = colors[group['kind']]
+
+    return patched_figure
 
 
 @callback(
     Output('id-modal-update-delete-unit', 'is_open', allow_duplicate=True),
     Output('id-store-units', 'data', allow_duplicate=True), 
     Output('id-alert-container', 'children', allow_duplicate=True),
+    Output('id-graph-map', 'figure', allow_duplicate=True),
+    Output('id-table', 'rowTransaction', allow_duplicate=True),
     Input('id-button-delete', 'n_clicks'),
-    State('id-store-units', 'data'), 
+    State('id-store-session', 'data'), 
+    State('id-store-units', 'data'),
     State('id-modal-update-delete-unit-header', 'children'),
     State('id-alert-container', 'children'),
     prevent_initial_call=True
 )
-def delete_unit(click, data, name, alerts):
+def delete_unit(click, session, version, name, alerts):
 
-    del data[name]
+    try:
+        units = unit_store().units(session, version)
+        version = unit_store().delete(session, name, version)
+    except StaleSession:
+        return False, no_update, stale_session_alerts(alerts), no_update, no_update
+
+    trace, point = map_point(units, name)
+    patched_figure = Patch()
+    for key in [ 'lon', 'lat', 'text', 'customdata' ]:
+        del patched_figure['data'][trace][key][point]
+    del patched_figure['data'][trace]['marker']['size'][point]
 
     msg = f'Deleted unit: {name}'
     color = 'info'
     alerts = make_alerts(alerts, msg, color)
 
-    return False, data, alerts
+    return False, version, alerts, patched_figure, { 'remove': [ { 'name': name } ] }
 
 
 @callback(
     Output('id-modal-update-delete-unit', 'is_open', allow_duplicate=True),
     Output('id-store-units', 'data', allow_duplicate=True), 
+    Output('id-graph-map', 'figure', allow_duplicate=True),
+    Output('id-table', 'rowTransaction', allow_duplicate=True),
+    Output('id-alert-container', 'children', allow_duplicate=True),
     Input('id-button-update', 'n_clicks'),
-    State('id-store-units', 'data'), 
+    State('id-store-session', 'data'), 
+    State('id-store-units', 'data'),
     State('id-modal-update-delete-unit-header', 'children'),
     State('id-input-update-power', 'value'),
     State('id-input-update-vc', 'value'),
     State('id-input-update-lat', 'value'),
     State('id-input-update-lon', 'value'),
     State('id-input-update-ramp', 'value'),
+    State('id-alert-container', 'children'),
     prevent_initial_call=True
 )
-def update_unit(click, data, name, power, vc, lat, lon, ramp):
+def update_unit(click, session, version, name, power, vc, lat, lon, ramp, alerts):
 
     # Error handling
     def check_pos_number(new_value, old_value):
@@ -322,13 +669,26 @@ def update_unit(click, data, name, power, vc, lat, lon, ramp):
             value = old_value
         return value
 
-    data[name]['power'] = check_pos_number(power, data[name]['power'])
-    data[name]['vc'] = check_pos_number(vc, data[name]['vc'])
-    data[name]['lat'] = lat
-    data[name]['lon'] = lon
-    data[name]['ramp'] = check_pos_number(ramp, data[name]['ramp'])
+    try:
+        data = unit_store().units(session, version)
+        data[name] = dict(data[name])
+        data[name]['power'] = check_pos_number(power, data[name]['power'])
+        data[name]['vc'] = check_pos_number(vc, data[name]['vc'])
+        data[name]['lat'] = lat
+        data[name]['lon'] = lon
+        data[name]['ramp'] = check_pos_number(ramp, data[name]['ramp'])
+        version = unit_store().put(session, name, data[name], version)
+    except StaleSession:
+        return False, no_update, no_update, no_update, stale_session_alerts(alerts)
+
+    trace, point = map_point(data, name)
+    patched_figure = Patch()
+    patched_figure['data'][trace]['lon'][point] = data[name]['lon']
+    patched_figure['data'][trace]['lat'][point] = data[name]['lat']
+    patched_figure['data'][trace]['customdata'][point] = data[name]['power']
+    patched_figure['data'][trace]['marker']['size'][point] = data[name]['power']/10
 
-    return False, data
+    return False, version, patched_figure, { 'update': [ grid_row(data, name) ] }, no_update
 
 
 @callback(
@@ -336,8 +696,12 @@ def update_unit(click, data, name, power, vc, lat, lon, ramp):
     Output('id-store-units', 'data', allow_duplicate=True), 
     Output('id-graph-map', 'clickData', allow_duplicate=True),
     Output('id-input-create-name', 'value', allow_duplicate=True),
+    Output('id-graph-map', 'figure', allow_duplicate=True),
+    Output('id-table', 'rowTransaction', allow_duplicate=True),
+    Output('id-alert-container', 'children', allow_duplicate=True),
     Input('id-button-create', 'n_clicks'),
-    State('id-store-units', 'data'), 
+    State('id-store-session', 'data'), 
+    State('id-store-units', 'data'),
     State('id-input-create-name', 'value'),
     State('id-input-create-type', 'value'),
     State('id-input-create-power', 'value'),
@@ -345,9 +709,10 @@ def update_unit(click, data, name, power, vc, lat, lon, ramp):
     State('id-input-create-lat', 'value'),
     State('id-input-create-lon', 'value'),
     State('id-input-create-ramp', 'value'),
+    State('id-alert-container', 'children'),
     prevent_initial_call=True
 )
-def create_unit(click, data, name, kind, power, vc, lat, lon, ramp):
+def create_unit(click, session, version, name, kind, power, vc, lat, lon, ramp, alerts):
 
     # Error handling
     def check_pos_number(new_value, default_value=0):
@@ -365,20 +730,31 @@ def create_unit(click, data, name, kind, power, vc, lat, lon, ramp):
         'vc': check_pos_number(vc), 
         'ramp': check_pos_number(ramp), 
     }
-    data[name] = new_unit
+    try:
+        version = unit_store().put(session, name, new_unit, version)
+        data = unit_store().units(session, version)
+    except StaleSession:
+        return False, no_update, None, no_update, no_update, no_update, stale_session_alerts(alerts)
+
+    # New units come last in their type, so their point is appended
+    trace, _ = map_point(data, name)
+    patched_figure = Patch()
+    for key, value in [ ( 'lon', lon ), ( 'lat', lat ), ( 'text', name ), ( 'customdata', new_unit['power'] ) ]:
+        patched_figure['data'][trace][key].append(value)
+    patched_figure['data'][trace]['marker']['size'].append(new_unit['power']/10)
     
-    return False, data, None, None
+    return False, version, None, None, patched_figure, { 'add': [ grid_row(data, name) ] }, no_update
 
 
 @callback(
     Output('id-button-create', 'disabled'),
     Input('id-input-create-name', 'value'),
-    State('id-store-units', 'data'), 
+    State('id-store-session', 'data'), 
     prevent_initial_call=True
 )
-def check_unit_name(text, data):
+def check_unit_name(text, session):
 
-    if text is None or len(text) < 3 or text in data.keys():
+    if text is None or len(text) < 3 or text in session_units(session):
         return True
     return False
 
@@ -393,17 +769,19 @@ def check_unit_name(text, data):
     Output('id-input-update-lon', 'value'),
     Output('id-input-update-ramp', 'value'),
     Input('id-graph-map', 'clickData'),
-    State('id-store-units', 'data'), 
+    State('id-store-session', 'data'), 
     prevent_initial_call=True
 )
-def open_modal_update_delete_unit(clickData, units):
+def open_modal_update_delete_unit(clickData, session):
     
     if clickData is None:
         raise PreventUpdate
-    if clickData['points'][0]['text'] == 'border':
+    # Border points carry no text in click data, only their trace
+    if clickData['points'][0]['curveNumber'] == BORDER_TRACE:
         raise PreventUpdate
 
     unit = clickData['points'][0]['text']
+    units = session_units(session)
     power = units[unit]['power']
     vc = units[unit]['vc']
     vc = 0 if np.isnan(vc) else vc
@@ -479,6 +857,7 @@ def open_modal_color_change(clicks, colors):
 @callback(
     Output('id-modal-change-color', 'is_open', allow_duplicate=True),
     Output('id-store-colors', 'data'),
+    Output('id-graph-map', 'figure', allow_duplicate=True),
     Input('id-button-change-color-save', 'n_clicks'),
     State('id-modal-change-color-unit-name', 'children'),
     State('id-color-picker', 'value'),
@@ -490,4 +869,7 @@ def save_color(click, unit, value, colors):
     color = value['hex']
     colors[unit] = color
 
-    return False, colors
+    patched_figure = Patch()
+    patched_figure['data'][input.unit_types.index(unit)]['marker']['color'] = color
+
+    return False, colors, patched_figure
@@ -4,6 +4,7 @@ import dash_ag_grid as dag
 
 import input
 import partials.modals as modals
+from unit_store import unit_store
 
 def layout():
     return dbc.Container([
@@ -21,9 +22,16 @@ def layout():
                 'top': '1rem'},
         ),
 
-        dcc.Store(id='id-store-units', data=input.units),
+        # Units are kept on the server by session (unit_store), the browser only holds their version
+        dcc.Store(id='id-store-units', data=0),
         dcc.Store(id='id-store-colors', data=input.units_colors),
         dcc.Store(id='id-store-results', data=None),
+        dcc.Store(id='id-store-session', data=unit_store().open()),
+        dcc.Store(id='id-store-job', data=None),
+        dcc.Store(id='id-store-border-level', data=None),
+        dcc.Store(id='id-store-chart-groups', data=None),
+        dcc.Store(id='id-store-chart-focus', data=None),
+        dcc.Interval(id='id-interval-job', interval=500, disabled=True),
 
         dbc.Container([
             # Row 1
@@ -56,6 +64,7 @@ def layout():
                                         { 'field': 'lon', 'type': 'numericColumn', 'editable': False, 'resizable': True},
                                         ],
                                     dashGridOptions={'pagination':True, 'paginationAutoPageSize': True, 'rowSelection':'single'},
+                                    getRowId='params.data.name',
                                     columnSize='responsiveSizeToFit',
                                     )
                                 ),
@@ -73,6 +82,20 @@ def layout():
                             html.H6('Change color of unit type:', className='my-3'),
                             html.Div(id='id-div-colors'),
                             html.H6('Calculate power grid:', className='my-3'),
+                            dbc.Row([
+                                dbc.Col(
+                                    dbc.InputGroup([
+                                        dbc.InputGroupText('Time limit [s]'),
+                                        dbc.Input(id='id-input-time-limit', type='number', min=1, placeholder='none'),
+                                        ], size='sm'),
+                                    ),
+                                dbc.Col(
+                                    dbc.InputGroup([
+                                        dbc.InputGroupText('MIP gap [%]'),
+                                        dbc.Input(id='id-input-mip-gap', type='number', min=0, step=0.01, placeholder='0.01'),
+                                        ], size='sm'),
+                                    ),
+                                ], className='g-2 mb-2'),
                             html.Div(
                                 dbc.Button([
                                         html.I(className='bi bi-power me-2'),
@@ -84,15 +107,33 @@ def layout():
                                     className='d-flex align-items-center'),
                                     className='d-grid gap-2'
                             ),
+                            html.Div([
+                                html.Small(id='id-div-job-status', className='text-muted'),
+                                dbc.Button('Cancel', id='id-button-cancel', size='sm', outline=True, color='danger', disabled=True),
+                                ], className='d-flex justify-content-between align-items-center mt-2'),
                             html.H6('Daily costs of running power grid:', className='my-3'),
                             dcc.Loading(html.Div('---', id='id-div-results')),
+                            html.Small(id='id-div-stats', className='text-muted mt-2'),
                         ]), className='mb-2 shadow-box'
                     ), xxl=4, className='mb-2', style={'display': 'grid'}
                 ),
                 dbc.Col([
                     dbc.Card(
                         dbc.CardBody([
-                            html.H5('Unit commitment results'),
+                            html.Div([
+                                html.H5('Unit commitment results'),
+                                dbc.RadioItems(
+                                    id='id-select-chart-mode',
+                                    options=[
+                                        {'label': 'Auto', 'value': 'auto'},
+                                        {'label': 'Units', 'value': 'units'},
+                                        {'label': 'Type', 'value': 'type'},
+                                        {'label': 'Merit bands', 'value': 'merit'},
+                                        ],
+                                    value='auto',
+                                    inline=True,
+                                    className='small'),
+                                ], className='d-flex justify-content-between align-items-center'),
 
                             dcc.Graph(
                                 id='id-graph-commitment', 
@@ -0,0 +1,176 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+
+# Profiles of demand sources, wind and pv farms, by type
+PROFILE_KEYS = ['demand', 'wind', 'pv']
+PROFILE_FORMATS = ['.csv', '.parquet', '.npy']
+
+# Rows read from a CSV or Parquet file at once while it is converted
+CHUNK_ROWS = 100_000
+
+# Files read into memory where no cache could be written, { path: ( modified, data ) }
+_memory_cache = {}
+
+
+def profile_cache(path):
+    """ .npy file holding the numeric columns of a CSV or Parquet file for memory mapping.
+
+    In the PROFILE_CACHE_DIR directory if it is set, else next to the file.
+    """
+
+    load_dotenv()
+    directory = os.environ.get('PROFILE_CACHE_DIR')
+    if not directory:
+        return f'{path}.npy'
+
+    # Files of one name in different directories get caches of their own
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12]
+    return os.path.join(directory, f'{os.path.basename(path)}.{digest}.npy')
+
+
+def csv_source(path, chunk_rows):
+    """ Rows and columns of a CSV file, and its rows in chunks of data frames. """
+
+    import pandas as pd
+
+    # Counted by the parser that reads them, which skips blank lines
+    rows = sum( len(chunk) for chunk in pd.read_csv(path, usecols=[ 0 ], chunksize=chunk_rows) )
+    columns = list(pd.read_csv(path, nrows=0).columns)
+
+    return rows, columns, pd.read_csv(path, chunksize=chunk_rows)
+
+
+def parquet_source(path, chunk_rows):
+    """ Rows and columns of a Parquet file, and its rows in chunks of data frames. """
+
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('Parquet profiles need pyarrow: pip install pyarrow') from None
+
+    file = pq.ParquetFile(path)
+
+    return file.metadata.num_rows, file.schema_arrow.names, ( batch.to_pandas() for batch in file.iter_batches(batch_size=chunk_rows) )
+
+
+def read_columns(path, chunk_rows, allocate):
+    """ Numeric columns of a CSV or Parquet file read chunk by chunk into allocate(dtype, rows).
+
+    One float64 field per column, rows of hours one after the other, so a window of hours
+    is one contiguous block of the array.
+    """
+
+    source = parquet_source if path.lower().endswith('.parquet') else csv_source
+    rows, columns, chunks = source(path, chunk_rows)
+
+    data, names, start = None, None, 0
+    for chunk in chunks:
+        if data is None:
+            # Timestamps and other labels are left out
+            names = [ name for name in columns if np.issubdtype(chunk[name].dtype, np.number) ]
+            data = allocate([ ( name, 'f8' ) for name in names ], rows)
+        for name in names:
+            data[name][start:start + len(chunk)] = chunk[name].to_numpy(dtype=float)
+        start += len(chunk)
+
+    if data is None:
+        raise ValueError(f'No profile rows in {path}.')
+    if start != rows:
+        raise ValueError(f'Read {start} of {rows} profile rows of {path}.')
+
+    return data
+
+
+def convert(path, chunk_rows=CHUNK_ROWS):
+    """ Numeric columns of a CSV or Parquet file written into its .npy cache (profile_cache).
+
+    The cache is written again when the file is newer. Raises OSError where it cannot be
+    written, e.g. next to the file of a read-only install.
+    """
+
+    cache = profile_cache(path)
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        return cache
+
+    os.makedirs(os.path.dirname(cache) or '.', exist_ok=True)
+    partial = f'{cache}.partial'
+    try:
+        data = read_columns(path, chunk_rows, lambda dtype, rows: np.lib.format.open_memmap(partial, mode='w+', dtype=dtype, shape=( rows, )))
+        data.flush()
+        del data
+        os.replace(partial, cache)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    return cache
+
+
+def memory_profiles(path, chunk_rows=CHUNK_ROWS):
+    """ Numeric columns of a CSV or Parquet file read into memory, once per version of the file. """
+
+    modified = os.path.getmtime(path)
+    cached = _memory_cache.get(path)
+    if cached is None or cached[0] != modified:
+        data = read_columns(path, chunk_rows, lambda dtype, rows: np.empty(rows, dtype=dtype))
+        data.flags.writeable = False
+        _memory_cache[path] = cached = ( modified, data )
+
+    return cached[1]
+
+
+def load_profiles(path, chunk_rows=CHUNK_ROWS):
+    """ Profiles of a CSV, Parquet or .npy file as read-only memory-mapped columns, { column: hours }.
+
+    demand, wind and pv columns are the profiles of their unit types; a column named after
+    a unit is its own profile instead (see uc_model.unit_profile). A CSV or Parquet file is
+    converted to a .npy cache once (convert), and a .npy file is either a structured array
+    of named columns or a 2-D array of demand, wind and pv columns.
+
+    Nothing is read until it is sliced: the model builder and rolling_horizon only take the
+    hours of their window, so memory does not grow with the length of the file. Where no
+    cache can be written, the columns are read into memory instead (memory_profiles).
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in PROFILE_FORMATS:
+        raise ValueError(f'Unknown profile file format: {extension}. Use one of {PROFILE_FORMATS}.')
+
+    if extension == '.npy':
+        data = np.load(path, mmap_mode='r')
+    else:
+        try:
+            data = np.load(convert(path, chunk_rows), mmap_mode='r')
+        except OSError:
+            # A read-only directory, or no room for the cache
+            data = memory_profiles(path, chunk_rows)
+    if data.dtype.names is not None:
+        profiles = { name: data[name] for name in data.dtype.names }
+    elif data.ndim == 2 and data.shape[1] == len(PROFILE_KEYS):
+        profiles = { key: data[:, i] for i, key in enumerate(PROFILE_KEYS) }
+    else:
+        raise ValueError(f'Profiles of {path} have to be named columns or {len(PROFILE_KEYS)} columns of {PROFILE_KEYS}, got shape {data.shape}.')
+
+    missing = [ key for key in PROFILE_KEYS if key not in profiles ]
+    if missing:
+        raise ValueError(f'Profiles of {path} miss columns {missing}.')
+
+    return profiles
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Convert a CSV or Parquet profile file to its memory-mapped .npy cache.')
+    parser.add_argument('path', help='CSV, Parquet or .npy file')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.path, args.chunk_rows)
+    own = [ name for name in profiles if name not in PROFILE_KEYS ]
+    print(f'{len(profiles["demand"])} hours of {PROFILE_KEYS} and {len(own)} unit profiles')
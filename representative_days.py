@@ -0,0 +1,266 @@
+import argparse
+import time
+
+import numpy as np
+import pyomo.environ as pyo
+from dotenv import load_dotenv
+
+import input
+from uc_model import PROFILE_KEYS, cluster_row_plants, MIN_POWER, BATTERY_EFF, BATTERY_LOAD_TIME, START_UP_COST, build_model, solve_model, split_units, installed_profile, net_demand, var_grid, linear_rows, grid_rule
+
+
+DAY = 24  # hours
+
+
+def day_features(units, profiles):
+    """ Demand, wind and pv of each day in MW, as days x (3 * DAY) rows; installed power weighs the profiles. """
+
+    _, demand_sources, wind_farms, pv_farms, _ = split_units(units)
+    days = len(profiles['demand']) // DAY
+    if days * DAY != len(profiles['demand']):
+        raise ValueError(f'Profiles have to cover whole days of {DAY} hours, got {len(profiles["demand"])}.')
+
+    return np.hstack([ installed_profile(farms, profiles, key).reshape(days, DAY) for farms, key in zip([ demand_sources, wind_farms, pv_farms ], PROFILE_KEYS) ])
+
+
+def cluster_days(features, k, seed=0, iterations=50):
+    """ k-means of the days; per cluster its medoid (the real day closest to its centre) and size.
+
+    Returns (representative day indices, weights in days, cluster of each day).
+    """
+
+    days = len(features)
+    if k >= days:
+        return np.arange(days), np.ones(days), np.arange(days)
+
+    # k-means++ start
+    rng = np.random.default_rng(seed)
+    centres = features[[ rng.integers(days) ]]
+    while len(centres) < k:
+        distance = ( ( features[:, None, :] - centres[None, :, :] ) ** 2 ).sum(axis=2).min(axis=1)
+        centres = np.vstack([ centres, features[rng.choice(days, p=distance / distance.sum())] ])
+
+    for _ in range(iterations):
+        assignment = ( ( features[:, None, :] - centres[None, :, :] ) ** 2 ).sum(axis=2).argmin(axis=1)
+        moved = np.array([ features[assignment == c].mean(axis=0) if ( assignment == c ).any() else centres[c] for c in range(k) ])
+        if np.allclose(moved, centres):
+            break
+        centres = moved
+
+    clusters = [ c for c in range(k) if ( assignment == c ).any() ]
+    medoids = [ np.flatnonzero(assignment == c)[( ( features[assignment == c] - centres[c] ) ** 2 ).sum(axis=1).argmin()] for c in clusters ]
+    renumber = { c: i for i, c in enumerate(clusters) }
+
+    return np.array(medoids), np.array([ ( assignment == c ).sum() for c in clusters ], dtype=float), np.array([ renumber[c] for c in assignment ])
+
+
+def day_profiles(profiles, days):
+    """ Profiles of the given days, one after the other. """
+
+    return { key: np.concatenate([ np.asarray(values[day * DAY:( day + 1 ) * DAY], dtype=float) for day in days ]).tolist() for key, values in profiles.items() }
+
+
+def varied_days(profiles, days, seed=0):
+    """ Profiles of a day repeated over days, each with its own demand level, wind and sunshine. """
+
+    rng = np.random.default_rng(seed)
+    factors = { 'demand': rng.uniform(0.9, 1.05, days), 'wind': rng.uniform(0.5, 1.5, days), 'pv': rng.uniform(0.6, 1.1, days) }
+
+    return {
+        key: np.clip(np.outer(factors[key], np.asarray(values, dtype=float)), 0, None if key == 'demand' else 1).ravel().round(4).tolist()
+        for key, values in profiles.items()
+    }
+
+
+def link_days(model, sequence):
+    """ Make a model over consecutive representative days one of separate days, linked through the sequence they stand for.
+
+    Plants: hours within a day are as before; from the last hour of a day to the first of the
+    next day of the sequence, commitment, ramping and start-ups (each counted once, not
+    weighted) are constrained as between any two hours.
+    Batteries: volume within a day is relative to its start (b_volume); the state at the start
+    of each day of the sequence (b_state) follows the days before, and has to stay within
+    capacity at the lowest and highest volume of the day.
+    """
+
+    hours = list(model.hours)
+    names, b_names = list(model.plants), list(model.batteries)
+    days = range(len(hours) // DAY)
+    starts, ends = hours[::DAY], hours[DAY - 1::DAY]
+    transitions = range(len(sequence))
+
+    # ## Plants - between days of the sequence instead of consecutive representative days
+    for key in [ 'ramp_up', 'ramp_down', 'start_max', 'stop_max', 'ramp_start' ]:
+        for name in names:
+            for hour in starts[1:]:
+                # Not every plant has start and stop rows, see uc_model.cluster_row_plants
+                if ( name, hour ) in model.component(key):
+                    model.component(key)[name, hour].deactivate()
+    for name in names:
+        for first in starts:
+            model.start_up[name, first] = ( model.start[name, first], 0 )
+
+    model.transitions = pyo.Set(initialize=transitions)
+    model.day_start = pyo.Var(model.plants, model.transitions, domain=pyo.Integers)
+    model.day_start_p = pyo.Var(model.plants, model.transitions, domain=pyo.NonNegativeIntegers)
+    model.day_start_n = pyo.Var(model.plants, model.transitions, domain=pyo.NonPositiveIntegers)
+
+    def first(n):
+        return starts[sequence[n]]
+
+    def last(n):
+        return ends[sequence[n - 1]]
+
+    def on_before(m, name, n):
+        return m.plant_on_before[name] if n == 0 else m.on[name, last(n)]
+
+    def ramp_rule(rule):
+        return lambda m, name, n: pyo.Constraint.Skip if n == 0 else rule(m, name, n)
+
+    rowed = set(cluster_row_plants(model, names))
+
+    def cluster_rule(rule):
+        return ramp_rule(lambda m, name, n: rule(m, name, n) if name in rowed else pyo.Constraint.Skip)
+
+    model.day_start_up = pyo.Constraint(model.plants, model.transitions, rule=lambda m, name, n: m.day_start[name, n] == m.on[name, first(n)] - on_before(m, name, n))
+    model.day_start_partition = pyo.Constraint(model.plants, model.transitions, rule=lambda m, name, n: m.day_start[name, n] == m.day_start_p[name, n] + m.day_start_n[name, n])
+    model.day_ramp_up = pyo.Constraint(model.plants, model.transitions, rule=ramp_rule(lambda m, name, n: m.power[name, first(n)] - m.power[name, last(n)] <= m.plant_ramp[name] * m.on[name, first(n)]))
+    model.day_ramp_down = pyo.Constraint(model.plants, model.transitions, rule=ramp_rule(lambda m, name, n: m.power[name, first(n)] - m.power[name, last(n)] >= -m.plant_ramp[name] * m.on[name, last(n)]))
+    model.day_start_max = pyo.Constraint(model.plants, model.transitions, rule=cluster_rule(
+        lambda m, name, n: m.power[name, first(n)] - m.plant_power[name] * m.on[name, first(n)] + ( m.plant_power[name] - m.plant_ramp[name] ) * m.day_start_p[name, n] <= 0
+    ))
+    model.day_stop_max = pyo.Constraint(model.plants, model.transitions, rule=cluster_rule(
+        lambda m, name, n: m.power[name, last(n)] - m.plant_power[name] * m.on[name, last(n)] + ( m.plant_ramp[name] - m.plant_power[name] ) * m.day_start_n[name, n] <= 0
+    ))
+    model.day_ramp_start = pyo.Constraint(model.plants, model.transitions, rule=cluster_rule(
+        lambda m, name, n: ( MIN_POWER * m.plant_power[name] - m.plant_ramp[name] ) * ( m.day_start_p[name, n] - m.day_start_n[name, n] ) <= 0
+    ))
+    model.system_costs.expr = model.system_costs.expr + pyo.quicksum(
+        START_UP_COST * model.plant_power[name] * model.plant_vc[name] * model.day_start_p[name, n] for name in names for n in transitions
+    )
+
+    # ## Batteries - state carried through the sequence
+    for name in b_names:
+        for hour in hours:
+            # Below zero when the day starts charged
+            model.b_volume[name, hour].setlb(-BATTERY_LOAD_TIME * model.battery_power[name])
+            if not model.tighten:
+                model.volume_max[name, hour].deactivate()
+                model.volume_min[name, hour].deactivate()
+        for hour in starts:
+            model.volume_state[name, hour] = ( model.b_volume[name, hour] - BATTERY_EFF * model.b_load[name, hour] - model.b_reload[name, hour], 0 )
+
+    model.days = pyo.Set(initialize=days)
+    model.calendar_days = pyo.Set(initialize=range(len(sequence) + 1))
+    model.day_volume_min = pyo.Var(model.batteries, model.days, domain=pyo.NonPositiveReals)
+    model.day_volume_max = pyo.Var(model.batteries, model.days, domain=pyo.NonNegativeReals)
+    model.b_state = pyo.Var(model.batteries, model.calendar_days, domain=pyo.NonNegativeReals)
+
+    b_volume = var_grid(model.b_volume, b_names, hours)
+    day_of_hour = np.repeat(list(days), DAY)
+    low, high = [ var_grid(var, b_names, list(days))[:, day_of_hour] for var in [ model.day_volume_min, model.day_volume_max ] ]
+    every = slice(None)
+    model.day_volume_low = pyo.Constraint(model.batteries, model.hours, rule=grid_rule(b_names, hours, [ ( every, linear_rows([ ( 1, b_volume ), ( -1, low ) ], lower=0) ) ]))
+    model.day_volume_high = pyo.Constraint(model.batteries, model.hours, rule=grid_rule(b_names, hours, [ ( every, linear_rows([ ( 1, b_volume ), ( -1, high ) ], upper=0) ) ]))
+
+    def capacity(m, name):
+        return BATTERY_LOAD_TIME * m.battery_power[name]
+
+    model.b_state_start = pyo.Constraint(model.batteries, rule=lambda m, name: m.b_state[name, 0] == m.battery_start[name] * capacity(m, name))
+    model.b_state_next = pyo.Constraint(model.batteries, model.transitions, rule=lambda m, name, n: m.b_state[name, n + 1] == m.b_state[name, n] + m.b_volume[name, ends[sequence[n]]])
+    model.b_state_low = pyo.Constraint(model.batteries, model.transitions, rule=lambda m, name, n: m.b_state[name, n] + m.day_volume_min[name, sequence[n]] >= 0)
+    model.b_state_high = pyo.Constraint(model.batteries, model.transitions, rule=lambda m, name, n: m.b_state[name, n] + m.day_volume_max[name, sequence[n]] <= capacity(m, name))
+
+
+def representative_days(units, profiles, k, formulation=None, seed=0, dev=False, limits=None):
+    """ Solve long profiles through k representative days, weighted by the days each stands for.
+
+    Days are clustered on their demand, wind and pv; every cluster is represented by one of
+    its days, whose costs count as often as the cluster has days. Battery state is carried
+    through the full sequence of days. Larger k is closer to the full resolution, smaller k
+    is faster.
+
+    Returns { 'results', 'system_costs', 'days', 'weights', 'sequence', 'stats' } or False if
+    infeasible; results cover the full horizon, each day with the dispatch of its representative.
+    """
+
+    load_dotenv()
+
+    days, weights, sequence = cluster_days(day_features(units, profiles), k, seed)
+    model = build_model(units, day_profiles(profiles, days), formulation, weights=np.repeat(weights, DAY).tolist())
+    link_days(model, sequence)
+
+    model = solve_model(model, dev, limits=limits)
+    if not model:
+        return False
+
+    power = model.results['power'].reshape(len(model.results['units']), len(days), DAY)
+    results = {
+        'units': model.results['units'],
+        'hours': list(range(1, len(sequence) * DAY + 1)),
+        'power': power[:, sequence, :].reshape(len(model.results['units']), -1),
+    }
+
+    return {
+        'results': results,
+        'system_costs': pyo.value(model.system_costs),
+        'days': days.tolist(),
+        'weights': weights.tolist(),
+        'sequence': sequence.tolist(),
+        'stats': model.stats,
+    }
+
+
+def aggregation_error(units, profiles, ks, formulation=None, limits=None):
+    """ Cost and dispatch of k representative days against the full resolution, for each k.
+
+    Dispatch error is the mean absolute difference of unit power over all hours, relative to
+    mean net demand. Errors are against the full resolution solution as found, see its gap.
+    """
+
+    start = time.perf_counter()
+    full = build_model(units, profiles, formulation)
+    full = solve_model(full, limits=limits)
+    if not full:
+        raise RuntimeError('The full resolution model has no solution.')
+    full_s = time.perf_counter() - start
+    full_costs = pyo.value(full.system_costs)
+    scale = np.abs(net_demand(*split_units(units)[1:4], profiles)).mean()
+
+    report = [ { 'k': 'full', 'system_costs': full_costs, 'cost_error': 0, 'dispatch_error': 0, 'seconds': full_s, 'gap': full.gap } ]
+    for k in ks:
+        start = time.perf_counter()
+        solution = representative_days(units, profiles, k, formulation, limits=limits)
+        seconds = time.perf_counter() - start
+        if not solution:
+            report.append({ 'k': k, 'system_costs': None, 'cost_error': None, 'dispatch_error': None, 'seconds': seconds, 'gap': None })
+            continue
+        rows = [ solution['results']['units'].index(name) for name in full.results['units'] ]
+        report.append({
+            'k': k,
+            'system_costs': solution['system_costs'],
+            'cost_error': ( solution['system_costs'] - full_costs ) / full_costs,
+            'dispatch_error': float(np.abs(solution['results']['power'][rows] - full.results['power']).mean() / scale),
+            'seconds': seconds,
+            'gap': solution['stats']['gap'],
+        })
+
+    return report
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve many days through k representative days and compare with the full resolution.')
+    parser.add_argument('--days', type=int, default=14, help='days of input profiles, each with its own demand level, wind and sunshine')
+    parser.add_argument('--k', default='2,4,7', help='representative days, comma separated')
+    parser.add_argument('--time-limit', type=float, help='seconds per solve')
+    args = parser.parse_args()
+
+    profiles = varied_days(input.profiles, args.days)
+    report = aggregation_error(input.units, profiles, [ int(k) for k in args.k.split(',') ], limits={ 'time_limit': args.time_limit })
+    for row in report:
+        if row['system_costs'] is None:
+            print(f'k={row["k"]}: no solution, {row["seconds"]:.1f} s')
+        else:
+            gap = '' if row['gap'] is None else f', gap {row["gap"]:.2%}'
+            print(f'k={row["k"]}: {round(row["system_costs"], 0)} $, cost error {row["cost_error"]:+.2%}, dispatch error {row["dispatch_error"]:.2%}, {row["seconds"]:.1f} s{gap}')
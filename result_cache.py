@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import input
+from result_store import RESULT_FORMAT
+
+
+# Absolute slack on MIP gaps compared by within_gap
+GAP_TOLERANCE = 1e-9
+
+
+def scenario_key(units, profiles=None):
+    """ Canonical hash of everything a cached result depends on: units, profiles, model constants,
+    clustering tolerance (see clustering) and result format.
+
+    Only model attributes of units are hashed, so moving a unit on the map keeps the key.
+    Numbers are hashed as floats, so 180 and 180.0 give the same key.
+    """
+
+    # Solver stack is imported on first use, not when the web server starts
+    import uc_model
+    from clustering import cluster_tolerance
+
+    profiles = input.profiles if profiles is None else profiles
+
+    scenario = {
+        'units': {
+            name: { key: unit[key] if key == 'type' else float(unit[key]) for key in uc_model.MODEL_ATTRIBUTES }
+            for name, unit in units.items()
+        },
+        'profiles': { key: [ float(value) for value in values ] for key, values in profiles.items() },
+        'constants': { name: float(getattr(uc_model, name)) for name in uc_model.MODEL_CONSTANTS },
+        # Clustered solves may end elsewhere than per-unit ones
+        'cluster_tolerance': cluster_tolerance(),
+        'format': RESULT_FORMAT,
+    }
+    payload = json.dumps(scenario, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def within_gap(cached, mip_gap=None):
+    """ Whether a cached solution is as close to optimal as a solve with mip_gap would be.
+
+    Entries without a gap come from solves run to the default gap.
+    """
+
+    import uc_model
+
+    mip_gap = uc_model.solve_limits(mip_gap=mip_gap)['mip_gap']
+
+    # Solvers report proven optima with a gap of rounding size (HiGHS about 1e-16), not exactly 0
+    return cached.get('gap', 0) <= ( uc_model.DEFAULT_MIP_GAP if mip_gap is None else mip_gap ) + GAP_TOLERANCE
+
+
+class ResultCache:
+    """ Solve results keyed by scenario hash: bounded in-memory LRU over an optional disk tier. """
+
+    def __init__(self, max_size=128, directory=None):
+        self.max_size = max_size
+        self.directory = directory
+        self.counters = { 'hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0 }
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def get(self, key):
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['hits'] += 1
+                return self._memory[key]
+
+        if self.directory and os.path.exists(self._path(key)):
+            with open(self._path(key)) as file:
+                value = json.load(file)
+            with self._lock:
+                self._remember(key, value)
+                self.counters['disk_hits'] += 1
+            return value
+
+        with self._lock:
+            self.counters['misses'] += 1
+
+        return None
+
+    def put(self, key, value):
+
+        with self._lock:
+            self._remember(key, value)
+            self.counters['stores'] += 1
+
+        if self.directory:
+            # Written aside and renamed, so readers never see a partial file
+            handle, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'w') as file:
+                json.dump(value, file)
+            os.replace(tmp_path, self._path(key))
+
+    def stats(self):
+
+        with self._lock:
+            return { **self.counters, 'size': len(self._memory), 'max_size': self.max_size, 'directory': self.directory }
+
+
+def cached_solution(key, limits=None):
+    """ Solution of a scenario solved before, as ( results, system costs, stats ), or None.
+
+    Cached solutions have no stats, as nothing was built or solved for them. Solutions
+    further from optimal than limits ask for are solved again.
+    """
+
+    limits = limits or {}
+    cached = result_cache().get(key)
+    if cached is None or not within_gap(cached, limits.get('mip_gap')):
+        return None
+
+    return cached['results'], cached['system_costs'], None
+
+
+def cache_solution(key, solution):
+    """ Keep a solution of model_sessions.solve_session_model; solves that ended without a gap are not kept. """
+
+    results, system_costs, stats = solution
+    if stats['gap'] is not None:
+        result_cache().put(key, { 'results': results, 'system_costs': system_costs, 'gap': stats['gap'] })
+
+
+_cache = None
+
+
+def result_cache():
+    """ Process wide cache, sized by RESULT_CACHE_SIZE; RESULT_CACHE_DIR enables the disk tier. """
+
+    global _cache
+    if _cache is None:
+        load_dotenv()
+        _cache = ResultCache(
+            max_size=int(os.environ.get('RESULT_CACHE_SIZE', 128)),
+            directory=os.environ.get('RESULT_CACHE_DIR'),
+        )
+
+    return _cache
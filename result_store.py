@@ -0,0 +1,40 @@
+import base64
+import zlib
+
+import numpy as np
+
+
+# Part of the result cache key, so results cached in an older format are not read back
+RESULT_FORMAT = 2
+
+# float32 keeps the 2 decimals of results for all realistic unit powers, at half the size
+DTYPE = '<f4'
+
+
+def encode_results(results):
+    """ Results matrix of uc_model.extract_results as a compact JSON payload for dcc.Store.
+
+    Unit names and hours stay lists; power is one base64 string of zlib compressed
+    little-endian float32. Dispatch is full of zeros and units at their limits, so it
+    compresses several times over.
+    """
+
+    power = np.ascontiguousarray(results['power'], dtype=DTYPE)
+
+    return {
+        'units': list(results['units']),
+        'hours': [ int(hour) for hour in results['hours'] ],
+        'power': base64.b64encode(zlib.compress(power.tobytes())).decode('ascii'),
+    }
+
+
+def decode_results(payload):
+    """ Payload of encode_results back as { 'units', 'hours', 'power' } with a units x hours matrix. """
+
+    power = np.frombuffer(zlib.decompress(base64.b64decode(payload['power'])), dtype=DTYPE)
+
+    return {
+        'units': payload['units'],
+        'hours': payload['hours'],
+        'power': power.reshape(len(payload['units']), len(payload['hours'])),
+    }
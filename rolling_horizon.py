@@ -0,0 +1,162 @@
+import argparse
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+import input
+from uc_model import BATTERY_FORMULATIONS, PLANT_VARS, BATTERY_VARS, START_UP_COST, build_model, set_net_demand, set_initial_state, final_state, solve_model, split_units, unit_arrays
+
+
+def window_profiles(profiles, start, length):
+    """ Hours start to start + length of the profiles; of memory-mapped ones (profile_files) only those are read. """
+
+    return { key: list(values[start:start + length]) for key, values in profiles.items() }
+
+
+def tile_profiles(profiles, days):
+    """ Daily profiles repeated over given number of days. """
+
+    return { key: np.tile(np.asarray(values, dtype=float), days).tolist() for key, values in profiles.items() }
+
+
+def value_grid(var, names, hours):
+    """ Solved values of a (unit, hour) indexed Var as a float array of shape units x hours. """
+
+    values = [ var[name, hour].value for name in names for hour in hours ]
+
+    return np.array([ 0 if value is None else value for value in values ], dtype=float).reshape(len(names), len(hours))
+
+
+def hourly_costs(model):
+    """ System costs of a solved model split by hour; they sum up to the objective. """
+
+    hours = list(model.hours)
+    plants, _, _, _, batteries = split_units(model.units)
+    arrays = unit_arrays(plants, batteries)
+    names, b_names = list(plants), list(batteries)
+
+    def column(key):
+        return arrays[key][:, None]
+
+    costs = (
+        + column('count') * column('vc') * np.ones(( len(names), len(hours) ))
+        + column('slope_n') * value_grid(model.power_n, names, hours)
+        + column('slope_p') * value_grid(model.power_p, names, hours)
+        + START_UP_COST * column('p_max') * column('vc') * value_grid(model.start_p, names, hours)
+    ).sum(axis=0)
+
+    return costs + ( column('b_vc') * value_grid(model.b_load, b_names, hours) ).sum(axis=0)
+
+
+def shift_values(model, step):
+    """ Move solved values step hours back, so the overlap of the last window starts the next one. """
+
+    hours = list(model.hours)
+    variables = [ ( model.component(key), model.plants ) for key in PLANT_VARS ]
+    variables += [ ( model.component(key), model.batteries ) for key in BATTERY_VARS ]
+
+    for var, names in variables:
+        for name in names:
+            for hour, later in zip(hours, hours[step:]):
+                var[name, hour].set_value(var[name, later].value, skip_validation=True)
+
+    for name in model.batteries:
+        charging = model.battery_logic[name].component('charging')
+        if charging is not None:
+            for hour, later in zip(hours, hours[step:]):
+                charging[hour].set_value(charging[later].value, skip_validation=True)
+
+
+def rolling_horizon(units, profiles=None, window=48, step=24, formulation=None, dev=False):
+    """ Solve long profiles in overlapping windows of `window` hours, committing `step` hours of each.
+
+    Commitment, power (for ramping) and battery volume at the end of the committed hours are
+    the initial state of the next window. Windows of the same length share one model, only
+    its net demand and initial state Params change, and it starts from the shifted solution
+    of the window before. So memory and time per window do not grow with the horizon.
+
+    Returns { 'results', 'system_costs', 'windows' } or False if a window is infeasible;
+    results are a units x horizon matrix, as from uc_model.extract_results.
+    """
+
+    load_dotenv()
+
+    profiles = input.profiles if profiles is None else profiles
+    horizon = len(profiles['demand'])
+    if not 0 < step <= window:
+        raise ValueError(f'Step has to be between 1 and window ({window}) hours, got {step}.')
+
+    model, state = None, None
+    power, windows, system_costs = None, [], 0
+
+    for start in range(0, horizon, step):
+        length = min(window, horizon - start)
+        last = start + length >= horizon
+        commit = length if last else step
+        segment = window_profiles(profiles, start, length)
+
+        began = time.perf_counter()
+        if model is None or len(model.hours) != length:
+            # Dropped before the next one is built, so only one window model is alive
+            model = None
+            model = build_model(units, segment, formulation)
+        else:
+            model.profiles = segment
+            set_net_demand(model)
+            shift_values(model, step)
+        set_initial_state(model, state)
+        built = time.perf_counter()
+
+        if not solve_model(model, dev, warmstart=start > 0):
+            if dev:
+                print(f'Window starting in hour {start + 1} is infeasible')
+            return False
+
+        if power is None:
+            power = np.full(( len(model.results['units']), horizon ), np.nan)
+        power[:, start:start + commit] = model.results['power'][:, :commit]
+        hours = list(model.hours)[:commit]
+
+        costs = float(hourly_costs(model)[:commit].sum())
+        system_costs += costs
+        state = final_state(model, hours[-1])
+
+        windows.append({
+            'start': start + 1,
+            'hours': length,
+            'committed': commit,
+            'build_s': round(built - began, 3),
+            'solve_s': round(time.perf_counter() - built, 3),
+            'system_costs': round(costs, 2),
+        })
+
+        if last:
+            break
+
+    results = { 'units': model.results['units'], 'hours': list(range(1, horizon + 1)), 'power': power }
+
+    return { 'results': results, 'system_costs': system_costs, 'windows': windows }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Solve the input units over several days in rolling windows.')
+    parser.add_argument('--days', type=int, default=7, help='input profiles are repeated over days (up to 365)')
+    parser.add_argument('--window', type=int, default=48, help='hours solved at once')
+    parser.add_argument('--step', type=int, default=24, help='hours committed from each window')
+    parser.add_argument('--formulation', choices=BATTERY_FORMULATIONS)
+    parser.add_argument('--profiles', help='CSV, Parquet or .npy profile file, memory-mapped, instead of the repeated input profiles')
+    args = parser.parse_args()
+
+    if args.profiles:
+        from profile_files import load_profiles
+        profiles = load_profiles(args.profiles)
+    else:
+        profiles = tile_profiles(input.profiles, args.days)
+
+    solution = rolling_horizon(input.units, profiles, args.window, args.step, args.formulation)
+    if solution:
+        for row in solution['windows']:
+            print(row)
+        print(f"Cost of the system: {round(solution['system_costs'], 0)}")
@@ -0,0 +1,299 @@
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+from metrics import solve_metrics
+from result_cache import scenario_key, cached_solution, cache_solution
+
+
+# Finished jobs are kept for polling, oldest are dropped first
+MAX_FINISHED_JOBS = 256
+
+FINISHED = ['done', 'failed', 'cancelled']
+
+
+class Rejected(Exception):
+    """ Raised on submit when a solve is not admitted. """
+
+
+class QueueFull(Rejected):
+    """ Raised on submit when SOLVE_QUEUE_DEPTH jobs are already waiting. """
+
+
+class SessionBusy(Rejected):
+    """ Raised on submit when the session already has SESSION_SOLVES jobs queued or running. """
+
+
+def worker_main(connection):
+    """ Solve worker process: solves session models sent by the pool until it receives None.
+
+    Improving solutions found on the way are sent as 'incumbent' messages before the result.
+    """
+
+    # Own process group, so cancelling a job also stops the GLPK / CBC subprocess
+    if hasattr(os, 'setsid'):
+        os.setsid()
+
+    from model_sessions import solve_session_model
+
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+
+        job_id, session, units, limits = task
+        try:
+            on_incumbent = lambda progress: connection.send(( job_id, 'incumbent', progress ))
+            connection.send(( job_id, 'done', solve_session_model(session, units, limits=limits, on_incumbent=on_incumbent) ))
+        except Exception as error:
+            connection.send(( job_id, 'failed', repr(error) ))
+
+
+class SolvePool:
+    """ Queue of solve jobs run by long-lived worker processes, one solve per worker at a time.
+
+    Workers keep the session models of model_sessions, so a job goes preferably to a worker
+    which already served its session. Cancelling a running job kills its worker, which is
+    replaced by a fresh one.
+    """
+
+    def __init__(self, workers, queue_depth, session_solves=1):
+        self.max_workers = workers
+        self.queue_depth = queue_depth
+        self.session_solves = session_solves
+        self._context = multiprocessing.get_context('spawn')
+        self._jobs = OrderedDict()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._workers = []
+
+    def _start_process(self, worker):
+
+        connection, child = self._context.Pipe()
+        process = self._context.Process(target=worker_main, args=(child,), daemon=True)
+        process.start()
+        child.close()
+
+        worker.update(process=process, connection=connection, sessions=set())
+
+    def _start_workers(self):
+
+        while len(self._workers) < self.max_workers:
+            worker = { 'job': None }
+            self._start_process(worker)
+            self._workers.append(worker)
+            threading.Thread(target=self._serve, args=(worker,), daemon=True).start()
+
+    def _next_job(self, worker):
+
+        for job_id in self._queue:
+            if self._jobs[job_id]['session'] in worker['sessions']:
+                break
+        else:
+            job_id = self._queue[0] if self._queue else None
+
+        if job_id is not None:
+            self._queue.remove(job_id)
+
+        return job_id
+
+    def _forget_finished(self):
+
+        finished = [ job_id for job_id, job in self._jobs.items() if job['status'] in FINISHED ]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _serve(self, worker):
+
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job_id = self._next_job(worker)
+                job = self._jobs[job_id]
+                job.update(status='running', started=time.time())
+                worker['job'] = job_id
+
+            stopped = False
+            try:
+                if not worker['process'].is_alive():
+                    self._start_process(worker)
+                worker['connection'].send(( job_id, job['session'], job['units'], job['limits'] ))
+                _, status, payload = worker['connection'].recv()
+                while status == 'incumbent':
+                    with self._cond:
+                        job['incumbent'] = payload
+                    _, status, payload = worker['connection'].recv()
+            except (EOFError, OSError):
+                # Killed by cancel, or crashed
+                status, payload, stopped = 'failed', 'Solve worker stopped.', True
+
+            with self._cond:
+                worker['job'] = None
+                # A cancel may also have killed the process just after it sent its result
+                stopped = worker.pop('killed', False) or stopped
+
+            if stopped:
+                # Replaced before the next job, so it never goes to a killed process
+                worker['process'].join()
+                self._start_process(worker)
+
+            with self._cond:
+                if job['status'] == 'cancelled':
+                    continue
+
+                job.update(status=status, finished=time.time())
+                if status == 'done':
+                    job['solution'] = payload
+                    worker['sessions'].add(job['session'])
+                else:
+                    job['error'] = payload
+                self._forget_finished()
+
+            solve_metrics().observe_job(status, job['finished'] - job['submitted'])
+            if status == 'done' and payload:
+                solve_metrics().observe_stats(payload[2])
+                cache_solution(job['key'], payload)
+
+    def start(self):
+        """ Start the worker processes ahead of the first job, so it does not wait for their imports. """
+
+        with self._cond:
+            self._start_workers()
+
+    def submit(self, session, units, limits=None):
+        """ Queue a solve and return its job id; cached scenarios are done right away.
+
+        limits are the time limit and MIP gap of uc_model.solve_limits, env var defaults if None.
+        """
+
+        now = time.time()
+        limits = limits or {}
+        job = { 'session': session, 'units': units, 'limits': limits, 'key': scenario_key(units), 'status': 'queued', 'submitted': now }
+
+        cached = cached_solution(job['key'], limits)
+        if cached is not None:
+            job.update(status='done', started=now, finished=now, solution=cached)
+
+        job_id = uuid.uuid4().hex
+        with self._cond:
+            if job['status'] == 'queued':
+                active = sum( 1 for other in self._jobs.values() if other['session'] == session and other['status'] in [ 'queued', 'running' ] )
+                if active >= self.session_solves:
+                    solve_metrics().observe_rejected('session_limit')
+                    raise SessionBusy(f'{active} solves of the session are already queued or running.')
+                if len(self._queue) >= self.queue_depth:
+                    solve_metrics().observe_rejected('queue_full')
+                    raise QueueFull(f'{len(self._queue)} solves are already waiting.')
+                self._start_workers()
+                self._queue.append(job_id)
+                self._cond.notify_all()
+            self._jobs[job_id] = job
+
+        return job_id
+
+    def status(self, job_id):
+        """ Status, seconds spent queued or running so far, position in the queue and best solution so far.
+
+        The incumbent is { 'objective', 'bound', 'gap', 'elapsed' } of the solver, None until one is found.
+        """
+
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return { 'status': 'unknown', 'elapsed': 0, 'position': None }
+
+            end = job.get('finished', time.time())
+            position = self._queue.index(job_id) + 1 if job['status'] == 'queued' else None
+
+            return {
+                'status': job['status'],
+                'elapsed': end - job.get('started', job['submitted']),
+                'position': position,
+                'error': job.get('error'),
+                'incumbent': job.get('incumbent'),
+            }
+
+    def result(self, job_id):
+        """ (results, system costs, stats) of a finished job, None if infeasible or not finished.
+
+        Stats are None for solutions served from the cache.
+        """
+
+        with self._cond:
+            return self._jobs.get(job_id, {}).get('solution')
+
+    def cancel(self, job_id):
+
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in FINISHED:
+                return False
+
+            queued = job['status'] == 'queued'
+            job.update(status='cancelled', finished=time.time())
+            solve_metrics().observe_job('cancelled', job['finished'] - job['submitted'])
+
+            if queued:
+                self._queue.remove(job_id)
+                return True
+
+            # Killed holding the lock, while the worker is still on this job; _serve replaces it
+            worker = next(worker for worker in self._workers if worker['job'] == job_id)
+            worker['killed'] = True
+            try:
+                os.killpg(worker['process'].pid, signal.SIGKILL)
+            except (AttributeError, ProcessLookupError, PermissionError):
+                worker['process'].kill()
+
+        return True
+
+    def stats(self):
+
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'queue_depth': self.queue_depth,
+                'session_solves': self.session_solves,
+                'queued': len(self._queue),
+                'running': sum( 1 for worker in self._workers if worker['job'] is not None ),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def solve_pool():
+    """ Process wide pool; SOLVE_WORKERS caps concurrent solves, SOLVE_QUEUE_DEPTH waiting ones
+    and SESSION_SOLVES those of one session.
+
+    With SOLVE_SERVER set (multi-process serving), the pool of the solve server instead.
+    """
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            load_dotenv()
+            if os.environ.get('SOLVE_SERVER'):
+                from solve_server import solve_server
+                _pool = solve_server().solve_pool()
+            else:
+                _pool = local_solve_pool()
+
+    return _pool
+
+
+def local_solve_pool():
+
+    return SolvePool(
+        workers=int(os.environ.get('SOLVE_WORKERS', os.cpu_count() or 1)),
+        queue_depth=int(os.environ.get('SOLVE_QUEUE_DEPTH', 32)),
+        session_solves=int(os.environ.get('SESSION_SOLVES', 1)),
+    )
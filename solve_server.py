@@ -0,0 +1,68 @@
+import os
+import threading
+from multiprocessing.managers import BaseManager
+
+from dotenv import load_dotenv
+
+
+class SolveManager(BaseManager):
+    """ Solve pool, unit store and solve metrics of the solve server, shared by all web processes. """
+
+
+SERVED = ['solve_pool', 'unit_store', 'solve_metrics']
+
+for name in SERVED:
+    SolveManager.register(name)
+
+
+def server_address(value):
+    """ ( host, port ) of a SOLVE_SERVER value 'host:port'. """
+
+    host, port = value.rsplit(':', 1)
+
+    return host, int(port)
+
+
+def serve_solves(address, authkey):
+    """ Solve server process: one solve pool, unit store and metrics for all web processes.
+
+    Web processes only handle requests; model building and solving happen in the workers
+    of this pool, so a long solve does not hold the GIL of a process serving callbacks.
+    """
+
+    # Objects of this process, not proxies of the server to itself
+    os.environ.pop('SOLVE_SERVER', None)
+
+    from metrics import local_solve_metrics
+    from solve_jobs import local_solve_pool
+    from unit_store import local_unit_store
+
+    served = { 'solve_pool': local_solve_pool(), 'unit_store': local_unit_store(), 'solve_metrics': local_solve_metrics() }
+    for name, obj in served.items():
+        SolveManager.register(name, callable=lambda obj=obj: obj)
+
+    served['solve_pool'].start()
+    SolveManager(address=address, authkey=authkey).get_server().serve_forever()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def solve_server():
+    """ Connection to the solve server at SOLVE_SERVER ('host:port'), authenticated by SOLVE_SERVER_KEY. """
+
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            load_dotenv()
+            _manager = SolveManager(address=server_address(os.environ['SOLVE_SERVER']), authkey=os.environ['SOLVE_SERVER_KEY'].encode())
+            _manager.connect()
+
+    return _manager
+
+
+if __name__ == '__main__':
+    # Standalone solve server, e.g. on its own host; web processes get the same SOLVE_SERVER and key
+    load_dotenv()
+    serve_solves(server_address(os.environ['SOLVE_SERVER']), os.environ['SOLVE_SERVER_KEY'].encode())
@@ -0,0 +1,50 @@
+import threading
+
+from flask import Flask
+
+from admission import CALLBACK_PATH, register_admission
+from metrics import local_solve_metrics
+
+
+def overload_rejections():
+
+    line = next(( line for line in local_solve_metrics().render().splitlines() if line.startswith('uc_rejected_total{reason="overload"}') ), None)
+    return 0 if line is None else float(line.split()[-1])
+
+
+def test_callbacks_beyond_the_limit_get_429(monkeypatch):
+    monkeypatch.delenv('SOLVE_SERVER', raising=False)
+    server = Flask(__name__)
+    started, finish = threading.Event(), threading.Event()
+
+    @server.route(CALLBACK_PATH, methods=[ 'POST' ])
+    def slow_callback():
+        started.set()
+        finish.wait(10)
+        return 'done'
+
+    @server.route('/page')
+    def page():
+        return 'page'
+
+    register_admission(server, 1)
+    client = server.test_client()
+    rejected = overload_rejections()
+
+    first = {}
+    thread = threading.Thread(target=lambda: first.update(response=server.test_client().post(CALLBACK_PATH)))
+    thread.start()
+    assert started.wait(10)
+
+    second = client.post(CALLBACK_PATH)
+    assert second.status_code == 429 and second.headers['Retry-After'] == '1'
+    # Pages are served while callbacks take all slots
+    assert client.get('/page').status_code == 200
+
+    finish.set()
+    thread.join(10)
+    assert first['response'].status_code == 200
+    # The slot is released after the request
+    started.clear()
+    assert client.post(CALLBACK_PATH).status_code == 200
+    assert overload_rejections() == rejected + 1
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from dash.exceptions import PreventUpdate
+
+from borders import BORDER_LEVELS, BORDER_TOLERANCES, BOUNDARIES, border_arrays, border_tolerance, simplify
+
+
+def test_simplify_drops_points_within_tolerance():
+    points = [ [ 0, 0 ], [ 1, 0.01 ], [ 2, 0 ], [ 3, 1 ], [ 4, 0 ] ]
+
+    np.testing.assert_array_equal(simplify(points, 0.1), [ [ 0, 0 ], [ 2, 0 ], [ 3, 1 ], [ 4, 0 ] ])
+    np.testing.assert_array_equal(simplify(points, 0), points)
+
+
+def test_simplify_keeps_closed_rings():
+    ring = [ [ 0, 0 ], [ 1, 0 ], [ 1, 1 ], [ 0, 1 ], [ 0, 0 ] ]
+
+    assert len(simplify(ring, 0.1)) > 2
+
+
+def test_border_arrays_separate_boundaries_by_none():
+    arrays = border_arrays({ 'a': [ [ 0, 0 ], [ 1, 1 ] ], 'b': [ [ 2, 2 ], [ 3, 3 ] ] }, 0)
+
+    assert arrays == { 'lon': [ 0, 1, None, 2, 3 ], 'lat': [ 0, 1, None, 2, 3 ] }
+
+
+def test_levels_grow_finer_up_to_full_resolution():
+    sizes = [ len(BORDER_LEVELS[tolerance]['lon']) for tolerance in BORDER_TOLERANCES ]
+
+    assert sizes == sorted(sizes)
+    assert sizes[0] < sizes[-1] <= sum( len(points) for points in BOUNDARIES.values() ) + len(BOUNDARIES) - 1
+
+
+@pytest.mark.parametrize('degrees_per_pixel, tolerance', [ ( 1, 0.1 ), ( 0.1, 0.1 ), ( 0.05, 0.03 ), ( 0.02, 0.01 ), ( 0.001, 0 ) ])
+def test_border_tolerance_is_coarsest_below_a_pixel(degrees_per_pixel, tolerance):
+
+    assert border_tolerance(degrees_per_pixel) == tolerance
+
+
+def test_clicks_on_the_border_open_no_unit():
+    from pages.dashboard.callbacks import BORDER_TRACE, open_modal_update_delete_unit
+
+    click = { 'points': [ { 'curveNumber': BORDER_TRACE, 'pointNumber': 3, 'lon': -97.1, 'lat': 30.2 } ] }
+
+    with pytest.raises(PreventUpdate):
+        open_modal_update_delete_unit(click, None)
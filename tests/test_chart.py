@@ -0,0 +1,75 @@
+import numpy as np
+
+from pages.dashboard.callbacks import MAX_CHART_HOURS, MAX_UNIT_TRACES, MERIT_BANDS, chart_groups, chart_mode, downsample_hours
+
+
+UNITS = {
+    'Coal 1': { 'type': 'coal', 'vc': 3 },
+    'Gas 1': { 'type': 'gas', 'vc': 5 },
+    'Nuclear 1': { 'type': 'nuclear', 'vc': 1 },
+    'Wind 1': { 'type': 'wind', 'vc': 0 },
+    'Battery 1': { 'type': 'battery', 'vc': 0.5 },
+}
+NAMES = list(UNITS)
+
+
+def test_unit_groups_in_merit_order():
+    groups = chart_groups(UNITS, NAMES, 'units')
+
+    assert [ group['name'] for group in groups ] == [ 'Wind 1', 'Battery 1', 'Nuclear 1', 'Coal 1', 'Gas 1' ]
+    assert all( NAMES[group['rows'][0]] == group['name'] for group in groups )
+
+
+def test_type_groups_cover_every_row_once():
+    groups = chart_groups(UNITS, NAMES, 'type')
+
+    assert { group['kind'] for group in groups } == { 'coal', 'gas', 'nuclear', 'wind', 'battery' }
+    assert sorted( row for group in groups for row in group['rows'] ) == list(range(len(NAMES)))
+
+
+def test_merit_bands_hold_plants_only():
+    units = { f'Gas {i}': { 'type': 'gas', 'vc': i } for i in range(12) }
+    units['Wind 1'] = { 'type': 'wind', 'vc': 0 }
+
+    groups = chart_groups(units, list(units), 'merit')
+
+    bands = [ group for group in groups if group['kind'] is None ]
+    assert len(bands) == MERIT_BANDS
+    assert sum( len(group['rows']) for group in bands ) == 12
+    assert [ group['name'] for group in groups if group['kind'] is not None ] == [ 'Wind' ]
+
+
+def test_focus_shows_the_units_of_a_group():
+    groups = chart_groups(UNITS, NAMES, 'units', focus={ 'mode': 'type', 'name': 'Coal' })
+
+    assert [ group['name'] for group in groups ] == [ 'Coal 1' ]
+
+
+def test_auto_mode_switches_to_types_for_large_fleets():
+
+    assert chart_mode('auto', MAX_UNIT_TRACES) == 'units'
+    assert chart_mode('auto', MAX_UNIT_TRACES + 1) == 'type'
+    assert chart_mode('merit', 3) == 'merit'
+
+
+def test_short_horizons_are_kept_whole():
+    columns, x, width = downsample_hours(np.ones(( 2, 24 )))
+
+    np.testing.assert_array_equal(columns, np.arange(24))
+    np.testing.assert_array_equal(x, np.arange(1, 25))
+    assert width == 1
+
+
+def test_long_horizons_keep_lowest_and_highest_hour_of_each_bucket():
+    hours = 24 * 365
+    power = np.random.default_rng(0).uniform(0, 100, ( 3, hours ))
+    power[:, 1000] = 1000
+
+    columns, x, width = downsample_hours(power)
+
+    assert len(columns) <= MAX_CHART_HOURS + 2 and len(columns) == len(x)
+    assert 1000 in columns
+    total = power.sum(axis=0)
+    size = int(2 * width)
+    for start, low, high in zip(range(0, hours, size), columns[::2], columns[1::2]):
+        assert total[low] == total[start:start + size].min() and total[high] == total[start:start + size].max()
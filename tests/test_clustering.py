@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+from clustering import cluster_tolerance, cluster_units, expand_clusters
+from uc_model import cluster_row_plants
+
+
+UNITS = {
+    'Gas 1': { 'type': 'gas', 'vc': 4, 'power': 100, 'ramp': 50, 'lat': 30.0, 'lon': -97.0 },
+    'Gas 2': { 'type': 'gas', 'vc': 4, 'power': 100, 'ramp': 50, 'lat': 31.0, 'lon': -98.0 },
+    'Gas 3': { 'type': 'gas', 'vc': 4.1, 'power': 104, 'ramp': 50, 'lat': 32.0, 'lon': -99.0 },
+    'Coal 1': { 'type': 'coal', 'vc': 4, 'power': 100, 'ramp': 50, 'lat': 30.0, 'lon': -97.0 },
+    'Battery 1': { 'type': 'battery', 'vc': 0.5, 'power': 50, 'ramp': 0, 'lat': 30.0, 'lon': -97.0 },
+    'Battery 2': { 'type': 'battery', 'vc': 0.5, 'power': 50, 'ramp': 0, 'lat': 30.0, 'lon': -97.0 },
+    'Wind 1': { 'type': 'wind', 'vc': 0, 'power': 200, 'ramp': 0, 'lat': 30.0, 'lon': -97.0 },
+    'Wind 2': { 'type': 'wind', 'vc': 0, 'power': 200, 'ramp': 0, 'lat': 30.0, 'lon': -97.0 },
+}
+
+
+def test_identical_units_merge_at_zero_tolerance():
+    clustered = cluster_units(UNITS)
+
+    assert set(clustered) == { 'Gas 1 +1', 'Gas 3', 'Coal 1', 'Battery 1 +1', 'Wind 1', 'Wind 2' }
+    gas = clustered['Gas 1 +1']
+    assert ( gas['count'], gas['power'], gas['vc'], gas['ramp'] ) == ( 2, 100, 4, 50 )
+    assert list(gas['members']) == [ 'Gas 1', 'Gas 2' ]
+
+
+def test_batteries_sum_their_power():
+    battery = cluster_units(UNITS)['Battery 1 +1']
+
+    assert battery['power'] == 100 and 'count' not in battery
+
+
+def test_similar_plants_merge_within_tolerance():
+    gas = cluster_units(UNITS, tolerance=0.05)['Gas 1 +2']
+
+    assert gas['count'] == 3
+    assert gas['power'] == round(304 / 3, 6)
+    # Weighed by power
+    assert gas['vc'] == round(( 4 * 200 + 4.1 * 104 ) / 304, 6)
+    # In merit order
+    assert list(gas['members']) == [ 'Gas 1', 'Gas 2', 'Gas 3' ]
+
+
+def test_expand_clusters_restores_members():
+    clustered = cluster_units(UNITS)
+
+    expanded = expand_clusters(clustered, UNITS, [ 'Gas 1 +1' ])
+
+    assert 'Gas 1 +1' not in expanded and 'Battery 1 +1' in expanded
+    assert expanded['Gas 1'] == UNITS['Gas 1'] and expanded['Gas 2'] == UNITS['Gas 2']
+
+
+def test_cluster_tolerance_from_env(monkeypatch):
+    monkeypatch.delenv('CLUSTER_TOLERANCE', raising=False)
+    assert cluster_tolerance() is None
+    assert cluster_tolerance(0.2) == 0.2
+
+    monkeypatch.setenv('CLUSTER_TOLERANCE', '0.1')
+    assert cluster_tolerance() == 0.1
+    assert cluster_tolerance(0) == 0
+
+
+@pytest.mark.parametrize('tighten, rowed', [ ( True, [ 'Gas 1 +1', 'Gas 3' ] ), ( False, [ 'Gas 1 +1' ] ) ])
+def test_cluster_rows_for_single_machines_only_when_tightening(tighten, rowed):
+    model = SimpleNamespace(tighten=tighten, plant_count={ 'Gas 1 +1': 2, 'Gas 3': 1 })
+
+    assert cluster_row_plants(model, [ 'Gas 1 +1', 'Gas 3' ]) == rowed
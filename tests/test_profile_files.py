@@ -0,0 +1,105 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import profile_files
+from profile_files import PROFILE_KEYS, load_profiles, profile_cache
+
+
+HOURS = 10
+
+
+@pytest.fixture
+def csv_file(tmp_path, monkeypatch):
+    monkeypatch.delenv('PROFILE_CACHE_DIR', raising=False)
+    path = tmp_path / 'profiles.csv'
+    rows = ''.join( f'2024-01-01 {hour:02d}:00,{hour},{hour / 10},{hour / 20},{hour * 2}\n' for hour in range(HOURS) )
+    # A trailing blank line, as editors leave them
+    path.write_text(f'time,demand,wind,pv,Wind 1\n{rows}\n')
+
+    return str(path)
+
+
+def test_csv_is_converted_to_a_cache_next_to_it(csv_file):
+    profiles = load_profiles(csv_file, chunk_rows=3)
+
+    assert os.path.exists(f'{csv_file}.npy')
+    assert list(profiles) == [ *PROFILE_KEYS, 'Wind 1' ]
+    np.testing.assert_array_equal(profiles['demand'], np.arange(HOURS))
+    np.testing.assert_allclose(profiles['Wind 1'], 2 * np.arange(HOURS))
+    assert isinstance(profiles['pv'], np.memmap)
+
+
+def test_cache_is_written_again_for_a_newer_file(csv_file):
+    load_profiles(csv_file)
+    with open(csv_file, 'a') as file:
+        file.write('2024-01-01 10:00,10,1,0.5,20\n')
+    os.utime(csv_file, ( os.path.getmtime(csv_file) + 10, ) * 2)
+
+    assert len(load_profiles(csv_file)['demand']) == HOURS + 1
+
+
+def test_cache_directory_from_env(csv_file, tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'cache'
+    monkeypatch.setenv('PROFILE_CACHE_DIR', str(cache_dir))
+
+    load_profiles(csv_file)
+
+    assert not os.path.exists(f'{csv_file}.npy')
+    assert os.listdir(cache_dir) == [ os.path.basename(profile_cache(csv_file)) ]
+
+
+def test_unwritable_cache_falls_back_to_memory(csv_file, monkeypatch):
+    # A directory below a file can never be created
+    monkeypatch.setenv('PROFILE_CACHE_DIR', os.path.join(csv_file, 'cache'))
+    monkeypatch.setattr(profile_files, '_memory_cache', {})
+
+    profiles = load_profiles(csv_file)
+
+    np.testing.assert_array_equal(profiles['demand'], np.arange(HOURS))
+    assert not profiles['demand'].flags.writeable
+    assert load_profiles(csv_file)['demand'].base is profiles['demand'].base
+    assert not any( name.endswith('.partial') for name in os.listdir(os.path.dirname(csv_file)) )
+
+
+def test_npy_columns(tmp_path):
+    path = str(tmp_path / 'profiles.npy')
+    np.save(path, np.arange(3 * HOURS, dtype=float).reshape(HOURS, 3))
+
+    profiles = load_profiles(path)
+
+    np.testing.assert_array_equal(profiles['wind'], np.arange(1, 3 * HOURS, 3))
+
+
+def test_missing_columns_raise(tmp_path):
+    path = tmp_path / 'profiles.csv'
+    path.write_text('demand,wind\n1,0.5\n')
+
+    with pytest.raises(ValueError, match='pv'):
+        load_profiles(str(path))
+
+
+def test_unknown_format_raises(tmp_path):
+
+    with pytest.raises(ValueError, match='format'):
+        load_profiles(str(tmp_path / 'profiles.xlsx'))
+
+
+def test_parquet_matches_csv(csv_file, tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'profiles.parquet')
+    pd.read_csv(csv_file).to_parquet(path)
+
+    profiles = load_profiles(path, chunk_rows=4)
+
+    np.testing.assert_allclose(profiles['pv'], load_profiles(csv_file)['pv'])
+
+
+def test_loading_profiles_does_not_import_pyomo():
+    code = 'import sys, profile_files; assert "pyomo" not in sys.modules'
+
+    subprocess.run([ sys.executable, '-c', code ], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
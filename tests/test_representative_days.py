@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import input
+from representative_days import DAY, cluster_days, day_features, day_profiles, varied_days
+
+
+def test_day_features_weigh_profiles_by_installed_power():
+    profiles = varied_days(input.profiles, 3)
+
+    features = day_features(input.units, profiles)
+
+    assert features.shape == ( 3, 3 * DAY )
+    demand = sum( unit['power'] for unit in input.units.values() if unit['type'] == 'demand' )
+    np.testing.assert_allclose(features[1, :DAY], demand * np.asarray(profiles['demand'][DAY:2 * DAY]))
+
+
+def test_day_features_need_whole_days():
+    profiles = { key: values[:DAY - 1] for key, values in input.profiles.items() }
+
+    with pytest.raises(ValueError):
+        day_features(input.units, profiles)
+
+
+def test_varied_days_keep_factors_in_range():
+    profiles = varied_days(input.profiles, 5, seed=1)
+
+    assert all( len(values) == 5 * DAY for values in profiles.values() )
+    assert max(profiles['wind']) <= 1 and max(profiles['pv']) <= 1
+    assert profiles == varied_days(input.profiles, 5, seed=1)
+
+
+def test_day_profiles_concatenate_days():
+    profiles = { 'demand': list(range(3 * DAY)) }
+
+    assert day_profiles(profiles, [ 2, 0 ])['demand'] == [ *range(2 * DAY, 3 * DAY), *range(DAY) ]
+
+
+def test_cluster_days_finds_medoids_and_weights():
+    rng = np.random.default_rng(0)
+    low, high = rng.normal(0, 0.1, ( 6, 4 )), rng.normal(10, 0.1, ( 4, 4 ))
+    features = np.vstack([ low, high ])
+
+    medoids, weights, assignment = cluster_days(features, 2)
+
+    assert sorted(weights) == [ 4, 6 ] and weights.sum() == len(features)
+    # Each day in the cluster of its medoid, days of a group together
+    for cluster, medoid in enumerate(medoids):
+        assert assignment[medoid] == cluster
+    assert len(set(assignment[:6])) == 1 and len(set(assignment[6:])) == 1 and assignment[0] != assignment[6]
+
+
+def test_cluster_days_keeps_all_days_for_large_k():
+    medoids, weights, assignment = cluster_days(np.eye(3), 5)
+
+    np.testing.assert_array_equal(medoids, [ 0, 1, 2 ])
+    np.testing.assert_array_equal(weights, [ 1, 1, 1 ])
+    np.testing.assert_array_equal(assignment, [ 0, 1, 2 ])
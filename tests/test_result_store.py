@@ -0,0 +1,31 @@
+import json
+
+import numpy as np
+
+from result_store import DTYPE, decode_results, encode_results
+
+
+def test_round_trip_keeps_units_hours_and_power():
+    results = { 'units': [ 'Coal 1', 'Wind 1' ], 'hours': np.arange(1, 5), 'power': np.array([ [ 180, 90.25, 0, 72 ], [ 0, 12.5, 33.75, 0 ] ]) }
+
+    # Through JSON, as dcc.Store keeps it
+    decoded = decode_results(json.loads(json.dumps(encode_results(results))))
+
+    assert decoded['units'] == [ 'Coal 1', 'Wind 1' ]
+    assert decoded['hours'] == [ 1, 2, 3, 4 ]
+    assert decoded['power'].dtype == np.dtype(DTYPE)
+    np.testing.assert_array_equal(decoded['power'], results['power'])
+
+
+def test_power_keeps_two_decimals():
+    power = np.round(np.random.default_rng(0).uniform(0, 2000, ( 20, 24 )), 2)
+
+    decoded = decode_results(encode_results({ 'units': [ f'Unit {i}' for i in range(20) ], 'hours': range(24), 'power': power }))
+
+    np.testing.assert_allclose(decoded['power'], power, atol=0.005)
+
+
+def test_empty_results():
+    decoded = decode_results(encode_results({ 'units': [], 'hours': [ 1, 2 ], 'power': np.zeros(( 0, 2 )) }))
+
+    assert decoded['power'].shape == ( 0, 2 )
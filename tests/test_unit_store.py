@@ -0,0 +1,61 @@
+import pytest
+
+import input
+from unit_store import StaleSession, UnitStore
+
+
+UNIT = { 'type': 'gas', 'vc': 4, 'power': 120, 'ramp': 60, 'lat': 30.0, 'lon': -97.0 }
+
+
+def test_sessions_start_from_input_units():
+    store = UnitStore()
+    session = store.open()
+
+    assert store.version(session) == 0
+    assert store.units(session) == input.units
+
+
+def test_edits_count_the_version_up():
+    store = UnitStore()
+    session = store.open()
+
+    assert store.put(session, 'Gas 9', UNIT, version=0) == 1
+    assert store.delete(session, 'Coal 1', version=1) == 2
+    units = store.units(session, version=2)
+    assert units['Gas 9'] == UNIT and 'Coal 1' not in units
+
+
+def test_sessions_do_not_share_units():
+    store = UnitStore()
+    first, second = store.open(), store.open()
+    store.put(first, 'Gas 9', UNIT)
+
+    assert 'Gas 9' not in store.units(second)
+    assert 'Gas 9' not in input.units
+
+
+@pytest.mark.parametrize('edit', [
+    lambda store, session: store.put(session, 'Gas 9', UNIT, version=0),
+    lambda store, session: store.delete(session, 'Coal 1', version=0),
+    lambda store, session: store.units(session, version=0),
+])
+def test_version_conflict_raises_stale_session(edit):
+    store = UnitStore()
+    session = store.open()
+    # Another tab of the session edited first
+    store.put(session, 'Gas 8', UNIT, version=0)
+
+    with pytest.raises(StaleSession):
+        edit(store, session)
+    assert store.version(session) == 1
+
+
+def test_unknown_and_dropped_sessions_raise_stale_session():
+    store = UnitStore(max_sessions=1)
+    dropped = store.open()
+    store.open()
+
+    with pytest.raises(StaleSession):
+        store.units('no such session')
+    with pytest.raises(StaleSession):
+        store.put(dropped, 'Gas 9', UNIT)
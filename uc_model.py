@@ -1,220 +1,1304 @@
+import math
 import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
 import pyomo.environ as pyo
-import pyomo.gdp as gdp
+from pyomo.core.expr.numeric_expr import LinearExpression
+from pyomo.common.gc_manager import PauseGC
 from dotenv import load_dotenv
 
 import input
+from profile_files import PROFILE_KEYS
 
 
-def uc_model(units, dev=False):
+# ## Constants
+MIN_POWER = 0.4
+OPT_POWER = 0.5
+DEVIATION_COST = 1.25
+BATTERY_EFF = 0.6
+BATTERY_START = 0
+BATTERY_LOAD_TIME = 5  # hours
+START_UP_COST = 10
+MODEL_CONSTANTS = ['MIN_POWER', 'OPT_POWER', 'DEVIATION_COST', 'BATTERY_EFF', 'BATTERY_START', 'BATTERY_LOAD_TIME', 'START_UP_COST']
 
-    load_dotenv()
+PLANT_TYPES = ['coal', 'gas', 'nuclear']
+
+
+# Battery load / reload exclusivity: gdp.hull or gdp.bigm of the disjunction, or a direct binary
+BATTERY_FORMULATIONS = ['hull', 'bigm', 'binary']
+GDP_TRANSFORMATIONS = { 'hull': 'gdp.hull', 'bigm': 'gdp.bigm' }
+
+PLANT_VARS = ['power', 'power_p', 'power_n', 'on', 'start', 'start_p', 'start_n']
+BATTERY_VARS = ['b_volume', 'b_load', 'b_reload', 'b_power']
+# Battery rows only restating variable bounds, left out of tightened models
+BOUND_ROWS = ['volume_max', 'volume_min', 'load_max', 'reload_min']
+# Plant rows clusters need; a single machine's binary commitment and ramp rows imply them,
+# there they only tighten the LP relaxation and are left to tightened models
+CLUSTER_ROWS = ['power_idle', 'start_max', 'stop_max', 'ramp_start']
+MODEL_ATTRIBUTES = ['type', 'power', 'vc', 'ramp']
+
+# Solver backends: GLPK and CBC run as subprocesses reading and writing files, HiGHS runs
+# in-process (highspy) and keeps the model loaded between solves
+SOLVER_BACKENDS = ['glpk', 'cbc', 'highs']
+
+# Relative MIP gap solves stop at unless a request asks otherwise (HiGHS default)
+DEFAULT_MIP_GAP = 1e-4
+
+# Time limit and MIP gap as named in the options of shell solvers
+SHELL_LIMIT_OPTIONS = {
+    'glpk': { 'time_limit': 'tmlim', 'mip_gap': 'mipgap' },
+    'cbc': { 'time_limit': 'sec', 'mip_gap': 'ratio' },
+}
+
+# Plant variables carried from a previous solution into a MIP start; start-ups follow from commitment
+WARM_START_VARS = ['on', 'power']
+
+# MW a split schedule may be off its unit's limits, as results are rounded to 2 decimals
+SPLIT_TOLERANCE = 0.02
+
+# Phases in model.timings; solve is split further when the solver runs in steps (GLPK, CBC)
+BUILD_PHASES = ['sets', 'params', 'vars', 'objective', 'constraints', 'battery_logic', 'gdp_transform', 'update']
+SOLVER_PHASES = { '_presolve': 'write', '_apply_solver': 'solver', '_postsolve': 'read' }
+
+
+@contextmanager
+def timed(model, phase):
+    """ Add time spent in the block to model.timings[phase], in seconds. """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        model.timings[phase] = model.timings.get(phase, 0) + time.perf_counter() - start
+
+
+def time_solver_phases(model, solver):
+    """ Time problem file write, solver run and solution read of a shell solver apart. """
+
+    def wrap(function, phase):
+        def call(*args, **kwargs):
+            with timed(model, phase):
+                return function(*args, **kwargs)
+        return call
+
+    for method, phase in SOLVER_PHASES.items():
+        if hasattr(solver, method):
+            setattr(solver, method, wrap(getattr(solver, method), phase))
+
+
+def model_stats(model):
+    """ Size of the model and seconds spent in each phase of its build and solve. """
 
-    # ## Constants
-    HOURS = [t for t in range(1, 25)]
-    MIN_POWER = 0.4
-    OPT_POWER = 0.5
-    DEVIATION_COST = 1.25
-    BATTERY_EFF = 0.6
-    BATTERY_START = 0
-    BATTERY_LOAD_TIME = 5  # hours
-    START_UP_COST = 10
-
-    demand_profile = { hour+1: value for hour, value in enumerate(input.profiles['demand']) }
-    wind_profile = { hour+1: value for hour, value in enumerate(input.profiles['wind']) }
-    pv_profile = { hour+1: value for hour, value in enumerate(input.profiles['pv']) }
-
-    plants = { key: val for key, val in units.items() if units[key]['type'] in ['coal', 'gas', 'nuclear'] }
+    variables = list(model.component_data_objects(pyo.Var, active=True))
+
+    return {
+        'variables': len(variables),
+        'binaries': sum( 1 for var in variables if var.is_binary() ),
+        'integers': sum( 1 for var in variables if var.is_integer() and not var.is_binary() ),
+        'constraints': sum( 1 for _ in model.component_data_objects(pyo.Constraint, active=True) ),
+        'phases': { phase: round(seconds, 4) for phase, seconds in model.timings.items() },
+        'termination': getattr(model, 'termination', None),
+        'gap': getattr(model, 'gap', None),
+        'nodes': getattr(model, 'nodes', None),
+    }
+
+
+def split_units(units):
+
+    plants = { key: val for key, val in units.items() if units[key]['type'] in PLANT_TYPES }
     demand_sources = { key: val for key, val in units.items() if units[key]['type'] in ['demand'] }
     wind_farms = { key: val for key, val in units.items() if units[key]['type'] in ['wind'] }
     pv_farms = { key: val for key, val in units.items() if units[key]['type'] in ['pv'] }
     batteries = { key: val for key, val in units.items() if units[key]['type'] in ['battery'] }
 
-    # if dev:
-    #     draw_sources(demand_sources, demand_profile, wind_farms, wind_profile, pv_farms, pv_profile, HOURS)
+    return plants, demand_sources, wind_farms, pv_farms, batteries
+
+
+def cost_slopes(vc, p_max):
+    """ Slopes of variable cost below and above the optimal power.
+
+    Variable cost is linear on both sides of the optimal power:
+    vc = BASE_COST + slope_n * power_n + slope_p * power_p
+    Works on float arrays as well as on object arrays of Params.
+    """
+
+    slope_n = vc * ( DEVIATION_COST - 1 ) / ( p_max * ( MIN_POWER - OPT_POWER ) )
+    slope_p = vc * ( DEVIATION_COST - 1 ) / ( p_max * ( 1 - OPT_POWER ) )
+
+    return slope_n, slope_p
+
+
+def unit_arrays(plants, batteries):
+    """ Per-unit coefficients as NumPy arrays, ordered as the plants / batteries dicts. """
+
+    p_max = np.array([ val['power'] for val in plants.values() ], dtype=float)
+    vc = np.array([ val['vc'] for val in plants.values() ], dtype=float)
+    ramp = np.array([ val['ramp'] for val in plants.values() ], dtype=float)
+    slope_n, slope_p = cost_slopes(vc, p_max)
+
+    return {
+        'count': np.array([ val.get('count', 1) for val in plants.values() ], dtype=float),
+        'p_max': p_max,
+        'p_opt': p_max * OPT_POWER,
+        'vc': vc,
+        'ramp': ramp,
+        'slope_n': slope_n,
+        'slope_p': slope_p,
+        'b_power': np.array([ val['power'] for val in batteries.values() ], dtype=float),
+        'b_vc': np.array([ val['vc'] for val in batteries.values() ], dtype=float),
+    }
+
+
+def unit_profile(profiles, name, key):
+    """ Profile of a unit: its own if profiles have one under its name (see profile_files), else the key profile of its type. """
+
+    return profiles[name] if name in profiles else profiles[key]
+
+
+def installed_profile(units, profiles, key):
+    """ Hourly MW of units at full power times their profiles. """
+
+    shared = sum( val['power'] for name, val in units.items() if name not in profiles )
+    total = shared * np.asarray(profiles[key], dtype=float)
+    for name, val in units.items():
+        if name in profiles:
+            total = total + val['power'] * np.asarray(profiles[name], dtype=float)
+
+    return total
+
+
+def net_demand(demand_sources, wind_farms, pv_farms, profiles):
+    """ Hourly demand left for plants and batteries after wind and pv generation. """
+
+    return (
+        + installed_profile(demand_sources, profiles, 'demand')
+        - installed_profile(wind_farms, profiles, 'wind')
+        - installed_profile(pv_farms, profiles, 'pv')
+    )
+
+
+def object_array(items, shape):
+    """ Object array of given shape from an iterable of Pyomo objects or tuples.
+
+    Read in one pass; assigning a list to an object array makes numpy check every item
+    for being a sequence, which costs more than building the items.
+    """
+
+    return np.fromiter(items, dtype=object, count=math.prod(shape)).reshape(shape)
+
+
+def var_grid(var, names, hours):
+    """ Variable data of a (unit, hour) indexed Var as an object array of shape units x hours. """
+
+    return object_array(( var[name, hour] for name in names for hour in hours ), ( len(names), len(hours) ))
+
+
+def param_column(param, names):
+    """ Param data of a unit indexed Param as an object column, broadcast over hours. """
+
+    return object_array(( param[name] for name in names ), ( len(names), 1 ))
+
+
+def linear_rows(terms, constant=0, lower=None, upper=None, equal=None):
+    """ Rows `lower <= constant + sum(coef * var) <= upper` (or `== equal`) as an object array.
+
+    Terms are pairs of (coefficient, variable grid), all broadcastable to the shape of the
+    first variable grid, which is also the shape of the returned array of constraint tuples.
+    Coefficients and constant may be object arrays of Param expressions.
+    """
+
+    shape = terms[0][1].shape
+    def flat(value):
+        if not isinstance(value, np.ndarray):
+            value = np.asarray(value, dtype=float)
+        return np.broadcast_to(value, shape).ravel().tolist()
+
+    coefs = zip(*[ flat(coef) for coef, _ in terms ])
+    variables = zip(*[ np.broadcast_to(var, shape).ravel().tolist() for _, var in terms ])
+    bodies = [
+        LinearExpression(constant=const, linear_coefs=list(coef), linear_vars=list(var))
+        for const, coef, var in zip(flat(constant), coefs, variables)
+    ]
+
+    if equal is not None:
+        return object_array(zip(bodies, flat(equal)), shape)
+
+    lowers = flat(lower) if lower is not None else [ None ] * len(bodies)
+    uppers = flat(upper) if upper is not None else [ None ] * len(bodies)
+
+    return object_array(zip(lowers, bodies, uppers), shape)
+
+
+def grid_rule(names, hours, blocks):
+    """ Constraint rule reading pre-built rows; blocks are (hour slice, rows) pairs, units not in names are skipped. """
+
+    rows = np.full(( len(names), len(hours) ), None, dtype=object)
+    for columns, block in blocks:
+        rows[:, columns] = block
+
+    row_of = { name: i for i, name in enumerate(names) }
+    column_of = { hour: t for t, hour in enumerate(hours) }
+
+    def rule(_m, unit, hour):
+        row = rows[row_of[unit], column_of[hour]] if unit in row_of else None
+        return pyo.Constraint.Skip if row is None else row
+
+    return rule
+
+
+def set_rows(constraint, names, hours, blocks):
+    """ Add pre-built rows of given units to an existing Constraint. """
+
+    for columns, block in blocks:
+        for name, row in zip(names, block):
+            for hour, value in zip(hours[columns], row):
+                constraint[name, hour] = value
+
+
+def plant_rows(model, names):
+    """ Rows of the plant constraint blocks for given plants, as lists of (hour slice, rows). """
+
+    hours = list(model.hours)
+    power, power_p, power_n, on, start, start_p, start_n = [ var_grid(getattr(model, var), names, hours) for var in PLANT_VARS ]
+    p_max = param_column(model.plant_power, names)
+    ramp = param_column(model.plant_ramp, names)
+    count = param_column(model.plant_count, names)
+    on_before = param_column(model.plant_on_before, names)
+    every, first, rest = slice(None), slice(None, 1), slice(1, None)
+
+    return {
+        # Max and min plant power, of the committed machines (on counts them in a cluster)
+        'power_max': [ ( every, linear_rows([ ( 1, power ), ( -p_max, on ) ], upper=0) ) ],
+        'power_min': [ ( every, linear_rows([ ( 1, power ), ( -MIN_POWER * p_max, on ) ], lower=0) ) ],
+        'power_opt': [ ( every, linear_rows([ ( 1, power ), ( -1, power_n ), ( -1, power_p ) ], constant=-OPT_POWER * p_max * count, equal=0) ) ],
+
+        # Plant ramp, of each committed machine
+        'ramp_up': [ ( rest, linear_rows([ ( 1, power[:, 1:] ), ( -1, power[:, :-1] ), ( -ramp, on[:, 1:] ) ], upper=0) ) ],
+        'ramp_down': [ ( rest, linear_rows([ ( 1, power[:, 1:] ), ( -1, power[:, :-1] ), ( ramp, on[:, :-1] ) ], lower=0) ) ],
+
+        # Plant start up
+        'start_up': [
+            ( first, linear_rows([ ( 1, start[:, :1] ), ( -1, on[:, :1] ) ], constant=on_before, equal=0) ),
+            ( rest, linear_rows([ ( 1, start[:, 1:] ), ( -1, on[:, 1:] ), ( 1, on[:, :-1] ) ], equal=0) ),
+        ],
+        'start_up_partition': [ ( every, linear_rows([ ( 1, start ), ( -1, start_p ), ( -1, start_n ) ], equal=0) ) ],
+    }
+
+
+def cluster_row_plants(model, names):
+    """ Plants among names with rows of CLUSTER_ROWS: those of several machines, all in a tightened model. """
+
+    return list(names) if model.tighten else [ name for name in names if pyo.value(model.plant_count[name]) > 1 ]
+
+
+def cluster_rows(model, names):
+    """ Rows of the CLUSTER_ROWS blocks for given plants, as lists of (hour slice, rows). """
+
+    hours = list(model.hours)
+    power, power_n, on, start_p, start_n = [ var_grid(getattr(model, var), names, hours) for var in [ 'power', 'power_n', 'on', 'start_p', 'start_n' ] ]
+    p_max = param_column(model.plant_power, names)
+    ramp = param_column(model.plant_ramp, names)
+    count = param_column(model.plant_count, names)
+    every, rest = slice(None), slice(1, None)
+
+    return {
+        # Idle machines of a cluster deviate fully below optimal power; running ones can not offset that
+        'power_idle': [ ( every, linear_rows([ ( 1, power_n ), ( -OPT_POWER * p_max, on ) ], constant=OPT_POWER * p_max * count, upper=0) ) ],
+        # Machines starting (stopping) run at most at ramp in their first (last) hour, the others up to max power
+        'start_max': [ ( rest, linear_rows([ ( 1, power[:, 1:] ), ( -p_max, on[:, 1:] ), ( p_max - ramp, start_p[:, 1:] ) ], upper=0) ) ],
+        'stop_max': [ ( rest, linear_rows([ ( 1, power[:, :-1] ), ( -p_max, on[:, :-1] ), ( ramp - p_max, start_n[:, 1:] ) ], upper=0) ) ],
+        # Machines not ramping to min power within an hour neither start nor stop after the first hour
+        'ramp_start': [ ( rest, linear_rows([ ( MIN_POWER * p_max - ramp, start_p[:, 1:] ), ( ramp - MIN_POWER * p_max, start_n[:, 1:] ) ], upper=0) ) ],
+    }
+
+
+def set_cluster_rows(model, names):
+    """ Rows of CLUSTER_ROWS for the plants among names that have them (cluster_row_plants), none for the others. """
+
+    hours = list(model.hours)
+    for key in CLUSTER_ROWS:
+        constraint = model.component(key)
+        for name in names:
+            for hour in hours:
+                if ( name, hour ) in constraint:
+                    del constraint[name, hour]
+
+    rowed = cluster_row_plants(model, names)
+    for key, blocks in cluster_rows(model, rowed).items():
+        set_rows(model.component(key), rowed, hours, blocks)
+
+
+def battery_rows(model, names):
+    """ Rows of the battery constraint blocks for given batteries, as lists of (hour slice, rows). """
+
+    hours = list(model.hours)
+    b_volume, b_load, b_reload, b_power = [ var_grid(getattr(model, var), names, hours) for var in BATTERY_VARS ]
+    b_max = param_column(model.battery_power, names)
+    b_start = param_column(model.battery_start, names)
+    every, first, rest = slice(None), slice(None, 1), slice(1, None)
+
+    rows = {
+        # Battery volume
+        'volume_state': [
+            ( first, linear_rows([ ( 1, b_volume[:, :1] ), ( -BATTERY_EFF, b_load[:, :1] ), ( -1, b_reload[:, :1] ) ], constant=-BATTERY_LOAD_TIME * b_start * b_max, equal=0) ),
+            ( rest, linear_rows([ ( 1, b_volume[:, 1:] ), ( -BATTERY_EFF, b_load[:, 1:] ), ( -1, b_reload[:, 1:] ), ( -1, b_volume[:, :-1] ) ], equal=0) ),
+        ],
+
+        # Max and min battery volume
+        'volume_max': [ ( every, linear_rows([ ( 1, b_volume ) ], constant=-BATTERY_LOAD_TIME * b_max, upper=0) ) ],
+        'volume_min': [ ( every, linear_rows([ ( 1, b_volume ) ], lower=0) ) ],
+
+        # Max and min battery load and reload
+        'load_max': [ ( every, linear_rows([ ( 1, b_load ) ], constant=-b_max, upper=0) ) ],
+        'reload_min': [ ( every, linear_rows([ ( 1, b_reload ) ], constant=b_max, lower=0) ) ],
+
+        # Sum load and reload
+        'b_sum': [ ( every, linear_rows([ ( 1, b_power ), ( -1, b_load ), ( -1, b_reload ) ], equal=0) ) ],
+    }
+    if model.tighten:
+        rows = { key: blocks for key, blocks in rows.items() if key not in BOUND_ROWS }
+
+    return rows
+
+
+def battery_logic(block, battery):
+    """ Do not load / reload in the same time """
+
+    m = block.model()
+
+    if m.formulation in GDP_TRANSFORMATIONS:
+        import pyomo.gdp as gdp
+
+        block.one_direction = gdp.Disjunction(m.hours, rule=lambda _b, hour: [ m.b_load[battery, hour] == 0, m.b_reload[battery, hour] == 0 ])
+
+    else:
+        # Charging indicator; bounds follow the battery power Param, so they stay tight after edits
+        block.charging = pyo.Var(m.hours, domain=pyo.Binary)
+        block.load_on = pyo.Constraint(m.hours, rule=lambda b, hour: m.b_load[battery, hour] <= m.battery_power[battery] * b.charging[hour])
+        block.reload_on = pyo.Constraint(m.hours, rule=lambda b, hour: m.b_reload[battery, hour] >= -m.battery_power[battery] * ( 1 - b.charging[hour] ))
+
+
+def add_battery_logic(model, names):
+
+    blocks = [ model.battery_logic[name] for name in names ]
+    if blocks and model.formulation in GDP_TRANSFORMATIONS:
+        pyo.TransformationFactory(GDP_TRANSFORMATIONS[model.formulation]).apply_to(model, targets=blocks)
+
+
+def set_unit_params(model, units):
+    """ Copy unit attributes of plants and batteries into the mutable Params of the model. """
+
+    for name, unit in units.items():
+        if unit['type'] in PLANT_TYPES:
+            model.plant_power[name] = unit['power']
+            model.plant_vc[name] = unit['vc']
+            model.plant_ramp[name] = unit['ramp']
+            model.plant_count[name] = unit.get('count', 1)
+        elif unit['type'] == 'battery':
+            model.battery_power[name] = unit['power']
+            model.battery_vc[name] = unit['vc']
+
+
+def set_net_demand(model):
+
+    _, demand_sources, wind_farms, pv_farms, _ = split_units(model.units)
+    residual = net_demand(demand_sources, wind_farms, pv_farms, model.profiles)
+    for t, hour in enumerate(model.hours):
+        model.net_demand[hour] = float(residual[t])
+
+    set_commitment_bounds(model, residual)
+
+
+def commitment_bounds(model, residual):
+    """ Machines each plant has to commit, and can commit at most, in each hour of net demand residual.
+
+    A plant must run when the other plants at full power and the batteries discharging can not
+    cover the demand, and can not run when its min power exceeds the demand with the batteries
+    charging. Plants too slow to reach min power within an hour keep their commitment from the
+    first hour on, so a bound of any hour holds for all. Equal bounds fix the commitment.
+    Without tightening, from 0 to the count. Arrays of plants x hours, as split_units orders them.
+    """
+
+    plants, _, _, _, batteries = split_units(model.units)
+    arrays = unit_arrays(plants, batteries)
+    p_max, count = arrays['p_max'][:, None], arrays['count'][:, None]
+    if not model.tighten:
+        return np.zeros(( len(plants), len(residual) )), np.repeat(count, len(residual), axis=1)
+    capacity, storage = p_max * count, arrays['b_power'].sum()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        short = ( residual[None, :] - ( capacity.sum() - capacity ) - storage ) / p_max
+        room = ( residual[None, :] + storage ) / ( MIN_POWER * p_max )
+    low = np.clip(np.ceil(np.where(p_max > 0, short, 0) - 1e-6), 0, count)
+    high = np.clip(np.floor(np.where(p_max > 0, room, count) + 1e-6), 0, count)
+
+    fixed = ( MIN_POWER * arrays['p_max'] > arrays['ramp'] )
+    low[fixed] = low[fixed].max(axis=1, keepdims=True)
+    high[fixed] = high[fixed].min(axis=1, keepdims=True)
+
+    return low, high
+
+
+def set_commitment_bounds(model, residual):
+    """ Commitment bounds (commitment_bounds) as { plant: ( low, high ) } rows in model.on_bounds.
+
+    Built commitment variables get the bounds of the plants whose rows changed; new ones
+    take theirs from model.on_bounds when they are created.
+    """
+
+    plants = split_units(model.units)[0]
+    low, high = commitment_bounds(model, residual)
+    before = getattr(model, 'on_bounds', {})
+    model.on_bounds = { name: ( low[i], high[i] ) for i, name in enumerate(plants) }
+    if model.component('on') is None:
+        return
+
+    hours = list(model.hours)
+    for name, ( lower, upper ) in model.on_bounds.items():
+        old = before.get(name)
+        if old is not None and np.array_equal(old[0], lower) and np.array_equal(old[1], upper):
+            continue
+        for hour, lb, ub in zip(hours, lower.tolist(), upper.tolist()):
+            model.on[name, hour].setlb(lb)
+            model.on[name, hour].setub(ub)
+
+
+def on_bound(model, plant, hour):
+    """ Bounds of a commitment variable created before the plant has bounds in model.on_bounds are 0 and its count. """
+
+    if plant not in model.on_bounds:
+        return ( 0, model.plant_count[plant].value )
+    lower, upper = model.on_bounds[plant]
+
+    # Hours are numbered from 1
+    return ( float(lower[hour - 1]), float(upper[hour - 1]) )
+
+
+def couple_units(model):
+    """ Objective and demand balance, the only components spanning all plants and batteries.
+
+    Built on first call and rebuilt in place whenever plants or batteries are added or removed.
+    """
+
+    hours = list(model.hours)
+    names, b_names = list(model.plants), list(model.batteries)
+    power, power_p, power_n, _, _, start_p, _ = [ var_grid(getattr(model, var), names, hours) for var in PLANT_VARS ]
+    _, b_load, b_reload, _ = [ var_grid(getattr(model, var), b_names, hours) for var in BATTERY_VARS ]
+
+    p_max = param_column(model.plant_power, names)
+    vc = param_column(model.plant_vc, names)
+    count = param_column(model.plant_count, names)
+    b_vc = param_column(model.battery_vc, b_names)
+    slope_n, slope_p = cost_slopes(vc, p_max)
+
+    # Hours of a representative period stand for several hours, see representative_days
+    weights = None if model.weights is None else np.asarray(model.weights, dtype=float)[None, :]
+
+    def spread(coef, grid):
+        if weights is not None:
+            coef = coef * weights
+        return np.broadcast_to(coef, grid.shape).ravel().tolist()
+
+    # ## Objective - minimize cost of the power system
+    system_costs = LinearExpression(
+        # Plants base variable cost
+        constant=( len(hours) if weights is None else float(weights.sum()) ) * pyo.quicksum(( vc * count ).ravel()),
+        linear_coefs=[
+            # Plants variable cost deviation from optimal power
+            *spread(slope_n, power_n),
+            *spread(slope_p, power_p),
+            # Plants start-up cost
+            *spread(START_UP_COST * p_max * vc, start_p),
+            # Batteries variable cost
+            *spread(b_vc, b_load),
+        ],
+        linear_vars=[ *power_n.ravel(), *power_p.ravel(), *start_p.ravel(), *b_load.ravel() ],
+    )
+
+    # ## Demand (has to be fullfilled in each hour, not less not more)
+    demand = {
+        hour: (
+            LinearExpression(
+                constant=-model.net_demand[hour],
+                linear_coefs=[ 1 ] * len(names) + [ -1 ] * ( 2 * len(b_names) ),
+                linear_vars=[ *power[:, t], *b_reload[:, t], *b_load[:, t] ],
+            ),
+            0,
+        ) for t, hour in enumerate(hours)
+    }
+
+    if model.component('system_costs') is None:
+        model.system_costs = pyo.Objective(expr=system_costs, sense=pyo.minimize)
+        model.demand = pyo.Constraint(model.hours, rule=demand)
+    else:
+        model.system_costs.expr = system_costs
+        for hour, row in demand.items():
+            model.demand[hour] = row
+
+
+def set_initial_state(model, state=None):
+    """ State of the units before the first hour of the model; None restores the cold start.
+
+    state = { 'on': { plant: 0 or 1 }, 'power': { plant: MW }, 'volume': { battery: MWh } }
+    Commitment and battery volume go to Params. Ramping from the previous power becomes
+    bounds of first hour power, as the ramp constraints start in the second hour.
+    """
+
+    first = model.hours.first()
+    for name in model.plants:
+        if state is None:
+            model.plant_on_before[name] = 0
+            model.power[name, first].setlb(0)
+            model.power[name, first].setub(model.plant_power[name] * model.plant_count[name])
+            continue
+
+        count = pyo.value(model.plant_count[name])
+        power, ramp, p_max = state['power'][name], count * pyo.value(model.plant_ramp[name]), count * pyo.value(model.plant_power[name])
+        model.plant_on_before[name] = round(state['on'][name])
+        model.power[name, first].setlb(max(0, power - ramp))
+        model.power[name, first].setub(min(p_max, power + ramp))
+
+    for name in model.batteries:
+        capacity = BATTERY_LOAD_TIME * pyo.value(model.battery_power[name])
+        if state is None or not capacity:
+            model.battery_start[name] = BATTERY_START
+        else:
+            model.battery_start[name] = min(1, max(0, state['volume'][name] / capacity))
+
+
+def final_state(model, hour=None):
+    """ State of the units after given hour (the last one by default) of a solved model. """
+
+    hour = model.hours.last() if hour is None else hour
+
+    return {
+        'on': { name: round(pyo.value(model.on[name, hour])) for name in model.plants },
+        # Rounded, so solver tolerances do not force a plant on through the ramp bounds
+        'power': { name: round(pyo.value(model.power[name, hour]), 6) for name in model.plants },
+        'volume': { name: round(pyo.value(model.b_volume[name, hour]), 6) for name in model.batteries },
+    }
+
+
+def commitment_domain(model, plant, _hour):
+    """ Binary for single plants; machines committed, up to their count, for clusters. """
 
-    def load_bounds(_m, battery, _hour):
-        return ( 0, batteries[battery]['power'] )
+    return pyo.Binary if pyo.value(model.plant_count[plant]) == 1 else pyo.NonNegativeIntegers
 
-    def reload_bounds(_m, battery, _hour):
-        return ( -batteries[battery]['power'], 0 )
 
-    def power_bounds(_m, plant, _hour):
-        return ( 0, plants[plant]['power'] )
+# Start-ups of a tightened model, per machine of the plant
+START_BOUNDS = { 'start': ( -1, 1 ), 'start_p': ( 0, 1 ), 'start_n': ( -1, 0 ) }
 
-    def power_p_bounds(_m, plant, _hour):
-        return ( 0, plants[plant]['power'] * OPT_POWER )
 
-    def power_n_bounds(_m, plant, _hour):
-        return ( -plants[plant]['power'] * OPT_POWER , 0 )
-    
-    def vc(m, plant, hour):
+def start_bounds(key):
+    """ Bounds rule of a start-up variable: START_BOUNDS times the machine count in a tightened model.
 
-        BASE_COST = plants[plant]['vc']
-        p_max = plants[plant]['power']
-        p_opt = plants[plant]['power'] * OPT_POWER 
+    Numbers rather than Param expressions, which are slow to build; update_model sets them
+    again when the count changes.
+    """
 
-        # Negative power
-        a_n = BASE_COST * ( DEVIATION_COST - 1 ) / ( p_max * ( MIN_POWER - OPT_POWER ) )
-        b_n = -a_n * OPT_POWER * p_max
-        x_n = p_opt + m.power_n[plant, hour]
-        y_n = cost_n = a_n * x_n + b_n
+    lower, upper = START_BOUNDS[key]
 
-        # Positive power
-        a_p = BASE_COST * ( DEVIATION_COST - 1 ) / ( p_max * ( 1 - OPT_POWER ) )
-        b_p = -a_p * OPT_POWER * p_max
-        x_p = p_opt + m.power_p[plant, hour]
-        y_p = cost_p = a_p * x_p + b_p
+    def rule(m, plant, _hour):
+        count = m.plant_count[plant].value
+        return ( lower * count, upper * count ) if m.tighten else ( None, None )
 
-        return BASE_COST + cost_n + cost_p
+    return rule
+
+
+def volume_bounds(m, battery, _hour):
+    """ Battery volume within its capacity in a tightened model; set again by update_model when the power changes. """
+
+    return ( 0, BATTERY_LOAD_TIME * m.battery_power[battery].value ) if m.tighten else ( None, None )
+
+
+def model_tightening(tighten=None):
+    """ Tightening given, else TIGHTEN_MODEL env var ('0' turns it off), on by default. """
+
+    if tighten is None:
+        tighten = os.environ.get('TIGHTEN_MODEL', '1') != '0'
+
+    return tighten
+
+
+def battery_formulation(formulation=None):
+    """ Formulation given, else BATTERY_FORMULATION env var, else direct binary indicator. """
+
+    formulation = formulation or os.environ.get('BATTERY_FORMULATION', 'binary')
+    if formulation not in BATTERY_FORMULATIONS:
+        raise ValueError(f'Unknown battery formulation: {formulation}. Use one of {BATTERY_FORMULATIONS}.')
+
+    return formulation
+
+
+def build_model(units, profiles=None, formulation=None, weights=None, tighten=None):
+
+    # Construction allocates millions of small objects; GC passes over them only slow it down
+    with PauseGC():
+        return construct_model(units, profiles, formulation, weights, tighten)
+
+
+def construct_model(units, profiles=None, formulation=None, weights=None, tighten=None):
+    """ Model of the units over the profiles; weights (one per hour) scale the cost of each hour.
+
+    A tightened model (see model_tightening) bounds start-ups by the machines of a plant and
+    battery volume by its capacity, leaves out rows restating bounds (BOUND_ROWS), and bounds
+    commitment by what net demand allows (see set_commitment_bounds). Its LP relaxation is
+    closer to the MIP, so solvers branch less.
+    """
+
+    profiles = input.profiles if profiles is None else profiles
+    HOURS = [ t for t in range(1, len(profiles['demand']) + 1) ]
+
+    plants, demand_sources, wind_farms, pv_farms, batteries = split_units(units)
 
     model = pyo.ConcreteModel()
+    model.timings = {}
+    model.units = { key: dict(val) for key, val in units.items() }
+    model.profiles = profiles
+    model.formulation = battery_formulation(formulation)
+    model.weights = weights
+    model.tighten = model_tightening(tighten)
 
     # Declare sets
-    model.hours = pyo.Set(initialize=HOURS)
-    model.plants = pyo.Set(initialize=plants.keys())
-    model.demand_sources = pyo.Set(initialize=demand_sources.keys())
-    model.wind_farms = pyo.Set(initialize=wind_farms.keys())
-    model.pv_farms = pyo.Set(initialize=pv_farms.keys())
-    model.batteries = pyo.Set(initialize=batteries.keys())
+    with timed(model, 'sets'):
+        model.hours = pyo.Set(initialize=HOURS)
+        model.plants = pyo.Set(initialize=plants.keys())
+        model.demand_sources = pyo.Set(initialize=demand_sources.keys())
+        model.wind_farms = pyo.Set(initialize=wind_farms.keys())
+        model.pv_farms = pyo.Set(initialize=pv_farms.keys())
+        model.batteries = pyo.Set(initialize=batteries.keys())
+
+    # ## Declare parameters - unit attributes are mutable, so edits do not need a rebuild
+    with timed(model, 'params'):
+        model.plant_power = pyo.Param(model.plants, mutable=True)
+        model.plant_vc = pyo.Param(model.plants, mutable=True)
+        model.plant_ramp = pyo.Param(model.plants, mutable=True)
+        # Machines of a plant clustered from identical units (see clustering), 1 otherwise
+        model.plant_count = pyo.Param(model.plants, mutable=True, default=1)
+        model.battery_power = pyo.Param(model.batteries, mutable=True)
+        model.battery_vc = pyo.Param(model.batteries, mutable=True)
+        model.net_demand = pyo.Param(model.hours, mutable=True)
+        # State before the first hour, see set_initial_state
+        model.plant_on_before = pyo.Param(model.plants, mutable=True, default=0)
+        model.battery_start = pyo.Param(model.batteries, mutable=True, default=BATTERY_START)
+        set_unit_params(model, units)
+        set_net_demand(model)
 
     # ## Declare variables
-    # Plants
-    model.power = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeReals, bounds=power_bounds)
-    model.power_p = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeReals, bounds=power_p_bounds)
-    model.power_n = pyo.Var(model.plants, model.hours, domain=pyo.NonPositiveReals, bounds=power_n_bounds)
-    model.on = pyo.Var(model.plants, model.hours, domain=pyo.Binary)
-    model.start = pyo.Var(model.plants, model.hours, domain=pyo.Integers)
-    model.start_p = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeIntegers)
-    model.start_n = pyo.Var(model.plants, model.hours, domain=pyo.NonPositiveIntegers)
-
-    # Batteries
-    model.b_volume = pyo.Var(model.batteries, model.hours, domain=pyo.Reals)
-    model.b_load = pyo.Var(model.batteries, model.hours, domain=pyo.NonNegativeReals, bounds=load_bounds)
-    model.b_reload = pyo.Var(model.batteries, model.hours, domain=pyo.NonPositiveReals, bounds=reload_bounds)
-    model.b_power = pyo.Var(model.batteries, model.hours, domain=pyo.Reals)
+    with timed(model, 'vars'):
+        # Plants
+        model.power = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeReals, bounds=lambda m, plant, _hour: ( 0, m.plant_power[plant] * m.plant_count[plant] ))
+        model.power_p = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeReals, bounds=lambda m, plant, _hour: ( 0, OPT_POWER * m.plant_power[plant] * m.plant_count[plant] ))
+        model.power_n = pyo.Var(model.plants, model.hours, domain=pyo.NonPositiveReals, bounds=lambda m, plant, _hour: ( -OPT_POWER * m.plant_power[plant] * m.plant_count[plant], 0 ))
+        model.on = pyo.Var(model.plants, model.hours, domain=commitment_domain, bounds=on_bound)
+        model.start = pyo.Var(model.plants, model.hours, domain=pyo.Integers, bounds=start_bounds('start'))
+        model.start_p = pyo.Var(model.plants, model.hours, domain=pyo.NonNegativeIntegers, bounds=start_bounds('start_p'))
+        model.start_n = pyo.Var(model.plants, model.hours, domain=pyo.NonPositiveIntegers, bounds=start_bounds('start_n'))
 
-    # ## Objective - minimize cost of the power system
-    model.system_costs = pyo.Objective(
-        expr = 
-        # Plants variable cost
-        + sum( vc(model, plant, hour) for hour in model.hours for plant in model.plants )
-        # Plants start-up cost
-        + sum( START_UP_COST * model.start_p[plant, hour] * plants[plant]['power'] * plants[plant]['vc'] for hour in model.hours for plant in model.plants )
-        # Plants variable cost
-        + sum( model.b_load[battery, hour] * batteries[battery]['vc'] for hour in model.hours for battery in model.batteries ), 
-        sense=pyo.minimize )
+        # Batteries
+        model.b_volume = pyo.Var(model.batteries, model.hours, domain=pyo.Reals, bounds=volume_bounds)
+        model.b_load = pyo.Var(model.batteries, model.hours, domain=pyo.NonNegativeReals, bounds=lambda m, battery, _hour: ( 0, m.battery_power[battery] ))
+        model.b_reload = pyo.Var(model.batteries, model.hours, domain=pyo.NonPositiveReals, bounds=lambda m, battery, _hour: ( -m.battery_power[battery], 0 ))
+        model.b_power = pyo.Var(model.batteries, model.hours, domain=pyo.Reals)
 
-    # ## Demand (has to be fullfilled in each hour, not less not more)
-    model.demand = pyo.Constraint(model.hours, rule=lambda m, hour:
-        + sum( m.power[plant, hour] for plant in m.plants )
-        + sum( -m.b_reload[battery, hour] for battery in m.batteries )
-        ==
-        + sum( demand_sources[ele]['power'] * demand_profile[hour] for ele in m.demand_sources )
-        - sum( wind_farms[ele]['power'] * wind_profile[hour] for ele in m.wind_farms )
-        - sum( pv_farms[ele]['power'] * pv_profile[hour] for ele in m.pv_farms )
-        + sum( m.b_load[battery, hour] for battery in m.batteries )
-    )
+    # ## Objective and demand
+    with timed(model, 'objective'):
+        couple_units(model)
 
     # ## Contsraints
-    # Max and min plant power
-    model.power_max = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.power[plant, hour] <= plants[plant]['power'] * m.on[plant, hour] )
-    model.power_min = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.power[plant, hour] >= MIN_POWER * plants[plant]['power'] * m.on[plant, hour] )
-    model.power_opt = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.power[plant, hour] == m.power_n[plant, hour] + m.power_p[plant, hour] + OPT_POWER * plants[plant]['power'])
+    with timed(model, 'constraints'):
+        names, b_names = list(plants.keys()), list(batteries.keys())
+        for key, blocks in plant_rows(model, names).items():
+            model.add_component(key, pyo.Constraint(model.plants, model.hours, rule=grid_rule(names, HOURS, blocks)))
+        rowed = cluster_row_plants(model, names)
+        for key, blocks in cluster_rows(model, rowed).items():
+            model.add_component(key, pyo.Constraint(model.plants, model.hours, rule=grid_rule(rowed, HOURS, blocks)))
+        for key, blocks in battery_rows(model, b_names).items():
+            model.add_component(key, pyo.Constraint(model.batteries, model.hours, rule=grid_rule(b_names, HOURS, blocks)))
 
-    # Plant ramp
-    model.ramp_up = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.power[plant, hour] <= m.power[plant, hour-1] + plants[plant]['ramp'] if hour > 1 else pyo.Constraint.Skip )
-    model.ramp_down = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.power[plant, hour] >= m.power[plant, hour-1] - plants[plant]['ramp'] if hour > 1 else pyo.Constraint.Skip )
+    # Do not load / reload in the same time (one block per battery, so it can be added or removed alone)
+    with timed(model, 'battery_logic'):
+        model.battery_logic = pyo.Block(model.batteries, rule=battery_logic)
+    with timed(model, 'gdp_transform'):
+        add_battery_logic(model, b_names)
 
-    # Plant start up
-    model.start_up = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.start[plant, hour] == m.on[plant, hour] - m.on[plant, hour-1] if hour > 1 else m.start[plant, hour] == m.on[plant, hour] )
-    model.start_up_partition = pyo.Constraint( model.plants, model.hours, rule=lambda m, plant, hour: m.start[plant, hour] == m.start_p[plant, hour] + m.start_n[plant, hour] )
+    return model
 
-    # Battery volume
-    model.volume_state = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: 
-        m.b_volume[battery, hour] == m.b_load[battery, hour] * BATTERY_EFF + m.b_reload[battery, hour] + m.b_volume[battery, hour-1] if hour > 1 else
-        m.b_volume[battery, hour] == m.b_load[battery, hour] * BATTERY_EFF + m.b_reload[battery, hour] + batteries[battery]['power'] * BATTERY_START * BATTERY_LOAD_TIME
-        )
 
-    # Max and min battery volume
-    model.volume_max = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: m.b_volume[battery, hour] <= batteries[battery]['power'] * BATTERY_LOAD_TIME )
-    model.volume_min = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: m.b_volume[battery, hour] >= 0 )
+def add_units(model, units):
+    """ Add sets members, parameters, variables and constraints of new units to a built model. """
 
-    # Max and min battery load and reload
-    model.load_max = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: m.b_load[battery, hour] <= batteries[battery]['power'] )
-    model.reload_min = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: m.b_reload[battery, hour] >= -batteries[battery]['power']  )
+    hours = list(model.hours)
+    plants, demand_sources, wind_farms, pv_farms, batteries = split_units(units)
+    for unit_set, members in [ ( model.plants, plants ), ( model.demand_sources, demand_sources ), ( model.wind_farms, wind_farms ), ( model.pv_farms, pv_farms ), ( model.batteries, batteries ) ]:
+        for name in members:
+            unit_set.add(name)
+    set_unit_params(model, units)
 
-    # Do not load / reload in the same time
-    model.one_direction = gdp.Disjunction( model.batteries, model.hours, rule=lambda m, battery, hour: [ m.b_load[battery, hour] == 0, m.b_reload[battery, hour] == 0 ] )
-    pyo.TransformationFactory('gdp.hull').apply_to(model)
+    # Variables are created on first access of their index
+    for key, blocks in plant_rows(model, list(plants)).items():
+        set_rows(model.component(key), list(plants), hours, blocks)
+    set_cluster_rows(model, list(plants))
+    for key, blocks in battery_rows(model, list(batteries)).items():
+        set_rows(model.component(key), list(batteries), hours, blocks)
 
-    # Sum load and reload
-    model.b_sum = pyo.Constraint( model.batteries, model.hours, rule=lambda m, battery, hour: m.b_power[battery, hour] == m.b_load[battery, hour] + m.b_reload[battery, hour] )
+    add_battery_logic(model, list(batteries))
 
-    # ## Solve the model
-    if os.environ.get("MODE") == 'LOCAL':
-        solvername = 'cbc'
-        solver = pyo.SolverFactory(solvername, executable='cbc.exe')
-    elif os.environ.get("MODE") == 'PRODUCTION':
-        solvername = 'glpk'
-        solver = pyo.SolverFactory(solvername)
+
+def remove_units(model, units):
+    """ Delete sets members, parameters, variables and constraints of units from a built model. """
+
+    hours = list(model.hours)
+    plants, demand_sources, wind_farms, pv_farms, batteries = split_units(units)
+
+    def remove(components, names):
+        for component in components:
+            for name in names:
+                for hour in hours:
+                    if ( name, hour ) in component:
+                        del component[name, hour]
+
+    remove([ model.component(key) for key in [ *PLANT_VARS, *plant_rows(model, []), *CLUSTER_ROWS ] ], plants)
+    remove([ model.component(key) for key in [ *BATTERY_VARS, *battery_rows(model, []) ] ], batteries)
+    for name in plants:
+        del model.plant_power[name], model.plant_vc[name], model.plant_ramp[name], model.plant_count[name], model.plant_on_before[name]
+    for name in batteries:
+        del model.battery_logic[name], model.battery_power[name], model.battery_vc[name], model.battery_start[name]
+
+    for unit_set, members in [ ( model.plants, plants ), ( model.demand_sources, demand_sources ), ( model.wind_farms, wind_farms ), ( model.pv_farms, pv_farms ), ( model.batteries, batteries ) ]:
+        for name in members:
+            unit_set.remove(name)
+
+
+def update_model(model, units):
+    """ Bring a built model in line with edited units without rebuilding it.
+
+    Attribute edits only change mutable Params. Added and deleted units get only their own
+    components added or removed; then the objective and demand balance are rebuilt.
+    gdp transformations bake battery power into their constraints, so with hull or bigm
+    the logic block of a battery with edited power is built and transformed again.
+    """
+
+    def key(unit):
+        return [ unit[attribute] for attribute in MODEL_ATTRIBUTES ] + [ unit.get('count', 1) ]
+
+    old = model.units
+    removed = { name: unit for name, unit in old.items() if name not in units or units[name]['type'] != unit['type'] }
+    added = { name: unit for name, unit in units.items() if name not in old or name in removed }
+    changed = { name: unit for name, unit in units.items() if name not in added and key(unit) != key(old[name]) }
+
+    model.timings = {}
+    with PauseGC(), timed(model, 'update'):
+        if removed:
+            remove_units(model, removed)
+        if added:
+            add_units(model, added)
+        set_unit_params(model, changed)
+
+        # A plant whose machine count changed switches between binary and integer commitment
+        recounted = []
+        for name, unit in changed.items():
+            if unit['type'] in PLANT_TYPES and unit.get('count', 1) != old[name].get('count', 1):
+                recounted.append(name)
+                for hour in model.hours:
+                    model.on[name, hour].domain = commitment_domain(model, name, hour)
+                    for key in START_BOUNDS:
+                        model.component(key)[name, hour].bounds = start_bounds(key)(model, name, hour)
+        regrouped = [ name for name in recounted if ( units[name].get('count', 1) > 1 ) != ( old[name].get('count', 1) > 1 ) ]
+        if regrouped:
+            set_cluster_rows(model, regrouped)
+            model.solver = None
+            if unit['type'] == 'battery' and unit['power'] != old[name]['power']:
+                for hour in model.hours:
+                    model.b_volume[name, hour].bounds = volume_bounds(model, name, hour)
+
+        stale = [ name for name, unit in changed.items() if unit['type'] == 'battery' and unit['power'] != old[name]['power'] ]
+        if stale and model.formulation in GDP_TRANSFORMATIONS:
+            for name in stale:
+                del model.battery_logic[name]
+            add_battery_logic(model, stale)
+            model.solver = None
+
+        model.units = { name: dict(unit) for name, unit in units.items() }
+        set_net_demand(model)
+
+        structural = split_units({ **removed, **added })
+        if structural[0] or structural[4]:
+            couple_units(model)
+            # Persistent HiGHS loses track of rows after repeated adds and removes, it is loaded again
+            model.solver = None
+
+    return model
+
+
+def split_clusters(units, names, power, on=None):
+    """ Rows of clustered units split back into rows of their members; other rows are kept.
+
+    In each hour the first `on` members of a plant cluster run (all members of a battery
+    cluster), sharing its power in proportion to their own power.
+    """
+
+    rows, split = [], []
+    for i, name in enumerate(names):
+        members = units[name].get('members')
+        if not members:
+            rows.append(name)
+            split.append(power[i])
+            continue
+
+        capacity = np.array([ member['power'] for member in members.values() ], dtype=float)[:, None]
+        running = len(members) if on is None else np.round(on[i])
+        share = capacity * ( np.arange(len(members))[:, None] < running )
+        total = share.sum(axis=0)
+        rows += list(members)
+        split += list(power[i] * np.divide(share, total, out=np.zeros_like(share), where=total > 0))
+
+    return rows, np.array(split, dtype=float).reshape(len(rows), power.shape[1]).round(2)
+
+
+def schedule_fits(unit, power):
+    """ Whether a plant can run an hourly power schedule: between min and max power when running,
+    and ramping, starting and stopping by at most its ramp from one hour to the next.
+    """
+
+    running = power[power > 0]
+    if np.any(running < MIN_POWER * unit['power'] - SPLIT_TOLERANCE) or np.any(running > unit['power'] + SPLIT_TOLERANCE):
+        return False
+
+    return not np.any(np.abs(np.diff(power)) > unit['ramp'] + SPLIT_TOLERANCE)
+
+
+def unsplit_clusters(units, results):
+    """ Plant clusters some member of which can not run its row of the split results. """
+
+    rows = { name: row for name, row in zip(results['units'], results['power']) }
+
+    def fits(cluster):
+        return all( schedule_fits(member, rows[name]) for name, member in cluster['members'].items() )
+
+    return [ name for name, unit in units.items() if unit['type'] in PLANT_TYPES and unit.get('members') and not fits(unit) ]
+
+
+def extract_results(model):
+    """ Power of each unit in each hour of a solved model, as a units x hours matrix.
+
+    Rows are plants, batteries (positive when discharging), pv and wind farms; clustered
+    units are split back into their members. Values are read in bulk, one extract_values()
+    per variable.
+    """
+
+    hours = list(model.hours)
+    plants, batteries = list(model.plants), list(model.batteries)
+    _, _, wind_farms, pv_farms, _ = split_units(model.units)
+
+    def solved(var, names):
+        values = var.extract_values()
+        return np.array([ values[name, hour] for name in names for hour in hours ], dtype=float).reshape(len(names), len(hours)).round(2)
+
+    def generation(farms, key):
+        return np.array([ farm['power'] * np.asarray(unit_profile(model.profiles, name, key), dtype=float) for name, farm in farms.items() ]).reshape(len(farms), len(hours))
+
+    plants, plant_power = split_clusters(model.units, plants, solved(model.power, plants), solved(model.on, plants))
+    batteries, battery_power = split_clusters(model.units, batteries, -solved(model.b_power, batteries))
+
+    return {
+        'units': [ *plants, *batteries, *pv_farms, *wind_farms ],
+        'hours': hours,
+        'power': np.vstack([
+            plant_power,
+            battery_power,
+            generation(pv_farms, 'pv'),
+            generation(wind_farms, 'wind'),
+        ]),
+    }
+
+
+def solution_values(model):
+    """ Commitment and power of the plants of a solved model, with the plants' attributes. """
+
+    names, hours = list(model.plants), list(model.hours)
+    values = {}
+    for key in WARM_START_VARS:
+        solved = model.component(key).extract_values()
+        values[key] = { name: [ solved[name, hour] for hour in hours ] for name in names }
+
+    return { 'units': { name: dict(model.units[name]) for name in names }, **values }
+
+
+def repair_commitment(model, on):
+    """ Commitment (plants x hours, machines on) repaired hour by hour in merit order.
+
+    Commitment is first clipped to its bounds (see set_commitment_bounds). Where it cannot
+    cover net demand, the cheapest plants able to switch within an hour (min
+    power not above ramp) are turned on, all their machines; where its minimum output exceeds net demand and
+    battery charging, the most expensive are turned off. Hours still not covered are NaN.
+    """
+
+    names, hours = list(model.plants), list(model.hours)
+    bounds = [ np.array([ model.on_bounds[name][side] for name in names ]).reshape(len(names), len(hours)) for side in [ 0, 1 ] ]
+    on = np.clip(np.array(on, dtype=float), *bounds)
+
+    p_max = np.array([ pyo.value(model.plant_power[name]) for name in names ])
+    count = np.array([ pyo.value(model.plant_count[name]) for name in names ])
+    vc = np.array([ pyo.value(model.plant_vc[name]) for name in names ])
+    flexible = MIN_POWER * p_max <= np.array([ pyo.value(model.plant_ramp[name]) for name in names ])
+    merit = [ i for i in np.argsort(vc, kind='stable') if flexible[i] ]
+    demand = np.array([ pyo.value(model.net_demand[hour]) for hour in hours ])
+    charging = sum( pyo.value(model.battery_power[name]) for name in model.batteries )
+
+    for t in range(len(hours)):
+        # Plants running in the hour before first, so repairs do not add start-ups
+        for i in sorted(merit, key=lambda i: t == 0 or on[i, t - 1] == 0):
+            if on[:, t] @ p_max >= demand[t]:
+                break
+            on[i, t] = count[i]
+        for i in reversed(merit):
+            if MIN_POWER * ( on[:, t] @ p_max ) <= demand[t] + charging:
+                break
+            on[i, t] = 0
+
+    unresolved = ( on.T @ p_max < demand ) | ( MIN_POWER * ( on.T @ p_max ) > demand + charging )
+    on[:, unresolved] = np.nan
+
+    return on
+
+
+def warm_start(model, previous):
+    """ Set plant variables of a built model from a previous solution, as a MIP start.
+
+    Only plants with the same type, power and ramp as before are mapped; the others start
+    off. Commitment is then repaired in merit order (repair_commitment); hours still not
+    covered are left to the solver. Start-ups follow from the commitment, power is clipped
+    to its limits.
+    """
+
+    names, hours = list(model.plants), list(model.hours)
+
+    def matches(name):
+        old = previous['units'].get(name)
+        return old is not None and all( old[key] == model.units[name][key] for key in [ 'type', 'power', 'ramp' ] ) and len(previous['on'][name]) == len(hours)
+
+    on = np.full(( len(names), len(hours) ), np.nan)
+    power = np.full(( len(names), len(hours) ), np.nan)
+    for i, name in enumerate(names):
+        if matches(name):
+            on[i] = np.round(np.array(previous['on'][name], dtype=float))
+            power[i] = np.array(previous['power'][name], dtype=float)
+
+    on = repair_commitment(model, np.nan_to_num(on))
+    p_max = np.array([ pyo.value(model.plant_power[name]) for name in names ])[:, None]
+    count = np.array([ pyo.value(model.plant_count[name]) for name in names ])[:, None]
+
+    on_before = np.array([ pyo.value(model.plant_on_before[name]) for name in names ])[:, None]
+    start = np.diff(np.hstack([ on_before, on ]), axis=1)
+    power = np.where(on == 0, 0, np.clip(power, MIN_POWER * p_max * on, p_max * on))
+    power = np.where(np.isnan(on), np.nan, power)
+    # Deviation of the running machines; idle ones are fully below optimal power
+    deviation = power - OPT_POWER * p_max * on
+
+    values = {
+        'on': on,
+        'start': start,
+        'start_p': np.maximum(start, 0),
+        'start_n': np.minimum(start, 0),
+        'power': power,
+        'power_p': np.maximum(deviation, 0),
+        'power_n': np.minimum(deviation, 0) - OPT_POWER * p_max * ( count - on ),
+    }
+    for key, grid in values.items():
+        var = model.component(key)
+        for name, row in zip(names, grid.tolist()):
+            for hour, value in zip(hours, row):
+                var[name, hour].set_value(None if math.isnan(value) else value, skip_validation=True)
+
+
+def solver_backend(backend=None):
+    """ Backend given, else SOLVER_BACKEND env var, else the solver of MODE (LOCAL: cbc, PRODUCTION: glpk). """
+
+    backend = backend or os.environ.get('SOLVER_BACKEND')
+    if backend is None:
+        if os.environ.get("MODE") == 'LOCAL':
+            backend = 'cbc'
+        elif os.environ.get("MODE") == 'PRODUCTION':
+            backend = 'glpk'
+        else:
+            raise Exception('MODE in env vars was not supplied.')
+
+    if backend not in SOLVER_BACKENDS:
+        raise ValueError(f'Unknown solver backend: {backend}. Use one of {SOLVER_BACKENDS}.')
+
+    return backend
+
+
+def solve_limits(time_limit=None, mip_gap=None):
+    """ Time limit in seconds and relative MIP gap of a solve; SOLVE_TIME_LIMIT and SOLVE_MIP_GAP env vars by default.
+
+    None means no limit and DEFAULT_MIP_GAP respectively.
+    """
+
+    if time_limit is None and os.environ.get('SOLVE_TIME_LIMIT'):
+        time_limit = float(os.environ['SOLVE_TIME_LIMIT'])
+    if mip_gap is None and os.environ.get('SOLVE_MIP_GAP'):
+        mip_gap = float(os.environ['SOLVE_MIP_GAP'])
+
+    return { 'time_limit': time_limit, 'mip_gap': mip_gap }
+
+
+def relative_gap(incumbent, bound):
+    """ Relative distance of the incumbent objective to the best bound, None if either is unknown. """
+
+    if incumbent is None or bound is None or not math.isfinite(incumbent) or not math.isfinite(bound):
+        return None
+
+    return abs(incumbent - bound) / max(abs(incumbent), 1e-10)
+
+
+def solve_shell(model, backend, warmstart=False, limits=None):
+    """ Solve with GLPK or CBC: problem file written, solver subprocess started, solution file read.
+
+    A solve stopped by the time limit keeps its incumbent, if the solver found one.
+    """
+
+    if backend == 'cbc' and os.environ.get("MODE") == 'LOCAL':
+        solver = pyo.SolverFactory(backend, executable='cbc.exe')
     else:
-        raise Exception('MODE in env vars was not supplied.')
+        solver = pyo.SolverFactory(backend)
+
+    # Current variable values as the starting solution, for solvers accepting one (CBC)
+    options = {}
+    if warmstart and getattr(solver, 'warm_start_capable', lambda: False)():
+        options['warmstart'] = True
+
+    limits = limits or {}
+    names = SHELL_LIMIT_OPTIONS[backend]
+    if limits.get('time_limit') is not None:
+        options.setdefault('options', {})[names['time_limit']] = math.ceil(limits['time_limit'])
+    if limits.get('mip_gap') is not None:
+        options.setdefault('options', {})[names['mip_gap']] = limits['mip_gap']
+
+    time_solver_phases(model, solver)
+    with timed(model, 'solve'):
+        results = solver.solve(model, load_solutions=False, **options) ## .write()
+
+    condition = results.solver.termination_condition
+    found = len(results.solution) > 0
+    if condition in [pyo.TerminationCondition.optimal, pyo.TerminationCondition.feasible, pyo.TerminationCondition.maxTimeLimit] and found:
+        model.solutions.load_from(results)
+        model.termination = 'optimal' if condition == pyo.TerminationCondition.optimal else 'time limit'
+        model.gap = relative_gap(results.problem.upper_bound, results.problem.lower_bound)
+        # CBC reports branch and bound nodes, GLPK does not
+        nodes = results.solver.statistics.branch_and_bound.number_of_created_subproblems
+        model.nodes = nodes if isinstance(nodes, int) else None
+        if model.gap is None and model.termination == 'optimal':
+            model.gap = limits.get('mip_gap') or 0
+        return True, f'Solver status: {results.solver.status}. Solver termination condition: {condition}'
+    if condition == pyo.TerminationCondition.infeasible:
+        return False, 'Model is infeasible'
+    if condition == pyo.TerminationCondition.maxTimeLimit:
+        return False, 'No solution found within the time limit'
+
+    return False, f'Unhandled error. Solver Status: {results.solver.status}'
+
+
+@contextmanager
+def updates_paused(solver):
+    """ Persistent solver does not look for model changes while solving; it was just updated. """
+
+    config = solver.update_config
+    saved = { key: config[key] for key in config }
+    for key in saved:
+        config[key] = False
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            config[key] = value
+
+
+@contextmanager
+def incumbents_reported(model, on_incumbent):
+    """ Call on_incumbent with objective, bound, gap and seconds of each improving solution HiGHS finds. """
+
+    if on_incumbent is None:
+        yield
+        return
+
+    def report(event):
+        data = event.data_out
+        on_incumbent({
+            'objective': data.mip_primal_bound,
+            'bound': data.mip_dual_bound,
+            'gap': relative_gap(data.mip_primal_bound, data.mip_dual_bound),
+            'elapsed': data.running_time,
+        })
+
+    event = model.solver._solver_model.cbMipImprovingSolution
+    event.subscribe(report)
+    try:
+        yield
+    finally:
+        event.unsubscribe(report)
+
 
-    results = solver.solve(model) ## .write()
+def set_mip_start(model):
+    """ Integer values set on the model as a partial MIP start of persistent HiGHS.
 
-    # ## Optimalization results 
-    if (results.solver.status == pyo.SolverStatus.ok) and (results.solver.termination_condition in [pyo.TerminationCondition.optimal, pyo.TerminationCondition.feasible]):
+    HiGHS completes it: integers without a value are found by a sub-MIP, continuous
+    variables by an LP. appsi has no MIP start in Pyomo 6.6, so it goes to highspy directly.
+    """
+
+    columns = model.solver._pyomo_var_to_solver_var_map
+    start = [ ( columns[id(var)], var.value ) for var in model.component_data_objects(pyo.Var, active=True) if var.is_integer() and var.value is not None ]
+    if start:
+        index, value = zip(*start)
+        model.solver._solver_model.setSolution(len(index), np.array(index, dtype=np.int32), np.round(value))
+
+
+def solve_persistent(model, warmstart=False, limits=None, on_incumbent=None):
+    """ Solve with in-process HiGHS, no files and no subprocess.
+
+    The solver is kept on the model: solving the same model again only sends what changed
+    since the last solve (Params, bounds, added or removed components) to HiGHS. A solve
+    stopped by the time limit keeps its incumbent, if HiGHS found one.
+    """
+
+    from pyomo.contrib.appsi.base import TerminationCondition
+    from pyomo.contrib.appsi.solvers import Highs
+
+    limits = limits or {}
+    with timed(model, 'solve'):
+        if getattr(model, 'solver', None) is None:
+            model.solver = Highs()
+            model.solver.config.load_solution = False
+            model.solver.set_instance(model)
+        else:
+            model.solver.update()
+
+        # Always set, as HiGHS keeps options of the previous solve
+        model.solver.config.time_limit = limits.get('time_limit') or math.inf
+        model.solver.config.mip_gap = DEFAULT_MIP_GAP if limits.get('mip_gap') is None else limits['mip_gap']
+
+        # Changes go to HiGHS before the MIP start, as they would discard it
+        if warmstart:
+            set_mip_start(model)
+        with updates_paused(model.solver), incumbents_reported(model, on_incumbent):
+            results = model.solver.solve(model)
+
+    condition = results.termination_condition
+    stopped = [ TerminationCondition.maxTimeLimit, TerminationCondition.maxIterations, TerminationCondition.objectiveLimit ]
+    if condition == TerminationCondition.optimal or ( condition in stopped and results.best_feasible_objective is not None ):
+        results.solution_loader.load_vars()
+        model.termination = 'optimal' if condition == TerminationCondition.optimal else 'time limit'
+        model.gap = relative_gap(results.best_feasible_objective, results.best_objective_bound)
+        model.nodes = model.solver._solver_model.getInfo().mip_node_count
+        return True, f'Solver termination condition: {condition}'
+    if condition in [ TerminationCondition.infeasible, TerminationCondition.infeasibleOrUnbounded ]:
+        return False, 'Model is infeasible'
+    if condition in stopped:
+        return False, 'No solution found within the time limit'
+
+    return False, f'Unhandled error. Solver termination condition: {condition}'
+
+
+def solve_model(model, dev=False, warmstart=False, backend=None, limits=None, on_incumbent=None):
+    """ Solve within the time limit and MIP gap of limits, env var defaults for those not given.
+
+    on_incumbent is called with each improving solution found (HiGHS only). Returns the model
+    with results, stats, termination ('optimal' or 'time limit') and gap, or False if no
+    solution was found. A solution of clusters some member can not run its share of is not
+    one either: those clusters are listed in model.unsplit, see solve_clustered.
+    """
+
+    limits = solve_limits(**( limits or {} ))
+    model.termination, model.gap, model.nodes, model.unsplit = None, None, None, []
+
+    # ## Solve the model
+    backend = solver_backend(backend)
+    if backend == 'highs':
+        solved, message = solve_persistent(model, warmstart, limits, on_incumbent)
+    else:
+        solved, message = solve_shell(model, backend, warmstart, limits)
+
+    # ## Optimalization results
+    if solved:
 
         if dev:
             # Solver status
-            print(f'Solver status: {results.solver.status}. Solver termination condition: {results.solver.termination_condition}')
-            
+            print(message)
+
             # Cost of the system
             print(f'Cost of the system: {round(pyo.value(model.system_costs), 0)}')
+            if model.gap is not None:
+                print(f'Relative MIP gap: {model.gap:.4%}')
 
             # Draw plots
             # draw_units(model, plants, batteries, MIN_POWER, OPT_POWER, BATTERY_LOAD_TIME)
-            
+
             # Check variance
             # variance_units(model, plants, OPT_POWER)
 
         # Summarize results
-        model.results = {}
-        for unit in model.plants:
-            model.results[unit] = {}
-            for hour in model.hours:
-                power = round(pyo.value(model.power[unit, hour]), 2)
-                model.results[unit][hour] = power
-        for unit in model.batteries:
-            model.results[unit] = {}
-            for hour in model.hours:
-                power = round(pyo.value(model.b_power[unit, hour]), 2)
-                model.results[unit][hour] = -power
-        for unit in model.pv_farms:
-            model.results[unit] = {}
-            for hour in model.hours:
-                power = pv_farms[unit]['power'] * pv_profile[hour]
-                model.results[unit][hour] = power
-        for unit in model.wind_farms:
-            model.results[unit] = {}
-            for hour in model.hours:
-                power = wind_farms[unit]['power'] * wind_profile[hour]
-                model.results[unit][hour] = power
-        
-        return model
+        with timed(model, 'results'):
+            results = extract_results(model)
+            model.unsplit = unsplit_clusters(model.units, results)
+        if model.unsplit:
+            if dev:
+                print(f'Members of {model.unsplit} can not run the schedule of their cluster')
+            return False
+        model.results = results
 
+        model.stats = model_stats(model)
 
-    elif (results.solver.termination_condition == pyo.TerminationCondition.infeasible):
-        if dev:
-            print('Model is infeasible') 
-        return False
+        return model
 
     else:
         if dev:
-            print('Unhandled error. Solver Status: ',  results.solver.status)
+            print(message)
         return False
 
 
+def solve_clustered(model, units, dev=False, warmstart=False, limits=None, on_incumbent=None):
+    """ solve_model for a model of clustered units; units are those before clustering.
+
+    Clusters relax their members: a cluster's schedule may not split into ones its members
+    can run (min power, max power and ramp of each). Such clusters are replaced by their
+    members and the model is solved again, starting from the solution before, until the
+    results hold. Returns the solved model or False, as solve_model.
+    """
+
+    from clustering import expand_clusters
+
+    while True:
+        solved = solve_model(model, dev, warmstart, limits=limits, on_incumbent=on_incumbent)
+        if solved or not model.unsplit:
+            return solved
+
+        previous = solution_values(model)
+        update_model(model, expand_clusters(model.units, units, model.unsplit))
+        warm_start(model, previous)
+        warmstart = True
+
+
+def uc_model(units, dev=False, profiles=None, formulation=None, previous=None, time_limit=None, mip_gap=None, tolerance=None):
+    """ Build and solve; previous is solution_values() of an earlier solve, used as MIP start.
+
+    With a tolerance (or CLUSTER_TOLERANCE), similar units are solved as clusters, see clustering.
+    """
+
+    load_dotenv()
+
+    from clustering import cluster_tolerance, cluster_units
+    tolerance = cluster_tolerance(tolerance)
+    clustered = units if tolerance is None else cluster_units(units, tolerance)
+
+    model = build_model(clustered, profiles, formulation)
+    if previous is not None:
+        warm_start(model, previous)
+
+    return solve_clustered(model, units, dev, warmstart=previous is not None, limits={ 'time_limit': time_limit, 'mip_gap': mip_gap })
+
+
 if __name__ == '__main__':
     uc_model(input.units, dev=True)
\ No newline at end of file
@@ -0,0 +1,108 @@
+import copy
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import input
+
+
+class StaleSession(Exception):
+    """ The session of a browser was dropped or is unknown, or the browser holds an older version of its units. """
+
+
+class UnitStore:
+    """ Units of each browser session, kept on the server; the browser only holds the session key and version.
+
+    Sessions are opened on page load from input.units, least recently used are dropped first.
+    Every edit counts the version of the session up; a version given with a call has to be the
+    stored one, and a dropped session is not started again, both raise StaleSession, so a tab
+    never edits or solves units other than the ones it shows.
+    """
+
+    def __init__(self, max_sessions=256):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open(self):
+        """ Key of a new session with the units of input.units at version 0. """
+
+        session = str(uuid.uuid4())
+        with self._lock:
+            self._sessions[session] = { 'version': 0, 'units': copy.deepcopy(input.units) }
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+        return session
+
+    def _session(self, session, version=None):
+
+        entry = self._sessions.get(session)
+        if entry is None:
+            raise StaleSession(f'Unknown session {session}.')
+        if version is not None and version != entry['version']:
+            raise StaleSession(f'Session {session} is at version {entry["version"]}, not {version}.')
+        self._sessions.move_to_end(session)
+
+        return entry
+
+    def units(self, session, version=None):
+        """ Units of the session; edits replace unit dicts, so the copy is not changed by later edits. """
+
+        with self._lock:
+            return dict(self._session(session, version)['units'])
+
+    def version(self, session):
+
+        with self._lock:
+            return self._session(session)['version']
+
+    def put(self, session, name, unit, version=None):
+        """ Add or replace a unit; returns the new version. """
+
+        with self._lock:
+            entry = self._session(session, version)
+            entry['units'][name] = dict(unit)
+            entry['version'] += 1
+            return entry['version']
+
+    def delete(self, session, name, version=None):
+        """ Remove a unit; returns the new version. """
+
+        with self._lock:
+            entry = self._session(session, version)
+            entry['units'].pop(name, None)
+            entry['version'] += 1
+            return entry['version']
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def unit_store():
+    """ Process wide store, UNIT_STORE_SESSIONS caps the sessions kept.
+
+    With SOLVE_SERVER set (multi-process serving), the store of the solve server instead, so
+    all web processes see the same units.
+    """
+
+    global _store
+    with _store_lock:
+        if _store is None:
+            load_dotenv()
+            if os.environ.get('SOLVE_SERVER'):
+                from solve_server import solve_server
+                _store = solve_server().unit_store()
+            else:
+                _store = local_unit_store()
+
+    return _store
+
+
+def local_unit_store():
+
+    return UnitStore(max_sessions=int(os.environ.get('UNIT_STORE_SESSIONS', 256)))